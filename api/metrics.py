@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Response
+
+from core.cache import response_cache
+from core.config import settings
+from core.near_cache import near_cache
+from core.jobs import job_queue
+from core.metrics import metrics
+from core.singleflight import singleflight
+from middleware.admission import admission
+from providers.registry import registry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+router = APIRouter()
+
+
+def _component_metrics():
+    """Expose statistics that components already keep, read at scrape time"""
+    backends = [backend for model in registry.info() for backend in registry.backends(model)]
+    yield ("uniai_circuit_state", "gauge", "Circuit breaker state per backend (0 closed, 1 half-open, 2 open)",
+           [({"model": b.model, "backend": b.name}, CIRCUIT_STATES[b.breaker.state]) for b in backends])
+    yield ("uniai_backend_latency_ewma_seconds", "gauge", "Routing latency estimate per backend",
+           [({"model": b.model, "backend": b.name}, b.latency_ewma) for b in backends if b.latency_ewma is not None])
+
+    hedging = registry.hedge_info()
+    yield ("uniai_hedge_requests_total", "counter", "Requests eligible for hedging",
+           [({"policy": key}, info["requests"]) for key, info in hedging.items()])
+    yield ("uniai_hedges_total", "counter", "Hedged duplicate calls sent",
+           [({"policy": key}, info["hedged"]) for key, info in hedging.items()])
+    yield ("uniai_hedge_wins_total", "counter", "Hedged calls that finished first",
+           [({"policy": key}, info["hedge_wins"]) for key, info in hedging.items()])
+
+    flights = singleflight.info()
+    yield ("uniai_single_flight_total", "counter", "Single-flight calls by role",
+           [({"role": "leader"}, flights["leaders"]), ({"role": "coalesced"}, flights["coalesced"]),
+            ({"role": "peer_wait"}, flights["peer_waits"]), ({"role": "peer_hit"}, flights["peer_hits"])])
+
+    info = admission.info()
+    yield ("uniai_admission_total", "counter", "Admission decisions",
+           [({"outcome": key}, info[key]) for key in ("admitted", "rate_limited", "queue_full", "queue_timeout")])
+    yield ("uniai_admission_active", "gauge", "Requests holding a concurrency slot", [({}, info["active"])])
+    yield ("uniai_admission_queued", "gauge", "Requests waiting for a concurrency slot", [({}, info["queued"])])
+
+    if settings.jobs_enabled:
+        jobs = job_queue.info()
+        yield ("uniai_jobs", "gauge", "Background jobs by status",
+               [({"status": status}, count) for status, count in jobs["jobs"].items()])
+        yield ("uniai_job_webhooks_total", "counter", "Webhook deliveries by outcome",
+               [({"outcome": "delivered"}, jobs["webhooks_delivered"]), ({"outcome": "failed"}, jobs["webhooks_failed"])])
+
+    if response_cache is not None:
+        cache = response_cache.info()
+        yield ("uniai_response_cache_entries", "gauge", "Entries in the in-memory response cache",
+               [({}, cache["entries"])])
+        yield ("uniai_response_cache_bytes", "gauge", "Bytes held by the in-memory response cache",
+               [({}, cache["bytes"])])
+
+    if near_cache is not None:
+        near = near_cache.info()
+        yield ("uniai_near_cache_lookups_total", "counter", "Near-duplicate cache lookups by outcome",
+               [({"outcome": key}, near[key]) for key in ("hits", "exact_hits", "misses")])
+        yield ("uniai_near_cache_entries", "gauge", "Entries in the near-duplicate cache", [({}, near["entries"])])
+        yield ("uniai_near_cache_bytes", "gauge", "Bytes held by the near-duplicate cache", [({}, near["bytes"])])
+
+
+metrics.add_collector(_component_metrics)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text exposition of all UniAI metrics"""
+    if settings.jobs_enabled:
+        # Collectors run synchronously; the job store is read off the event loop beforehand
+        await job_queue.refresh_counts()
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,55 @@
+"""Route class that times response serialization"""
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from fastapi.routing import APIRoute
+
+from core.metrics import STAGE_SECONDS, current_route
+
+_endpoint_returned: ContextVar[Optional[List[float]]] = ContextVar("endpoint_returned", default=None)
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that records the "serialize" stage
+
+    FastAPI validates and encodes the endpoint's return value after the
+    endpoint itself has returned; the time from that return to the finished
+    Response object is recorded. Only async endpoints are wrapped, so sync
+    ones keep running in the threadpool.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = self._mark_return(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    @staticmethod
+    def _mark_return(endpoint: Callable) -> Callable:
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            result = await endpoint(*args, **kwargs)
+            marker = _endpoint_returned.get()
+            if marker is not None:
+                marker.append(time.perf_counter())
+            return result
+
+        return wrapper
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            marker: List[float] = []
+            token = _endpoint_returned.set(marker)
+            try:
+                response = await handler(request)
+            finally:
+                _endpoint_returned.reset(token)
+            if marker:
+                STAGE_SECONDS.labels(current_route.get(), "serialize").observe(time.perf_counter() - marker[0])
+            return response
+
+        return timed_handler
@@ -0,0 +1,112 @@
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from api.routing import TimedRoute
+from core.cache import response_cache
+from core.config import settings
+from core.exceptions import ConfigReloadException, TraceNotFoundException
+from core.jobs import job_queue
+from core.near_cache import near_cache
+from core.profiler import profiler
+from core.sessions import session_store
+from core.shared import shared_state
+from core.singleflight import singleflight
+from core.tracing import trace_store
+from middleware.admission import admission
+from providers.registry import registry
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    """Guard admin endpoints with ADMIN_TOKEN: closed until it is configured"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN is not configured")
+    if not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(
+    prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)], route_class=TimedRoute
+)
+
+
+@router.get(
+    "/stats",
+    summary="Runtime Statistics",
+    description="Response cache, near-duplicate cache, request coalescing, backend routing (with circuit breaker state), hedging, retry, admission control, background job, chat session, tracing and shared worker state statistics. "
+                "Apart from shared_state, figures are for the worker that answers.",
+)
+async def stats():
+    if settings.jobs_enabled:
+        await job_queue.refresh_counts()
+    return {
+        "response_cache": response_cache.info() if response_cache is not None else None,
+        "near_cache": near_cache.info() if near_cache is not None else None,
+        "single_flight": singleflight.info(),
+        "routing": registry.info(),
+        "hedging": registry.hedge_info(),
+        "retries": registry.retry_info(),
+        "admission": admission.info(),
+        "jobs": job_queue.info() if settings.jobs_enabled else None,
+        "sessions": session_store.info() if session_store is not None else None,
+        "tracing": {**trace_store.info(), "profiler": profiler.info() if profiler is not None else None},
+        "shared_state": shared_state.info() if shared_state is not None else None,
+    }
+
+
+@router.get(
+    "/config",
+    summary="Scene Configuration",
+    description="Version, source and contents of the active scene prompt / supported model snapshot.",
+)
+async def config():
+    return settings.scenes.info()
+
+
+@router.post(
+    "/config/reload",
+    summary="Reload Scene Configuration",
+    description="Re-read CONFIG_FILE, validate and compile it, and atomically swap it in for this worker. "
+                "An invalid config is rejected and the current one stays active.",
+)
+async def reload_config():
+    try:
+        return settings.reload_scenes().info()
+    except ValueError as e:
+        raise ConfigReloadException(str(e))
+
+
+@router.get(
+    "/traces",
+    summary="Recent Traces",
+    description="Most recent traces kept by this worker: requests slower than TRACE_SLOW_MS and those sent "
+                "with an X-UniAI-Profile header.",
+)
+async def traces(limit: int = Query(default=50, ge=1, le=1000)):
+    return {"traces": trace_store.recent(limit), **trace_store.info()}
+
+
+@router.get(
+    "/traces/{request_id}",
+    summary="Trace Detail",
+    description="Timing spans of a kept trace and, with PROFILER_ENABLED, its sampled stacks.",
+)
+async def trace(request_id: str):
+    kept = trace_store.get(request_id)
+    if kept is None:
+        raise TraceNotFoundException(request_id)
+    return kept.to_dict()
+
+
+@router.get(
+    "/traces/{request_id}/profile",
+    summary="Trace Profile",
+    description="Sampled stacks of a kept trace in folded format, for flamegraph.pl or speedscope.",
+    response_class=PlainTextResponse,
+)
+async def trace_profile(request_id: str):
+    kept = trace_store.get(request_id)
+    if kept is None or not kept.stacks:
+        raise TraceNotFoundException(request_id)
+    return PlainTextResponse(kept.folded())
@@ -1,8 +1,11 @@
-from fastapi import APIRouter
-from models import ChatRequest, ChatResponse
-from services import ChatService
+from fastapi import APIRouter, Header, Response
+from fastapi.responses import StreamingResponse
+from api.routing import TimedRoute
+from core.cache import cache_status, is_cache_allowed
+from models import BatchChatRequest, BatchChatResponse, ChatRequest, ChatResponse, SessionInfo
+from services import ChatService, SessionService
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.post(
@@ -11,7 +14,70 @@ router = APIRouter()
     summary="Chat Completion",
     description="Get chat completions from a specified model.",
     response_model=ChatResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
 )
-def chat_completions(request: ChatRequest):
-    """Chat completion endpoint"""
-    return ChatService.process_chat_request(request)
+async def chat_completions(
+        request: ChatRequest,
+        response: Response,
+        cache_control: str = Header(default=""),
+):
+    """Chat completion endpoint
+
+    With ``stream: true`` the completion is returned as Server-Sent Events.
+    Non-streaming responses report the response cache outcome in ``X-Cache``.
+    With ``session_id``, earlier turns of that conversation are sent along
+    and the new turn is added to it; ``"new"`` starts a conversation whose
+    server-issued id is returned in ``session_id`` and ``X-Session-Id``.
+    """
+    if request.stream:
+        ChatService.check_model(request)
+        request = await SessionService.aopen(ChatService.fit_context(request))
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        if request.session_id:
+            headers["X-Session-Id"] = request.session_id
+        return StreamingResponse(
+            ChatService.astream_chat_request(request),
+            media_type="text/event-stream",
+            headers=headers,
+        )
+    result = await ChatService.aprocess_chat_request(request, use_cache=is_cache_allowed(cache_control))
+    response.headers["X-Cache"] = cache_status.get() or "BYPASS"
+    if result.session_id:
+        response.headers["X-Session-Id"] = result.session_id
+    return result
+
+
+@router.post(
+    "/chat/completions/batch",
+    tags=["Chat"],
+    summary="Batch Chat Completion",
+    description="Run a list of chat requests concurrently and return per-item results in order.",
+    response_model=BatchChatResponse,
+)
+async def chat_completions_batch(request: BatchChatRequest, cache_control: str = Header(default="")):
+    """Batch chat completion endpoint (streaming is not supported per item)"""
+    return await ChatService.aprocess_batch_request(request, use_cache=is_cache_allowed(cache_control))
+
+
+@router.get(
+    "/chat/sessions/{session_id}",
+    tags=["Chat"],
+    summary="Chat Session",
+    description="Turns the next request of a session will include, and its rolling summary. "
+                "Takes the server-issued session id and the X-User-Id of the user it belongs to.",
+    response_model=SessionInfo,
+)
+async def get_chat_session(session_id: str, x_user_id: str = Header()) -> SessionInfo:
+    return await SessionService.get_info(session_id, x_user_id)
+
+
+@router.delete(
+    "/chat/sessions/{session_id}",
+    tags=["Chat"],
+    summary="Delete Chat Session",
+    description="Forget a session of the user named in X-User-Id; its next request starts a new conversation.",
+    status_code=204,
+)
+async def delete_chat_session(session_id: str, x_user_id: str = Header()):
+    await SessionService.delete(session_id, x_user_id)
+    return Response(status_code=204)
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Response
+
+from api.routing import TimedRoute
+from core.exceptions import JobNotFoundException
+from core.jobs import FAILED, SUCCEEDED, check_callback_url, job_queue, public_view
+from models.schedule import ScheduleJobRequest, ScheduleJobResponse
+from services.schedule_service import ScheduleService
+
+router = APIRouter(route_class=TimedRoute)
+
+job_queue.register("schedule", ScheduleService.arun_schedule_job)
+
+
+def _job_response(job, response: Response) -> ScheduleJobResponse:
+    if job["status"] not in (SUCCEEDED, FAILED):
+        response.headers["Retry-After"] = "1"
+    return ScheduleJobResponse(**public_view(job))
+
+
+@router.post(
+    "/schedule/jobs",
+    tags=["Schedule"],
+    summary="Submit Schedule Planning Job",
+    description="Queue schedule planning in the background and return a job id right away. "
+                "Poll GET /schedule/jobs/{job_id} or pass callback_url to receive the finished job by webhook. "
+                "callback_url must be a public http(s) address (422 otherwise). "
+                "Submitting the same request_id again returns the existing job.",
+    status_code=202,
+    response_model=ScheduleJobResponse,
+)
+async def submit_schedule_job(request: ScheduleJobRequest, response: Response) -> ScheduleJobResponse:
+    if request.callback_url is not None:
+        await check_callback_url(request.callback_url)
+    job, created = await job_queue.submit(
+        "schedule",
+        request.request_id,
+        request.model_dump(exclude={"callback_url"}),
+        request.callback_url,
+    )
+    if not created:
+        response.status_code = 200
+    response.headers["Location"] = f"/api/v1/schedule/jobs/{job['id']}"
+    return _job_response(job, response)
+
+
+@router.get(
+    "/schedule/jobs/{job_id}",
+    tags=["Schedule"],
+    summary="Schedule Planning Job Status",
+    description="Status of a background job; includes the ScheduleResponse once it has succeeded.",
+    response_model=ScheduleJobResponse,
+)
+async def get_schedule_job(job_id: str, response: Response) -> ScheduleJobResponse:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise JobNotFoundException(job_id)
+    return _job_response(job, response)
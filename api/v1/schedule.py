@@ -1,8 +1,12 @@
-from fastapi import APIRouter
-from models.schedule import ScheduleRequest, ScheduleResponse
+from fastapi import APIRouter, Header, Response
+from fastapi.responses import StreamingResponse
+from api.routing import TimedRoute
+from core.cache import cache_status, is_cache_allowed
+from models.schedule import ScheduleReplanRequest, ScheduleReplanResponse, ScheduleRequest, ScheduleResponse
 from services.schedule_service import ScheduleService
+from utils.streaming import format_ndjson, format_sse
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.post(
@@ -12,5 +16,54 @@ router = APIRouter()
     description="Generate optimized schedule based on user's text prompt.",
     response_model=ScheduleResponse,
 )
-def schedule_planning(request: ScheduleRequest) -> ScheduleResponse:
-    return ScheduleService.process_schedule_request(request)
\ No newline at end of file
+async def schedule_planning(
+        request: ScheduleRequest,
+        response: Response,
+        cache_control: str = Header(default=""),
+) -> ScheduleResponse:
+    result = await ScheduleService.aprocess_schedule_request(request, use_cache=is_cache_allowed(cache_control))
+    response.headers["X-Cache"] = cache_status.get() or "BYPASS"
+    return result
+
+
+@router.post(
+    "/schedule/replan",
+    tags=["Schedule"],
+    summary="Incremental Re-planning",
+    description="Apply a change description to an existing schedule and return only the added, "
+                "removed and modified events. Events that are not affected keep their time slots.",
+    response_model=ScheduleReplanResponse,
+)
+async def schedule_replanning(
+        request: ScheduleReplanRequest,
+        response: Response,
+        cache_control: str = Header(default=""),
+) -> ScheduleReplanResponse:
+    result = await ScheduleService.areplan_schedule_request(request, use_cache=is_cache_allowed(cache_control))
+    response.headers["X-Cache"] = cache_status.get() or "BYPASS"
+    return result
+
+
+@router.post(
+    "/schedule/plan/stream",
+    tags=["Schedule"],
+    summary="Streaming Schedule Planning",
+    description="Stream each event as soon as the model has produced it. "
+                "Returns NDJSON by default, or Server-Sent Events when the client accepts text/event-stream.",
+    responses={200: {"content": {"application/x-ndjson": {}, "text/event-stream": {}}}},
+)
+async def schedule_planning_stream(request: ScheduleRequest, accept: str = Header(default="")):
+    use_sse = "text/event-stream" in accept
+
+    async def body():
+        async for record in ScheduleService.astream_schedule_request(request):
+            if use_sse:
+                yield format_sse(record, event=record["type"])
+            else:
+                yield format_ndjson(record)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
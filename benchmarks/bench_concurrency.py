@@ -0,0 +1,70 @@
+"""Concurrency benchmark: threadpool (sync) path vs. fully async path.
+
+Every upstream call takes a fixed ``--latency`` seconds, so the achieved
+concurrency is ``requests * latency / wall_time``. The sync path runs on the
+same anyio threadpool FastAPI uses for ``def`` handlers and therefore tops out
+around its 40 tokens; the async path is bounded only by the connection pool.
+
+    python -m benchmarks.bench_concurrency --requests 1000 --latency 1
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from anyio.to_thread import run_sync
+
+from providers.stub_server import start_in_process
+
+
+async def _run(mode: str, total: int) -> float:
+    from models import ChatRequest
+    from services import ChatService
+
+    request = ChatRequest(
+        model="deepseek-chat",
+        parameters={"prompt": "hello"},
+        user_info={"user_id": "bench", "user_role": "user"},
+        request_id="bench",
+    )
+
+    if mode == "sync":
+        async def call():
+            return await run_sync(ChatService.process_chat_request, request)
+    else:
+        async def call():
+            return await ChatService.aprocess_chat_request(request)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(total)))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    os.environ["DEEPSEEK_API_BASE"] = start_in_process(args.latency)
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    os.environ.setdefault("SUPPORTED_MODELS", '["deepseek-chat"]')
+    os.environ["HTTP_MAX_CONNECTIONS"] = str(max(args.requests, 1))
+
+    asyncio.run(_report(args))
+
+
+async def _report(args):
+    from providers.registry import registry
+
+    print(f"{'mode':<6} {'requests':>8} {'wall(s)':>8} {'req/s':>8} {'concurrency':>11}")
+    for mode in args.modes.split(","):
+        wall = await _run(mode, args.requests)
+        concurrency = args.requests * args.latency / wall
+        print(f"{mode:<6} {args.requests:>8} {wall:>8.2f} {args.requests / wall:>8.1f} {concurrency:>11.1f}")
+    await registry.aclose()
+
+
+if __name__ == "__main__":
+    main()
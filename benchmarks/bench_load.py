@@ -0,0 +1,223 @@
+"""Load benchmark: throughput, latency percentiles and memory per request.
+
+Drives the full ASGI app (middleware, validation, routing, services) in this
+process against the stub upstream, with a closed loop of N concurrent
+clients per level. Prompts are unique so every request reaches the
+upstream. Memory is the traced Python heap growth of one wave of N
+concurrent requests divided by N, measured after the timed run.
+
+    python -m benchmarks.bench_load --concurrency 1,16,64,256 --requests 2000
+    python -m benchmarks.bench_load --latency lognormal:0.8,0.5 --error-rate 0.02
+    python -m benchmarks.bench_load --json baseline.json
+    python -m benchmarks.bench_load --baseline baseline.json --tolerance 0.15
+
+``--upstream server`` runs the stub in a separate process over HTTP instead
+of in-process, which adds real connection handling to the numbers.
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+from providers.stub_server import StubBehavior, start_in_process
+
+_ids = itertools.count()
+
+
+def _chat_body(stream: bool):
+    def body(i: int) -> dict:
+        return {
+            "model": "deepseek-chat",
+            "parameters": {"prompt": f"Summarise request {i} in one sentence"},
+            "user_info": {"user_id": f"bench-{i % 100}", "user_role": "user"},
+            "request_id": f"bench-{i}",
+            "stream": stream,
+        }
+
+    return body
+
+
+def _schedule_body(i: int) -> dict:
+    return {"prompt": f"明天复习算法2小时，健身1小时，项目开发3小时（{i}）", "request_id": f"bench-{i}"}
+
+
+ENDPOINTS = {
+    "chat": ("/api/v1/chat/completions", _chat_body(False)),
+    "chat_stream": ("/api/v1/chat/completions", _chat_body(True)),
+    "schedule": ("/api/v1/schedule/plan", _schedule_body),
+}
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+async def _run_level(client, endpoint: str, concurrency: int, total: int) -> Dict:
+    path, body = ENDPOINTS[endpoint]
+    remaining = iter(range(total))
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.post(path, json=body(next(_ids)))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / wall, 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def _memory_per_request(client, endpoint: str, concurrency: int) -> float:
+    """Peak traced heap growth of one wave of concurrent requests, per request (KiB)"""
+    path, body = ENDPOINTS[endpoint]
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    await asyncio.gather(*(client.post(path, json=body(next(_ids))) for _ in range(concurrency)))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round((peak - baseline) / concurrency / 1024, 1)
+
+
+def _configure(args) -> None:
+    """Point UniAI at the stub before the app (and its settings) are imported"""
+    behavior = StubBehavior(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    backend = {"name": "stub", "provider": "stub"}
+    if args.upstream == "server":
+        backend["base_url"] = start_in_process(**behavior.options())
+    else:
+        backend["options"] = behavior.options()
+
+    max_concurrency = max(args.concurrency)
+    os.environ["PROVIDER_BACKENDS"] = json.dumps({"deepseek-chat": [backend]})
+    os.environ["SCHEDULE_MODEL"] = "deepseek-chat"
+    os.environ.setdefault("SUPPORTED_MODELS", '["deepseek-chat"]')
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+    os.environ.setdefault("TOKEN_LIMIT_PER_MINUTE", "0")
+    os.environ.setdefault("MAX_CONCURRENT_REQUESTS", str(max_concurrency))
+    os.environ.setdefault("HTTP_MAX_CONNECTIONS", str(max_concurrency))
+
+
+STUB_KEYS = ("upstream", "latency", "token_rate", "reply_tokens", "error_rate", "seed")
+
+
+def _compare(results: List[Dict], config: Dict, baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path) as f:
+        saved = json.load(f)
+    baseline = {(r["endpoint"], r["concurrency"]): r for r in saved["results"]}
+    changed = [key for key in STUB_KEYS if saved.get("config", {}).get(key) != config.get(key)]
+    if changed:
+        print(f"warning: baseline was recorded with different stub settings ({', '.join(changed)})")
+
+    regressions = []
+    for result in results:
+        base = baseline.get((result["endpoint"], result["concurrency"]))
+        if base is None:
+            continue
+        name = f"{result['endpoint']}@{result['concurrency']}"
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['rps']} -> {result['rps']} req/s")
+        for key in ("p95_ms", "p99_ms", "mem_kib"):
+            if base.get(key) and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]} -> {result[key]}")
+    return regressions
+
+
+async def _report(args) -> List[Dict]:
+    import httpx
+
+    from main import app, lifespan
+
+    header = f"{'endpoint':<12} {'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>8} " \
+             f"{'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8} {'KiB/req':>8}"
+    print(header)
+    results = []
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for endpoint in args.endpoints:
+                # Warm up chain caches, connection pools and lazily built state
+                await _run_level(client, endpoint, min(max(args.concurrency), 32), args.warmup)
+                for concurrency in args.concurrency:
+                    result = await _run_level(client, endpoint, concurrency, max(args.requests, concurrency))
+                    result["mem_kib"] = await _memory_per_request(client, endpoint, concurrency)
+                    results.append(result)
+                    print(f"{endpoint:<12} {concurrency:>5} {result['requests']:>6} {result['errors']:>6} "
+                          f"{result['rps']:>8} {result['p50_ms']:>8} {result['p95_ms']:>8} "
+                          f"{result['p99_ms']:>8} {result['mem_kib']:>8}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoints", default="chat,schedule", help=f"comma-separated: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,16,64,256")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--upstream", choices=("inprocess", "server"), default="inprocess")
+    parser.add_argument("--latency", default="0.05", help="stub latency: seconds or kind:params spec")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="streamed chunks per second (0 = no pacing)")
+    parser.add_argument("--reply-tokens", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+    args.endpoints = args.endpoints.split(",")
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    _configure(args)
+    results = asyncio.run(_report(args))
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+    config = {k: v for k, v in vars(args).items() if k not in ("json", "baseline")}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+
+    if args.baseline:
+        regressions = _compare(results, config, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Near-duplicate cache micro-benchmark: lookup and store time by cache size.
+
+Fills a NearDuplicateCache with distinct schedule-like prompts, then measures
+per call, in wall-clock microseconds:
+
+    hit       lookup of a lightly edited (spacing, punctuation, one word) stored prompt
+    miss      lookup of an unrelated prompt
+    store     inserting a new prompt
+
+and the share of edited prompts found (``recall``) and of unrelated prompts
+wrongly matched (``false_hits``), at the given similarity threshold.
+
+    python -m benchmarks.bench_near_cache --entries 100,1000,10000
+    python -m benchmarks.bench_near_cache --json near.json
+    python -m benchmarks.bench_near_cache --baseline near.json --tolerance 0.2
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+from core.near_cache import NearDuplicateCache
+
+METRICS = ("hit_us", "miss_us", "store_us")
+ACTIVITIES = ["复习数据结构", "跑步", "写论文", "整理周报", "准备组会", "读英文文献", "练习钢琴", "做家务", "游泳", "学习日语",
+              "打扫房间", "写代码", "背单词", "看网课", "买菜做饭", "健身", "开会", "修改简历", "做实验", "给家人打电话"]
+TIMES = ["明天上午", "明天下午", "后天晚上", "周一早上", "周三中午", "周五下午", "周末", "今晚"]
+HOURS = ["一", "两", "三", "半"]
+
+
+def _prompt(rng: random.Random) -> str:
+    parts = [f"{rng.choice(TIMES)}{rng.choice(ACTIVITIES)}{rng.choice(HOURS)}小时" for _ in range(rng.randint(3, 6))]
+    return "，".join(parts) + "。"
+
+
+def _edit(prompt: str, rng: random.Random) -> str:
+    """The same request with different spacing and punctuation and one filler word"""
+    edited = prompt.replace("，", rng.choice([", ", "；", " ， "])).rstrip("。")
+    return "请帮我安排：" + edited if rng.random() < 0.5 else edited + "，谢谢"
+
+
+def _us(fn: Callable[[int], object], calls: int) -> float:
+    """Median wall-clock microseconds per call over three rounds"""
+    rounds = []
+    for _ in range(3):
+        started = time.perf_counter()
+        for i in range(calls):
+            fn(i)
+        rounds.append((time.perf_counter() - started) / calls * 1e6)
+    return statistics.median(rounds)
+
+
+def _measure(entries: int, threshold: float) -> Dict:
+    rng = random.Random(entries)
+    cache = NearDuplicateCache(max_entries=entries * 2, max_bytes=1 << 30, ttl=3600)
+    stored: List[str] = []
+    while len(stored) < entries:
+        prompt = _prompt(rng)
+        cache.set("bench", prompt, "x" * 200, threshold)
+        stored.append(prompt)
+
+    edited = [_edit(rng.choice(stored), rng) for _ in range(500)]
+    unrelated = [f"下个月去{city}旅行五天，帮我规划每天的行程、交通和预算"
+                 for city in ("北京", "成都", "西安", "杭州", "厦门")] * 100
+    fresh = [_prompt(rng) + "另外" for _ in range(500)]
+
+    result = {
+        "entries": entries,
+        "hit_us": round(_us(lambda i: cache.get("bench", edited[i], threshold), len(edited)), 1),
+        "miss_us": round(_us(lambda i: cache.get("bench", unrelated[i], threshold), len(unrelated)), 1),
+        "recall": round(sum(cache.get("bench", p, threshold) is not None for p in edited) / len(edited), 3),
+        "false_hits": round(sum(cache.get("bench", p, threshold) is not None for p in unrelated) / len(unrelated), 3),
+        "index_keys": cache.info()["index_keys"],
+    }
+    # Last: the stores grow (and may evict from) the cache measured above
+    result["store_us"] = round(_us(lambda i: cache.set("bench", fresh[i], "x" * 200, threshold), len(fresh)), 1)
+    return result
+
+
+def _compare(results: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path) as f:
+        baseline = {r["entries"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        base = baseline.get(result["entries"])
+        if base is None:
+            continue
+        for key in METRICS:
+            # Sub-10µs figures are noise
+            if base.get(key, 0) >= 10 and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{result['entries']} entries: {key} {base[key]} -> {result[key]}")
+        if result["recall"] < base["recall"] - 0.01:
+            regressions.append(f"{result['entries']} entries: recall {base['recall']} -> {result['recall']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", default="100,1000,10000", help="comma-separated cache sizes")
+    parser.add_argument("--threshold", type=float, default=0.85, help="Jaccard similarity threshold")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    print(f"threshold {args.threshold} (µs per call)")
+    print(f"{'entries':>8} {'hit':>8} {'miss':>8} {'store':>8} {'recall':>7} {'false':>7} {'index':>8}")
+    results = []
+    for count in (int(n) for n in args.entries.split(",")):
+        r = _measure(count, args.threshold)
+        results.append(r)
+        print(f"{r['entries']:>8} {r['hit_us']:>8} {r['miss_us']:>8} {r['store_us']:>8} "
+              f"{r['recall']:>7} {r['false_hits']:>7} {r['index_keys']:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": {"threshold": args.threshold}, "results": results}, f, indent=2)
+
+    if args.baseline:
+        regressions = _compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Response pipeline micro-benchmark: CPU time to build and encode schedule and chat responses.
+
+No upstream is involved: the model's answer is generated locally, so only
+the work done after the upstream call returns is measured, per request and
+per schedule size:
+
+    plan      slot planning and ScheduleResponse construction
+    body      encoding ScheduleResponse the way the /schedule/plan route does
+    stream    encoding every /schedule/plan/stream record (NDJSON)
+    sse       encoding 1000 chat stream delta frames
+
+``stream`` and ``sse`` are also reported with the standard library encoder
+(``*_json``), so the saving of the active encoder is visible in one run.
+
+    python -m benchmarks.bench_response --events 10,100,1000
+    python -m benchmarks.bench_response --json response.json
+    python -m benchmarks.bench_response --baseline response.json --tolerance 0.2
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from fastapi.utils import create_model_field
+
+from models.response import Usage
+from models.schedule import LLMResponse, LLMTask, ScheduleResponse
+from services.slot_planner import SlotPlanner
+from utils.fast_json import encoder_name
+from utils.streaming import format_ndjson, format_sse
+
+# Fixed "now", so every run plans the same slots
+NOW = datetime(2026, 1, 5, 7, 0)
+USAGE = {"prompt_tokens": 1200, "completion_tokens": 9000, "total_tokens": 10200}
+METRICS = ("plan_us", "body_us", "stream_us", "sse_us")
+
+
+def _tasks(count: int) -> LLMResponse:
+    """A model answer with count tasks spread over the planning horizon"""
+    return LLMResponse(events=[
+        LLMTask(
+            title=f"复习第{i}章",
+            description="复习排序与查找算法，完成课后练习并整理错题。" * 2,
+            duration=30 + (i * 17) % 120,
+            priority=("high", "medium", "low")[i % 3],
+            category=("study", "work", "health", "personal")[i % 4],
+            suggested_time=("morning", "afternoon", "evening", None)[i % 4],
+            day=i % 7,
+        )
+        for i in range(count)
+    ])
+
+
+def _cpu_us(fn: Callable[[], object], repeat: int) -> float:
+    """Median CPU microseconds per call over three rounds"""
+    rounds = []
+    for _ in range(3):
+        started = time.process_time()
+        for _ in range(repeat):
+            fn()
+        rounds.append((time.process_time() - started) / repeat * 1e6)
+    return statistics.median(rounds)
+
+
+def _measure(count: int) -> Dict:
+    tasks = _tasks(count)
+    field = create_model_field(name="Response", type_=ScheduleResponse, mode="serialization")
+
+    def plan() -> ScheduleResponse:
+        events = SlotPlanner.from_settings(now=NOW).assign(tasks.events)
+        return ScheduleResponse(events=events, request_id="bench", usage=Usage(**USAGE))
+
+    def body() -> bytes:
+        # What FastAPI does with a returned response_model instance
+        value, _ = field.validate(response, {}, loc=("response",))
+        return field.serialize_json(value)
+
+    response = plan()
+    records = [{"type": "event", "index": i, "event": event.model_dump()} for i, event in enumerate(response.events)]
+    deltas = [{"request_id": "bench", "delta": "你好，这是第%d个片段" % i} for i in range(1000)]
+    repeat = max(3, 3000 // count)
+
+    return {
+        "events": count,
+        "plan_us": round(_cpu_us(plan, repeat), 1),
+        "body_us": round(_cpu_us(body, repeat), 1),
+        "stream_us": round(_cpu_us(lambda: [format_ndjson(r) for r in records], repeat), 1),
+        "stream_json_us": round(_cpu_us(
+            lambda: [json.dumps(r, ensure_ascii=False) + "\n" for r in records], repeat), 1),
+        "sse_us": round(_cpu_us(lambda: [format_sse(d) for d in deltas], 20), 1),
+        "sse_json_us": round(_cpu_us(
+            lambda: [f"data: {json.dumps(d, ensure_ascii=False)}\n\n" for d in deltas], 20), 1),
+        "body_bytes": len(body()),
+        "unplaced": sum(1 for event in response.events if event.start_date is None),
+    }
+
+
+def _compare(results: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path) as f:
+        baseline = {r["events"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        base = baseline.get(result["events"])
+        if base is None:
+            continue
+        for key in METRICS:
+            # Sub-10µs figures are noise
+            if base.get(key, 0) >= 10 and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{result['events']} events: {key} {base[key]} -> {result[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", default="10,100,1000", help="comma-separated schedule sizes")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    print(f"encoder: {encoder_name()} (CPU µs per request; stream/sse also with the json module)")
+    print(f"{'events':>7} {'plan':>10} {'body':>8} {'stream':>8} {'(json)':>8} {'sse':>8} {'(json)':>8} "
+          f"{'bytes':>8} {'unplaced':>8}")
+    results = []
+    for count in (int(n) for n in args.events.split(",")):
+        r = _measure(count)
+        results.append(r)
+        print(f"{r['events']:>7} {r['plan_us']:>10} {r['body_us']:>8} {r['stream_us']:>8} {r['stream_json_us']:>8} "
+              f"{r['sse_us']:>8} {r['sse_json_us']:>8} {r['body_bytes']:>8} {r['unplaced']:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": {"encoder": encoder_name()}, "results": results}, f, indent=2)
+
+    if args.baseline:
+        regressions = _compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
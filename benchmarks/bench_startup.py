@@ -0,0 +1,160 @@
+"""Startup benchmark: import time, warm-up time and first-request latency.
+
+Every run is a fresh interpreter, so nothing is shared between runs. A run
+imports ``main``, enters the app lifespan (which performs the warm-up when
+STARTUP_WARMUP is on) and sends the first chat and schedule requests to the
+in-process stub upstream, timing each phase. Runs are repeated with
+warm-up on and off and the medians reported.
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --json startup.json
+    python -m benchmarks.bench_startup --baseline startup.json --tolerance 0.2
+
+``import_ms`` is what a cold start pays before the app can be served and
+``heavy_modules_at_import`` lists packages that should only load on first
+use (or during warm-up); both are tracked against the baseline.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages that make up most of the import cost and are only needed to call an upstream
+HEAVY_MODULES = ("langchain_core", "langchain_deepseek", "openai", "tiktoken", "uvicorn")
+
+RUN = r"""
+import asyncio, json, sys, time
+
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+heavy = sorted(m for m in HEAVY_MODULES if m in sys.modules)
+modules = len(sys.modules)
+
+import httpx
+
+
+async def run():
+    timings = {}
+    entered = time.perf_counter()
+    async with main.lifespan(main.app):
+        timings["startup_ms"] = (time.perf_counter() - entered) * 1000
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, path, body in REQUESTS:
+                sent = time.perf_counter()
+                response = await client.post(path, json=body)
+                assert response.status_code == 200, response.text
+                timings[name] = (time.perf_counter() - sent) * 1000
+    return timings
+
+
+result = {"import_ms": (imported - started) * 1000, "modules": modules, "heavy_modules_at_import": heavy}
+result.update(asyncio.run(run()))
+print(json.dumps(result))
+"""
+
+REQUESTS = [
+    ("first_chat_ms", "/api/v1/chat/completions", {
+        "model": "deepseek-chat",
+        "parameters": {"prompt": "hello"},
+        "user_info": {"user_id": "bench", "user_role": "user"},
+        "request_id": "startup-chat",
+    }),
+    ("first_schedule_ms", "/api/v1/schedule/plan", {"prompt": "明天复习算法2小时", "request_id": "startup-schedule"}),
+]
+
+METRICS = ("import_ms", "startup_ms", "first_chat_ms", "first_schedule_ms")
+
+
+def _env(warmup: bool) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "PROVIDER_BACKENDS": json.dumps({"deepseek-chat": [{"name": "stub", "provider": "stub", "options": {"latency": 0}}]}),
+        "SCHEDULE_MODEL": "deepseek-chat",
+        "SUPPORTED_MODELS": '["deepseek-chat"]',
+        "STARTUP_WARMUP": "true" if warmup else "false",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "JOBS_ENABLED": "false",
+        "ADMISSION_ENABLED": "false",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    return env
+
+
+def _run_once(warmup: bool) -> Dict:
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\nREQUESTS = {REQUESTS!r}\n{RUN}"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=_env(warmup), capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _measure(warmup: bool, runs: int) -> Dict:
+    samples = [_run_once(warmup) for _ in range(runs)]
+    result = {"warmup": warmup, "runs": runs}
+    for key in METRICS:
+        result[key] = round(statistics.median(sample[key] for sample in samples), 1)
+    result["modules"] = samples[-1]["modules"]
+    result["heavy_modules_at_import"] = samples[-1]["heavy_modules_at_import"]
+    return result
+
+
+def _compare(results: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path) as f:
+        baseline = {r["warmup"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        base = baseline.get(result["warmup"])
+        if base is None:
+            continue
+        name = "warmup" if result["warmup"] else "no-warmup"
+        for key in METRICS:
+            # Sub-millisecond phases are noise
+            if base.get(key, 0) >= 1 and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]} -> {result[key]}")
+        added = sorted(set(result["heavy_modules_at_import"]) - set(base.get("heavy_modules_at_import", [])))
+        if added:
+            regressions.append(f"{name}: now imported eagerly: {', '.join(added)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per mode")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'import(ms)':>10} {'startup(ms)':>11} {'1st chat(ms)':>12} "
+          f"{'1st sched(ms)':>13} {'modules':>8}  eager heavy modules")
+    results = []
+    for warmup in (False, True):
+        result = _measure(warmup, args.runs)
+        results.append(result)
+        print(f"{'warmup' if warmup else 'lazy':<10} {result['import_ms']:>10} {result['startup_ms']:>11} "
+              f"{result['first_chat_ms']:>12} {result['first_schedule_ms']:>13} {result['modules']:>8}  "
+              f"{', '.join(result['heavy_modules_at_import']) or '-'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": {"runs": args.runs}, "results": results}, f, indent=2)
+
+    if args.baseline:
+        regressions = _compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
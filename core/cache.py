@@ -0,0 +1,317 @@
+"""In-process caching primitives"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe LRU cache with optional TTL and weight bound.
+
+    When ``sliding`` is true the TTL is refreshed on every hit, which turns it
+    into an idle-eviction timeout; otherwise entries expire a fixed time after
+    they were stored. When ``max_weight`` is set, ``weigher(value)`` is summed
+    over all entries and the least recently used ones are evicted to stay
+    under it. ``on_evict(key, value)`` is called, under the cache lock, for
+    every entry that is replaced, popped, expires or is evicted.
+    """
+
+    def __init__(
+            self,
+            max_size: int = 128,
+            ttl: Optional[float] = None,
+            sliding: bool = False,
+            max_weight: Optional[int] = None,
+            weigher: Callable[[Any], int] = len,
+            on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sliding = sliding
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+
+    def _expiry(self) -> Optional[float]:
+        return time.monotonic() + self.ttl if self.ttl else None
+
+    def _remove(self, key: Hashable) -> None:
+        value, _, weight = self._data.pop(key)
+        self._weight -= weight
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at, weight = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                return default
+            self._data.move_to_end(key)
+            if self.sliding:
+                self._data[key] = (value, self._expiry(), weight)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        weight = self.weigher(value) if self.max_weight else 0
+        if self.max_weight and weight > self.max_weight:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, self._expiry(), weight)
+            self._weight += weight
+            while len(self._data) > self.max_size or (self.max_weight and self._weight > self.max_weight):
+                self._remove(next(iter(self._data)))
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the cached value for key, building and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._remove(key)
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    @property
+    def weight(self) -> int:
+        return self._weight
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Persistent key/value tier backed by a local SQLite file
+
+    ``busy_timeout`` bounds how long a call waits for another process's
+    write lock before failing with ``sqlite3.OperationalError``.
+    """
+
+    def __init__(self, path: str, busy_timeout: Optional[float] = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        if busy_timeout is not None:
+            self._conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout * 1000)}")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Canonical SHA-256 key over JSON-serialisable parts"""
+    canonical = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# Outcome of the cache lookup for the current request: HIT, MISS or BYPASS
+cache_status: ContextVar[Optional[str]] = ContextVar("cache_status", default=None)
+
+
+def is_cache_allowed(cache_control: Optional[str]) -> bool:
+    """Honour a client's ``Cache-Control: no-cache`` / ``no-store`` request header"""
+    directives = (cache_control or "").lower()
+    return "no-cache" not in directives and "no-store" not in directives
+
+
+class ResponseCache:
+    """Exact-match response cache: in-memory LRU/TTL tier plus optional disk tier
+
+    Values are JSON strings. Disk hits are promoted into the memory tier.
+    A disk tier that fails (or is busy past its timeout) counts as a miss
+    and is skipped for DISK_RETRY_AFTER seconds.
+    Async callers use ``aget`` / ``aset``, which go to the disk tier on a
+    thread of its own so that waiting for another worker's write lock does
+    not stall the event loop.
+    """
+
+    # After a disk tier failure, leave it alone for this long
+    DISK_RETRY_AFTER = 1.0
+
+    def __init__(
+            self,
+            max_entries: int,
+            max_bytes: int,
+            ttl: float,
+            disk_path: Optional[str] = None,
+            busy_timeout: Optional[float] = None,
+    ):
+        self.ttl = ttl
+        self._disk_down_until = 0.0
+        self.memory = LRUCache(
+            max_size=max_entries,
+            ttl=ttl,
+            max_weight=max_bytes,
+            weigher=lambda value: len(value.encode("utf-8")),
+        )
+        self.disk = SQLiteCache(disk_path, busy_timeout) if disk_path else None
+        # Disk calls are serialized on the one connection anyway, so one thread is enough
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="uniai-cache") if self.disk else None
+        if self.disk is not None:
+            try:
+                self.disk.purge_expired()
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache disk purge failed: {e}")
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "disk_errors": 0}
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+        return value
+
+    def _disk_failed(self, action: str, error: sqlite3.Error) -> None:
+        self.stats["disk_errors"] += 1
+        self._disk_down_until = time.monotonic() + self.DISK_RETRY_AFTER
+        logger.warning(f"Response cache disk {action} failed, skipping the disk tier for {self.DISK_RETRY_AFTER}s: {error}")
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        # Checked when the call gets its turn, so calls queued behind a failing one do not wait too
+        if time.monotonic() < self._disk_down_until:
+            return None
+        try:
+            return self.disk.get(key)
+        except sqlite3.Error as e:
+            self._disk_failed("read", e)
+            return None
+
+    def _disk_set(self, key: str, value: str) -> None:
+        if time.monotonic() < self._disk_down_until:
+            return
+        try:
+            self.disk.set(key, value, self.ttl)
+        except sqlite3.Error as e:
+            self._disk_failed("write", e)
+
+    def _disk_result(self, key: str, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        self.memory.set(key, value)
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        return self._disk_result(key, self._disk_get(key) if self.disk is not None else None)
+
+    async def aget(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        if self.disk is not None:
+            value = await asyncio.get_running_loop().run_in_executor(self._executor, self._disk_get, key)
+        return self._disk_result(key, value)
+
+    def set(self, key: str, value: str) -> None:
+        self.stats["stores"] += 1
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self._disk_set(key, value)
+
+    async def aset(self, key: str, value: str) -> None:
+        self.stats["stores"] += 1
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._disk_set, key, value)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "entries": len(self.memory),
+            "bytes": self.memory.weight,
+            "disk": self.disk is not None,
+        }
+
+    def clear(self) -> None:
+        self.memory.clear()
+
+
+def _create_response_cache() -> Optional[ResponseCache]:
+    if not settings.response_cache_enabled:
+        return None
+    # With several workers the disk tier is what they share, so it is always on
+    disk_path = settings.response_cache_disk_path \
+        or (settings.shared_state_path if settings.shared_state_enabled else None)
+    return ResponseCache(
+        max_entries=settings.response_cache_max_entries,
+        max_bytes=settings.response_cache_max_bytes,
+        ttl=settings.response_cache_ttl,
+        disk_path=disk_path,
+        # Other workers write to the same file; give up quickly rather than hold up requests
+        busy_timeout=settings.shared_state_busy_timeout if settings.shared_state_enabled else None,
+    )
+
+
+response_cache = _create_response_cache()
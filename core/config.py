@@ -1,16 +1,205 @@
 """Configuration settings for the application"""
+import asyncio
 import json
+import logging
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, FrozenSet
+
+from core.scenes import SceneConfig
+
+logger = logging.getLogger(__name__)
 
 
 class Settings:
     def __init__(self):
-        self.prompts = self._load_prompts()
-        self.models = self._load_models()
+        # Scene prompts and supported models: compiled snapshot, hot-reloadable from CONFIG_FILE
+        self.config_file = os.getenv("CONFIG_FILE", "")
+        self.config_reload_interval = self._get_float("CONFIG_RELOAD_INTERVAL", 5.0)
+        self._env_prompts = self._load_prompts()
+        self._env_models = self._load_models()
+        self._reload_lock = threading.Lock()
+        self._config_mtime = SceneConfig.file_mtime(self.config_file) if self.config_file else None
+        self.scenes = SceneConfig.from_sources(self._env_prompts, self._env_models, self.config_file)
+
+        # Upstream connection pool
+        self.deepseek_api_base = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1")
+        self.http_max_connections = self._get_int("HTTP_MAX_CONNECTIONS", 1000)
+        self.http_max_keepalive_connections = self._get_int("HTTP_MAX_KEEPALIVE_CONNECTIONS", 100)
+        self.http_keepalive_expiry = self._get_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+        self.http_timeout = self._get_float("HTTP_TIMEOUT", 120.0)
+
+        # Model -> weighted backends, routed by live latency/error-rate EWMA
+        self.provider_backends = self._get_json(
+            "PROVIDER_BACKENDS", {"deepseek-chat": [{"name": "deepseek", "provider": "deepseek"}]}
+        )
+        self.routing_ewma_alpha = self._get_float("ROUTING_EWMA_ALPHA", 0.2)
+        self.routing_error_penalty = self._get_float("ROUTING_ERROR_PENALTY", 10.0)
+        self.schedule_model = os.getenv("SCHEDULE_MODEL", "deepseek-chat")
+        # Local slot assignment for schedule plans: energy-curve windows, buffers and horizon
+        self.schedule_time_windows = self._get_json("SCHEDULE_TIME_WINDOWS", {
+            "morning": ["08:00", "12:00"],
+            "afternoon": ["13:30", "18:00"],
+            "evening": ["19:00", "22:00"],
+        })
+        self.schedule_buffer_ratio = self._get_float("SCHEDULE_BUFFER_RATIO", 0.15)
+        self.schedule_slot_minutes = self._get_int("SCHEDULE_SLOT_MINUTES", 5)
+        self.schedule_max_days = self._get_int("SCHEDULE_MAX_DAYS", 14)
+        self.schedule_max_tokens = self._get_int("SCHEDULE_MAX_TOKENS", 4096)
+        # Re-planning only returns the changed tasks, so it needs a much smaller budget
+        self.schedule_replan_max_tokens = self._get_int("SCHEDULE_REPLAN_MAX_TOKENS", 1024)
+
+        # Hedged requests: duplicate calls that run past a latency percentile
+        self.hedge_enabled = self._get_bool("HEDGE_ENABLED", False)
+        self.hedge_percentile = self._get_float("HEDGE_PERCENTILE", 95.0)
+        self.hedge_min_delay = self._get_float("HEDGE_MIN_DELAY", 0.05)
+        self.hedge_min_samples = self._get_int("HEDGE_MIN_SAMPLES", 20)
+        self.hedge_sample_size = self._get_int("HEDGE_SAMPLE_SIZE", 200)
+        self.hedge_budget_ratio = self._get_float("HEDGE_BUDGET_RATIO", 0.05)
+        self.hedge_budget_burst = self._get_float("HEDGE_BUDGET_BURST", 5.0)
+        self.hedge_budgets = self._get_json("HEDGE_BUDGETS", {})
+
+        # Retries, request deadline and per-backend circuit breaker
+        self.retry_max_attempts = self._get_int("RETRY_MAX_ATTEMPTS", 3)
+        self.retry_base_delay = self._get_float("RETRY_BASE_DELAY", 0.5)
+        self.retry_max_delay = self._get_float("RETRY_MAX_DELAY", 8.0)
+        self.request_deadline = self._get_float("REQUEST_DEADLINE", 180.0)
+        self.circuit_failure_threshold = self._get_int("CIRCUIT_FAILURE_THRESHOLD", 5)
+        self.circuit_reset_timeout = self._get_float("CIRCUIT_RESET_TIMEOUT", 30.0)
+
+        # Compiled chain cache
+        self.chain_cache_size = self._get_int("CHAIN_CACHE_SIZE", 128)
+        self.chain_cache_idle_ttl = self._get_float("CHAIN_CACHE_IDLE_TTL", 3600.0)
+
+        # Exact-match response cache
+        self.response_cache_enabled = self._get_bool("RESPONSE_CACHE_ENABLED", True)
+        self.response_cache_max_entries = self._get_int("RESPONSE_CACHE_MAX_ENTRIES", 10000)
+        self.response_cache_max_bytes = self._get_int("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+        self.response_cache_ttl = self._get_float("RESPONSE_CACHE_TTL", 3600.0)
+        self.response_cache_disk_path = os.getenv("RESPONSE_CACHE_DISK_PATH", "")
+        self.response_cache_scenes = self._get_json("RESPONSE_CACHE_SCENES", {"schedule": True})
+        self.response_cache_default = self._get_bool("RESPONSE_CACHE_DEFAULT", False)
+
+        # Near-duplicate response cache, opt-in per scene: scene -> Jaccard similarity threshold
+        # (or true for NEAR_CACHE_THRESHOLD) over character 3-grams of the normalized prompt
+        self.near_cache_scenes = self._get_json("NEAR_CACHE_SCENES", {})
+        self.near_cache_threshold = self._get_float("NEAR_CACHE_THRESHOLD", 0.85)
+        self.near_cache_max_entries = self._get_int("NEAR_CACHE_MAX_ENTRIES", 10000)
+        self.near_cache_max_bytes = self._get_int("NEAR_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+        self.near_cache_ttl = self._get_float("NEAR_CACHE_TTL", 3600.0)
+
+        # Coalescing of identical in-flight upstream calls
+        self.single_flight_enabled = self._get_bool("SINGLE_FLIGHT_ENABLED", True)
+
+        # Batch chat endpoint
+        self.batch_max_size = self._get_int("BATCH_MAX_SIZE", 500)
+        self.batch_concurrency = self._get_int("BATCH_CONCURRENCY", 16)
+
+        # Server-side chat sessions: store bounds, idle TTL, history window and rolling summary
+        self.sessions_enabled = self._get_bool("SESSIONS_ENABLED", True)
+        self.session_max_sessions = self._get_int("SESSION_MAX_SESSIONS", 10000)
+        self.session_max_bytes = self._get_int("SESSION_MAX_BYTES", 64 * 1024 * 1024)
+        self.session_ttl = self._get_float("SESSION_TTL", 3600.0)
+        self.session_window_tokens = self._get_int("SESSION_WINDOW_TOKENS", 2000)
+        self.session_summary = self._get_bool("SESSION_SUMMARY", False)
+        self.session_summary_max_tokens = self._get_int("SESSION_SUMMARY_MAX_TOKENS", 300)
+
+        # Admission control: per-user/per-role rate limits and a priority-queued concurrency cap
+        self.admission_enabled = self._get_bool("ADMISSION_ENABLED", True)
+        self.rate_limit_per_minute = self._get_int("RATE_LIMIT_PER_MINUTE", 60)
+        self.token_limit_per_minute = self._get_int("TOKEN_LIMIT_PER_MINUTE", 100000)
+        self.role_rate_limits = self._get_json("ROLE_RATE_LIMITS", {
+            "batch": {"requests_per_minute": 600, "tokens_per_minute": 1000000},
+        })
+        # Role -> token sent in X-Role-Token; without a valid one a caller is a "user" keyed by client address
+        self.role_tokens = self._get_json("ROLE_TOKENS", {})
+        self.role_priorities = self._get_json("ROLE_PRIORITIES", {"admin": 0, "user": 1, "batch": 2})
+        self.max_concurrent_requests = self._get_int("MAX_CONCURRENT_REQUESTS", 256)
+        self.admission_queue_size = self._get_int("ADMISSION_QUEUE_SIZE", 1024)
+        self.admission_queue_timeout = self._get_float("ADMISSION_QUEUE_TIMEOUT", 30.0)
+        self.admission_max_users = self._get_int("ADMISSION_MAX_USERS", 100000)
+
+        # Pre-flight token estimation and context-window fitting
+        self.token_estimator = os.getenv("TOKEN_ESTIMATOR", "heuristic")
+        self.tiktoken_encoding = os.getenv("TIKTOKEN_ENCODING", "cl100k_base")
+        self.model_context_windows = self._get_json("MODEL_CONTEXT_WINDOWS", {"deepseek-chat": 65536})
+        self.default_context_window = self._get_int("DEFAULT_CONTEXT_WINDOW", 65536)
+        self.context_overflow = os.getenv("CONTEXT_OVERFLOW", "reject")
+        self.min_completion_tokens = self._get_int("MIN_COMPLETION_TOKENS", 64)
+
+        # Background schedule jobs: durable SQLite queue, worker pool and webhook delivery
+        self.jobs_enabled = self._get_bool("JOBS_ENABLED", True)
+        self.job_db_path = os.getenv("JOB_DB_PATH", "data/jobs.db")
+        self.job_db_busy_timeout = self._get_float("JOB_DB_BUSY_TIMEOUT", 0.5)
+        self.job_workers = self._get_int("JOB_WORKERS", 4)
+        self.job_ttl = self._get_float("JOB_TTL", 86400.0)
+        self.job_max_attempts = self._get_int("JOB_MAX_ATTEMPTS", 3)
+        self.job_poll_interval = self._get_float("JOB_POLL_INTERVAL", 1.0)
+        self.job_webhook_timeout = self._get_float("JOB_WEBHOOK_TIMEOUT", 10.0)
+        self.job_webhook_retries = self._get_int("JOB_WEBHOOK_RETRIES", 3)
+        self.job_webhook_secret = os.getenv("JOB_WEBHOOK_SECRET", "")
+        # Hosts, IPs or CIDR networks webhooks may reach even if they are not public addresses
+        self.job_webhook_allowed_hosts = self._get_json("JOB_WEBHOOK_ALLOWED_HOSTS", [])
+
+        # Multi-process serving: worker processes and the SQLite file they share
+        # rate-limit buckets, response cache entries and in-flight leases through
+        self.workers = self._get_int("WORKERS", 1)
+        self.shared_state_enabled = self._get_bool("SHARED_STATE", self.workers > 1)
+        self.shared_state_path = os.getenv("SHARED_STATE_PATH", "data/shared.db")
+        # Seconds a shared state call waits for another worker's write before giving up
+        self.shared_state_busy_timeout = self._get_float("SHARED_STATE_BUSY_TIMEOUT", 0.25)
+        self.lease_poll_interval = self._get_float("LEASE_POLL_INTERVAL", 0.05)
+
+        # Import providers, build pooled clients and compile templates before serving
+        self.startup_warmup = self._get_bool("STARTUP_WARMUP", True)
+
+        # Prometheus /metrics endpoint and request metrics middleware
+        self.metrics_enabled = self._get_bool("METRICS_ENABLED", True)
+
+        # Request tracing: traces slower than TRACE_SLOW_MS (or asked for with the profile header)
+        # are kept in a ring buffer; the sampling profiler adds event loop stacks to them
+        self.trace_slow_ms = self._get_float("TRACE_SLOW_MS", 5000.0)
+        self.trace_buffer_size = self._get_int("TRACE_BUFFER_SIZE", 100)
+        self.profiler_enabled = self._get_bool("PROFILER_ENABLED", False)
+        self.profiler_interval_ms = self._get_float("PROFILER_INTERVAL_MS", 10.0)
+
+        # Admin endpoints (when empty: all of them return 403)
+        self.admin_token = os.getenv("ADMIN_TOKEN", "")
+
+    @staticmethod
+    def _get_int(name: str, default: int) -> int:
+        """Read an integer environment variable"""
+        try:
+            return int(os.getenv(name, default))
+        except ValueError:
+            return default
+
+    @staticmethod
+    def _get_bool(name: str, default: bool) -> bool:
+        """Read a boolean environment variable"""
+        value = os.getenv(name)
+        if value is None:
+            return default
+        return value.strip().lower() in ("1", "true", "yes", "on")
+
+    @staticmethod
+    def _get_json(name: str, default):
+        """Read a JSON environment variable"""
+        try:
+            return json.loads(os.getenv(name, ""))
+        except json.JSONDecodeError:
+            return default
+
+    @staticmethod
+    def _get_float(name: str, default: float) -> float:
+        """Read a float environment variable"""
+        try:
+            return float(os.getenv(name, default))
+        except ValueError:
+            return default
 
     def _load_prompts(self) -> Dict[str, str]:
         """Load system prompt configuration"""
@@ -28,13 +217,96 @@ class Settings:
         except json.JSONDecodeError:
             return ["deepseek-chat"]
 
+    @property
+    def prompts(self) -> Dict[str, str]:
+        return self.scenes.prompts
+
+    @property
+    def models(self) -> FrozenSet[str]:
+        return self.scenes.models
+
     def get_prompt(self, scene_id: str) -> Optional[str]:
         """Get prompt by scene ID"""
-        return self.prompts.get(scene_id)
+        return self.scenes.get_prompt(scene_id)
 
     def is_model_supported(self, model: str) -> bool:
         """Check if model is supported"""
-        return model in self.models
+        return model in self.scenes.models
+
+    def reload_scenes(self) -> SceneConfig:
+        """Rebuild the scene snapshot from CONFIG_FILE and swap it in atomically
+
+        Raises ValueError and keeps the current snapshot if the new
+        configuration does not load or validate.
+        """
+        with self._reload_lock:
+            mtime = SceneConfig.file_mtime(self.config_file) if self.config_file else None
+            scenes = SceneConfig.from_sources(
+                self._env_prompts, self._env_models, self.config_file, self.scenes.version + 1
+            ).precompile()
+            self._config_mtime = mtime
+            self.scenes = scenes
+        logger.info(f"Loaded scene config v{scenes.version} from {scenes.source}: "
+                    f"{len(scenes.prompts)} scenes, {len(scenes.models)} models")
+        return scenes
+
+    async def watch_config_file(self) -> None:
+        """Reload the scene snapshot whenever CONFIG_FILE changes (run as a background task)"""
+        while True:
+            await asyncio.sleep(self.config_reload_interval)
+            mtime = SceneConfig.file_mtime(self.config_file)
+            if mtime is None or mtime == self._config_mtime:
+                continue
+            try:
+                self.reload_scenes()
+            except ValueError as e:
+                # Keep serving the last good snapshot; retry after the next change
+                self._config_mtime = mtime
+                logger.error(f"Config reload failed, keeping v{self.scenes.version}: {e}")
+
+    def is_response_cache_enabled(self, scene: Optional[str]) -> bool:
+        """Check whether responses for a scene may be served from the cache
+
+        Chat requests without a prompt_id use the "default" scene and
+        schedule planning uses the "schedule" scene.
+        """
+        if not self.response_cache_enabled:
+            return False
+        return bool(self.response_cache_scenes.get(scene or "default", self.response_cache_default))
+
+    def get_near_cache_threshold(self, scene: Optional[str]) -> Optional[float]:
+        """Similarity a cached prompt needs to answer a request of this scene; None when off"""
+        value = self.near_cache_scenes.get(scene or "default", False)
+        if value is False or value is None:
+            return None
+        return self.near_cache_threshold if value is True else float(value)
+
+    def get_role_limits(self, role: str) -> Dict[str, int]:
+        """Per-minute limits for a role; 0 means unlimited
+
+        ``user_*`` limits apply to each user with the role and default to
+        RATE_LIMIT_PER_MINUTE / TOKEN_LIMIT_PER_MINUTE; the others are shared
+        by all users with the role and are unlimited unless configured.
+        """
+        limits = self.role_rate_limits.get(role, {})
+        return {
+            "user_requests_per_minute": int(limits.get("user_requests_per_minute", self.rate_limit_per_minute)),
+            "user_tokens_per_minute": int(limits.get("user_tokens_per_minute", self.token_limit_per_minute)),
+            "requests_per_minute": int(limits.get("requests_per_minute", 0)),
+            "tokens_per_minute": int(limits.get("tokens_per_minute", 0)),
+        }
+
+    def get_role_priority(self, role: str) -> int:
+        """Queue priority for a role (lower is served first); unknown roles rank as users"""
+        return int(self.role_priorities.get(role, self.role_priorities.get("user", 1)))
+
+    def get_context_window(self, model: str) -> int:
+        """Context window (prompt + completion tokens) of a model"""
+        return int(self.model_context_windows.get(model, self.default_context_window))
+
+    def get_hedge_budget(self, model: str) -> float:
+        """Fraction of a model's requests that may be hedged"""
+        return float(self.hedge_budgets.get(model, self.hedge_budget_ratio))
 
 
 settings = Settings()
@@ -29,3 +29,68 @@ class ProviderException(UniAIException):
 
     def __init__(self, provider: str, message: str):
         super().__init__(f"Provider '{provider}' error: {message}", 500)
+
+
+class CircuitOpenException(UniAIException):
+    """Every backend for a model is failing fast"""
+
+    def __init__(self, model: str):
+        super().__init__(f"Model '{model}' is temporarily unavailable", 503)
+
+
+class DeadlineExceededException(UniAIException):
+    """Request did not finish within its deadline"""
+
+    def __init__(self, seconds: float):
+        super().__init__(f"Request deadline of {seconds:g}s exceeded", 504)
+
+
+class ContextLengthExceededException(UniAIException):
+    """Prompt does not fit in the model's context window"""
+
+    def __init__(self, model: str, tokens: int, limit: int):
+        super().__init__(
+            f"Prompt of about {tokens} tokens exceeds the {limit}-token context window of '{model}'", 400
+        )
+
+
+class ConfigReloadException(UniAIException):
+    """New configuration failed to load or validate; the old one stays active"""
+
+    def __init__(self, message: str):
+        super().__init__(f"Config reload failed: {message}", 400)
+
+
+class JobNotFoundException(UniAIException):
+    """Job id is unknown or its result has expired"""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"Job '{job_id}' not found", 404)
+
+
+class JobConflictException(UniAIException):
+    """request_id was already used for a job with a different payload"""
+
+    def __init__(self, request_id: str):
+        super().__init__(f"request_id '{request_id}' was already submitted with a different payload", 409)
+
+
+class CallbackURLException(UniAIException):
+    """callback_url is not a public http(s) address the server may call"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Invalid callback_url: {reason}", 422)
+
+
+class SessionNotFoundException(UniAIException):
+    """Chat session is unknown to this user or has expired"""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"Session '{session_id}' not found", 404)
+
+
+class TraceNotFoundException(UniAIException):
+    """No kept trace (or profile) for this request id on the answering worker"""
+
+    def __init__(self, request_id: str):
+        super().__init__(f"Trace '{request_id}' not found", 404)
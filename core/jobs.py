@@ -0,0 +1,477 @@
+"""Durable background jobs: a SQLite-backed queue drained by an in-process worker pool"""
+import asyncio
+import functools
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+from urllib.parse import urlsplit
+
+import httpx
+
+from core.config import settings
+from core.exceptions import CallbackURLException, JobConflictException, UniAIException
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+STATUSES = (QUEUED, RUNNING, SUCCEEDED, FAILED)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+T = TypeVar("T")
+
+
+class JobStore:
+    """Jobs table in a local SQLite file
+
+    Every state change is committed before it is acted on, so jobs survive
+    a restart: jobs whose worker process died while running them are queued
+    again on startup. ``(kind, request_id)`` is unique, which makes
+    submission idempotent. Several worker processes can share one file.
+
+    Calls block while another process holds the write lock (at most
+    JOB_DB_BUSY_TIMEOUT), so async code runs them through ``run``.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Calls are serialized on the one connection anyway, so one thread is enough
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="uniai-jobs")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, request_id TEXT NOT NULL, payload TEXT NOT NULL, "
+            "callback_url TEXT, status TEXT NOT NULL, result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, webhook_status TEXT, owner INTEGER, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, expires_at REAL NOT NULL, "
+            "UNIQUE (kind, request_id))"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)")
+        # Generous while creating the schema above, short for the calls below
+        self._conn.execute(f"PRAGMA busy_timeout = {int(settings.job_db_busy_timeout * 1000)}")
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run one of the blocking calls below off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args))
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for key in ("payload", "result", "error"):
+            if job[key] is not None:
+                job[key] = json.loads(job[key])
+        return job
+
+    def create(self, kind: str, request_id: str, payload: Dict[str, Any],
+               callback_url: Optional[str], ttl: float) -> Tuple[Dict[str, Any], bool]:
+        """Insert a queued job, or return the live job already holding this request_id
+
+        Returns ``(job, created)``.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE kind = ? AND request_id = ? AND expires_at <= ?", (kind, request_id, now)
+            )
+            created = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, request_id, payload, callback_url, status, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (uuid.uuid4().hex, kind, request_id, json.dumps(payload, ensure_ascii=False, sort_keys=True),
+                 callback_url, QUEUED, now, now + ttl),
+            ).rowcount == 1
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE kind = ? AND request_id = ?", (kind, request_id)
+            ).fetchone()
+        return self._row(row), created
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ? AND expires_at > ?", (job_id, time.time())
+            ).fetchone()
+        return self._row(row)
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job to running"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1, owner = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = ? AND expires_at > ? ORDER BY created_at LIMIT 1) "
+                "RETURNING *",
+                (RUNNING, now, os.getpid(), QUEUED, now),
+            ).fetchone()
+        return self._row(row)
+
+    def finish(self, job_id: str, status: str, ttl: float, result: Optional[Dict[str, Any]] = None,
+               error: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Store the outcome; the job is kept for ``ttl`` seconds from now"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, expires_at = ? "
+                "WHERE id = ? RETURNING *",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 json.dumps(error, ensure_ascii=False) if error is not None else None, now, now + ttl, job_id),
+            ).fetchone()
+        return self._row(row)
+
+    def set_webhook_status(self, job_id: str, webhook_status: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (webhook_status, job_id))
+
+    @staticmethod
+    def _owner_alive(pid: Optional[int]) -> bool:
+        """Whether another live process on this host may still be running the job"""
+        if pid is None or pid == os.getpid():
+            # Our pid before this start (e.g. pid 1 in a restarted container)
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def recover(self, max_attempts: int) -> Tuple[int, int]:
+        """Requeue jobs left running by dead worker processes; fail those out of attempts
+
+        Jobs owned by live workers (other processes sharing the file) are
+        left alone. Returns ``(requeued, failed)``.
+        """
+        error = json.dumps({"code": 500, "message": "Job was interrupted too many times"})
+        now = time.time()
+        requeued = failed = 0
+        with self._lock:
+            rows = self._conn.execute("SELECT id, owner, attempts FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            for job_id, owner, attempts in rows:
+                if self._owner_alive(owner):
+                    continue
+                if attempts >= max_attempts:
+                    failed += self._conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?",
+                        (FAILED, error, now, job_id, RUNNING),
+                    ).rowcount
+                else:
+                    requeued += self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL WHERE id = ? AND status = ?",
+                        (QUEUED, job_id, RUNNING),
+                    ).rowcount
+        return requeued, failed
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE expires_at > ? GROUP BY status", (time.time(),)
+            ).fetchall()
+        return {status: 0 for status in STATUSES} | {status: count for status, count in rows}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            self._conn.close()
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    """HMAC-SHA256 signature sent as X-UniAI-Signature with webhook deliveries"""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def _allowed(host: str, address: Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]] = None) -> bool:
+    """Whether JOB_WEBHOOK_ALLOWED_HOSTS lists the host name or a network containing the address"""
+    for entry in settings.job_webhook_allowed_hosts:
+        if str(entry).lower() == host.lower():
+            return True
+        if address is not None:
+            try:
+                if address in ipaddress.ip_network(str(entry), strict=False):
+                    return True
+            except ValueError:
+                continue
+    return False
+
+
+async def check_callback_url(url: str) -> Optional[str]:
+    """Refuse webhook targets other than public http(s) hosts
+
+    Every address the host resolves to must be public (no loopback, private,
+    link-local or reserved ranges) unless JOB_WEBHOOK_ALLOWED_HOSTS permits
+    it, so callbacks cannot be used to reach internal services. Checked on
+    submission and again before each delivery. Returns the checked address
+    that delivery connects to, so the host cannot resolve differently in
+    between; None for hosts allowed by name, which are resolved as usual.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise CallbackURLException("must be an http or https URL with a host")
+    host = parts.hostname
+    if _allowed(host):
+        return None
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        raise CallbackURLException("invalid port")
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except OSError:
+        raise CallbackURLException(f"host '{host}' cannot be resolved")
+    for info in infos:
+        # Drop an IPv6 zone id ("fe80::1%eth0")
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if (not address.is_global or address.is_multicast) and not _allowed(host, address):
+            raise CallbackURLException(f"host '{host}' resolves to non-public address {address}")
+    return infos[0][4][0]
+
+
+def pinned_request(client: httpx.AsyncClient, url: str, address: Optional[str],
+                   body: bytes, headers: Dict[str, str]) -> httpx.Request:
+    """POST to ``url`` connecting to ``address``, keeping the URL's host for the Host header and TLS"""
+    target = httpx.URL(url)
+    if address is None:
+        return client.build_request("POST", target, content=body, headers=headers)
+    return client.build_request(
+        "POST",
+        target.copy_with(host=address),
+        content=body,
+        headers={**headers, "Host": target.netloc.decode("ascii")},
+        # Certificates are checked against the host name, not the address
+        extensions={"sni_hostname": target.host},
+    )
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job fields returned to clients (timestamps as whole seconds)"""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "request_id": job["request_id"],
+        "result": job["result"],
+        "error": job["error"],
+        "webhook_status": job["webhook_status"],
+        "created_at": int(job["created_at"]),
+        "started_at": int(job["started_at"]) if job["started_at"] else None,
+        "finished_at": int(job["finished_at"]) if job["finished_at"] else None,
+        "expires_at": int(job["expires_at"]),
+    }
+
+
+class JobQueue:
+    """Worker pool running registered handlers for queued jobs
+
+    Workers claim jobs from the store one at a time, so ``JOB_WORKERS``
+    bounds how many upstream calls jobs make concurrently. Submitting wakes
+    an idle worker; workers also poll, which picks up jobs queued by other
+    processes sharing the database.
+    """
+
+    def __init__(self):
+        self._store: Optional[JobStore] = None
+        self._store_lock = threading.Lock()
+        self._counts: Dict[str, int] = {status: 0 for status in STATUSES}
+        self._handlers: Dict[str, Handler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats: Dict[str, int] = {
+            "submitted": 0, "deduplicated": 0, "succeeded": 0, "failed": 0,
+            "webhooks_delivered": 0, "webhooks_failed": 0,
+        }
+
+    @property
+    def store(self) -> JobStore:
+        with self._store_lock:
+            if self._store is None:
+                self._store = JobStore(settings.job_db_path)
+            return self._store
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    async def submit(self, kind: str, request_id: str, payload: Dict[str, Any],
+                     callback_url: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Queue a job, idempotently per request_id; returns ``(job, created)``"""
+        store = self.store
+        job, created = await store.run(store.create, kind, request_id, payload, callback_url, settings.job_ttl)
+        if not created:
+            if job["payload"] != json.loads(json.dumps(payload, ensure_ascii=False, sort_keys=True)):
+                raise JobConflictException(request_id)
+            self.stats["deduplicated"] += 1
+            return job, False
+        self.stats["submitted"] += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job, True
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        store = self.store
+        return await store.run(store.get, job_id)
+
+    async def start(self) -> None:
+        # Opening the store may wait for other processes creating the same file
+        store = await asyncio.to_thread(lambda: self.store)
+        requeued, failed = await store.run(store.recover, settings.job_max_attempts)
+        if requeued or failed:
+            logger.info(f"Recovered interrupted jobs: {requeued} requeued, {failed} failed")
+        await store.run(store.purge_expired)
+        self._wakeup = asyncio.Event()
+        # No proxies from the environment: a proxy would resolve the callback host again itself
+        self._client = httpx.AsyncClient(timeout=settings.job_webhook_timeout, trust_env=False)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(max(1, settings.job_workers))]
+        self._tasks.append(asyncio.create_task(self._janitor()))
+
+    async def stop(self) -> None:
+        # Jobs cut off here are still "running" in the store and are requeued on the next start
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _worker(self) -> None:
+        failures = 0
+        while True:
+            try:
+                job = await self.store.run(self.store.claim)
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), settings.job_poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+                else:
+                    await self._run(job)
+                failures = 0
+            except Exception as e:
+                # E.g. "database is locked" with several processes on one file: keep the worker alive
+                failures += 1
+                delay = min(settings.job_poll_interval * 2 ** failures, 30.0)
+                logger.warning(f"Job worker error, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def _janitor(self) -> None:
+        while True:
+            await asyncio.sleep(min(settings.job_ttl, 60.0))
+            try:
+                purged = await self.store.run(self.store.purge_expired)
+            except sqlite3.Error as e:
+                logger.warning(f"Purging expired jobs failed, retrying next round: {e}")
+                continue
+            if purged:
+                logger.info(f"Purged {purged} expired jobs")
+
+    async def _finish(self, job: Dict[str, Any], status: str, **outcome) -> Optional[Dict[str, Any]]:
+        """Store a job's outcome, retrying while the database is busy
+
+        If it still cannot be stored the job stays "running" and is requeued
+        by the next start's recovery.
+        """
+        for attempt in range(5):
+            try:
+                return await self.store.run(
+                    functools.partial(self.store.finish, job["id"], status, settings.job_ttl, **outcome)
+                )
+            except sqlite3.Error as e:
+                error = e
+            await asyncio.sleep(0.1 * 2 ** attempt)
+        logger.error(f"Could not store the outcome of job {job['id']} ({status}): {error}")
+        return None
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        handler = self._handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise UniAIException(f"No handler for job kind '{job['kind']}'", 500)
+            result = await handler(job["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            code = e.code if isinstance(e, UniAIException) else 500
+            message = e.message if isinstance(e, UniAIException) else str(e)
+            logger.warning(f"Job {job['id']} ({job['kind']}, request_id={job['request_id']}) failed: {message}")
+            job = await self._finish(job, FAILED, error={"code": code, "message": message})
+            self.stats["failed"] += 1
+        else:
+            job = await self._finish(job, SUCCEEDED, result=result)
+            self.stats["succeeded"] += 1
+        if job is not None and job["callback_url"]:
+            await self._deliver(job)
+
+    async def _deliver(self, job: Dict[str, Any]) -> None:
+        """POST the finished job to its callback URL, retrying with exponential backoff"""
+        body = json.dumps(public_view(job), ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json", "X-UniAI-Job-Id": job["id"]}
+        if settings.job_webhook_secret:
+            headers["X-UniAI-Signature"] = sign_payload(body, settings.job_webhook_secret)
+
+        for attempt in range(settings.job_webhook_retries + 1):
+            try:
+                address = await check_callback_url(job["callback_url"])
+            except CallbackURLException as e:
+                reason = e.message
+                break
+            try:
+                response = await self._client.send(
+                    pinned_request(self._client, job["callback_url"], address, body, headers)
+                )
+                if response.status_code < 400:
+                    await self._set_webhook_status(job, "delivered")
+                    self.stats["webhooks_delivered"] += 1
+                    return
+                reason = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                reason = str(e) or type(e).__name__
+            if attempt < settings.job_webhook_retries:
+                await asyncio.sleep(min(2 ** attempt, 30))
+        logger.warning(f"Webhook for job {job['id']} to {job['callback_url']} failed: {reason}")
+        await self._set_webhook_status(job, "failed")
+        self.stats["webhooks_failed"] += 1
+
+    async def _set_webhook_status(self, job: Dict[str, Any], webhook_status: str) -> None:
+        try:
+            await self.store.run(self.store.set_webhook_status, job["id"], webhook_status)
+        except sqlite3.Error as e:
+            # Only the reported status is lost; the delivery itself is not repeated
+            logger.warning(f"Could not store webhook status of job {job['id']} ({webhook_status}): {e}")
+
+    async def refresh_counts(self) -> None:
+        """Re-read the job counts reported by info(), keeping the last ones if the store is busy"""
+        try:
+            self._counts = await self.store.run(self.store.counts)
+        except sqlite3.Error as e:
+            logger.warning(f"Counting jobs failed: {e}")
+
+    def info(self) -> Dict[str, Any]:
+        """Statistics; job counts are as of the last refresh_counts()"""
+        return {**self.stats, "workers": settings.job_workers, "jobs": self._counts}
+
+
+job_queue = JobQueue()
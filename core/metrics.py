@@ -0,0 +1,259 @@
+"""Lightweight Prometheus metrics: counters, gauges and histograms in text exposition format"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.tracing import span
+
+# Latency buckets in seconds: sub-millisecond stages up to long upstream calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640)
+
+# A collector returns (name, type, help, [(labels, value), ...]) families at scrape time
+Sample = Tuple[Dict[str, str], float]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Value:
+    """Counter or gauge value for one label set"""
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramValue:
+    """Histogram buckets for one label set (counts are stored per bucket, summed at render)"""
+
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values: str):
+        """Child metric for one label set (created on first use)"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them for a Prometheus scrape
+
+    Hot paths only touch a per-label-set value under its own lock; all
+    formatting happens at scrape time. Components that already keep their
+    own statistics register a collector instead of being instrumented.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Collector] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUESTS = metrics.counter(
+    "uniai_http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "uniai_http_request_duration_seconds", "HTTP request latency including streamed bodies", ("route", "method"))
+HTTP_IN_FLIGHT = metrics.gauge(
+    "uniai_http_requests_in_flight", "HTTP requests currently being served", ("route",))
+STAGE_SECONDS = metrics.histogram(
+    "uniai_stage_duration_seconds", "Time spent in each request stage", ("route", "stage"), STAGE_BUCKETS)
+RESPONSE_CACHE = metrics.counter(
+    "uniai_response_cache_total", "Response cache outcomes (X-Cache) by route", ("route", "status"))
+UPSTREAM_SECONDS = metrics.histogram(
+    "uniai_upstream_duration_seconds", "Upstream call latency by backend and outcome", ("model", "backend", "outcome"))
+UPSTREAM_IN_FLIGHT = metrics.gauge(
+    "uniai_upstream_in_flight", "Upstream calls currently running", ("model",))
+UPSTREAM_RETRIES = metrics.counter(
+    "uniai_upstream_retries_total", "Upstream retry decisions (retried, gave_up, deadline_exceeded)",
+    ("model", "outcome"))
+TOKENS = metrics.counter(
+    "uniai_tokens_total",
+    "Tokens reported by the upstream (prompt, completion, prompt_cache_hit, prompt_cache_miss)", ("model", "type"))
+TOKENS_PER_SECOND = metrics.histogram(
+    "uniai_completion_tokens_per_second", "Completion tokens per second of upstream time", ("model",), RATE_BUCKETS)
+TIME_TO_FIRST_TOKEN = metrics.histogram(
+    "uniai_time_to_first_token_seconds", "Time until the first streamed token", ("model",))
+
+# Route label of the request being served, set by MetricsMiddleware
+current_route: ContextVar[str] = ContextVar("metrics_route", default="other")
+_active_stage: ContextVar[Optional[str]] = ContextVar("metrics_stage", default=None)
+
+
+class stage:
+    """Time a block as one request stage: ``with stage("prompt_build"): ...``
+
+    A stage nested in a stage of the same name (e.g. validating a model
+    inside a batch) is not counted twice. Stages are also recorded as spans
+    of the request's trace.
+    """
+
+    __slots__ = ("name", "_started", "_token", "_span")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._token = None
+
+    def __enter__(self):
+        if _active_stage.get() != self.name:
+            self._token = _active_stage.set(self.name)
+            self._span = span(self.name).__enter__()
+            self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._token is not None:
+            STAGE_SECONDS.labels(current_route.get(), self.name).observe(time.perf_counter() - self._started)
+            self._span.__exit__(*exc_info)
+            _active_stage.reset(self._token)
+            self._token = None
+        return False
+
+
+def record_usage(model: str, usage: Optional[Dict[str, int]], seconds: Optional[float]) -> None:
+    """Count upstream token usage and completion throughput"""
+    if not usage:
+        return
+    prompt_tokens = usage.get("input_tokens", 0)
+    completion_tokens = usage.get("output_tokens", 0)
+    TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    TOKENS.labels(model, "completion").inc(completion_tokens)
+    cache_hit = (usage.get("input_token_details") or {}).get("cache_read")
+    if cache_hit is not None:
+        TOKENS.labels(model, "prompt_cache_hit").inc(cache_hit)
+        TOKENS.labels(model, "prompt_cache_miss").inc(prompt_tokens - cache_hit)
+    if seconds and completion_tokens:
+        TOKENS_PER_SECOND.labels(model).observe(completion_tokens / seconds)
@@ -0,0 +1,158 @@
+"""Near-duplicate response cache for prompts that differ only in spacing, punctuation or a few words
+
+Prompts are normalized (NFKC, lower case, whitespace, punctuation and
+symbols removed) and compared by the Jaccard similarity of their character
+3-grams. Every 3-gram is hashed to 64 bits, and the hash order is a fixed
+random permutation of all 3-grams, as in MinHash. Each entry is indexed
+under the lowest hashes of its set. Prefix filtering guarantees that two
+sets above the similarity threshold share one of these, so a lookup probes
+a handful of index keys and verifies the exact similarity of the few
+candidates it finds.
+
+Numbers must match exactly: "学习2小时" never answers "学习3小时".
+"""
+import hashlib
+import math
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Set, Tuple
+
+from core.cache import LRUCache
+from core.config import settings
+
+NGRAM = 3
+# Approximate bytes held per indexed 3-gram, counted against NEAR_CACHE_MAX_BYTES
+FEATURE_BYTES = 64
+_NUMBERS = re.compile(r"\d+|[〇零一二两三四五六七八九十百千万半]")
+
+
+def normalize(text: str) -> str:
+    """NFKC, lower case, without whitespace, punctuation, symbols and control characters"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(c for c in text if unicodedata.category(c)[0] not in "ZPSC")
+
+
+def features(normalized: str) -> List[int]:
+    """64-bit hashes of the character 3-grams, in ascending (global) order"""
+    grams = {normalized[i:i + NGRAM] for i in range(max(len(normalized) - NGRAM + 1, 1))}
+    return sorted(
+        int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+        for gram in grams
+    )
+
+
+def prefix_length(size: int, threshold: float) -> int:
+    """Number of lowest hashes that two sets with Jaccard >= threshold are sure to overlap in"""
+    return size - math.ceil(threshold * size - 1e-9) + 1
+
+
+class NearDuplicateCache:
+    """Response values keyed by (scope, prompt), matched by prompt similarity
+
+    ``scope`` identifies everything but the prompt (model, scene, sampling
+    parameters, date...). Entries are bounded by count and bytes with a TTL.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.memory = LRUCache(
+            max_size=max_entries,
+            ttl=ttl,
+            max_weight=max_bytes,
+            weigher=lambda entry: len(entry[0].encode("utf-8")) + FEATURE_BYTES * len(entry[1]),
+            on_evict=self._unindex,
+        )
+        # (scope, 3-gram hash) -> keys of entries indexed under it
+        self._index: Dict[Tuple[str, int], Set[Hashable]] = {}
+        # key -> (indexed hashes, all hashes), read without touching LRU order
+        self._features: Dict[Hashable, Tuple[List[int], FrozenSet[int]]] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "exact_hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def _scope(scope: str, normalized: str) -> str:
+        return scope + "|" + ",".join(_NUMBERS.findall(normalized))
+
+    def _unindex(self, key: Hashable, entry: Tuple[str, FrozenSet[int]]) -> None:
+        # Runs under the LRU lock, always from a method already holding self._lock
+        scope = key[0]
+        prefix, _ = self._features.pop(key, ((), None))
+        for h in prefix:
+            keys = self._index.get((scope, h))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[(scope, h)]
+
+    def get(self, scope: str, prompt: str, threshold: float) -> Optional[str]:
+        """Value stored for the most similar prompt with similarity >= threshold"""
+        normalized = normalize(prompt)
+        scope = self._scope(scope, normalized)
+        hashes = features(normalized)
+        with self._lock:
+            entry = self.memory.get((scope, normalized))
+            if entry is not None:
+                self.stats["exact_hits"] += 1
+                return entry[0]
+
+            candidates: Set[Hashable] = set()
+            for h in hashes[:prefix_length(len(hashes), threshold)]:
+                candidates.update(self._index.get((scope, h), ()))
+            query = frozenset(hashes)
+            scored = []
+            for key in candidates:
+                stored = self._features[key][1]
+                similarity = len(query & stored) / len(query | stored)
+                if similarity >= threshold:
+                    scored.append((similarity, key))
+            for _, key in sorted(scored, reverse=True):
+                entry = self.memory.get(key)
+                if entry is not None:
+                    self.stats["hits"] += 1
+                    return entry[0]
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, scope: str, prompt: str, value: str, threshold: float) -> None:
+        normalized = normalize(prompt)
+        scope = self._scope(scope, normalized)
+        hashes = features(normalized)
+        key = (scope, normalized)
+        prefix = hashes[:prefix_length(len(hashes), threshold)]
+        stored = frozenset(hashes)
+        with self._lock:
+            self.stats["stores"] += 1
+            self.memory.set(key, (value, stored))
+            if self.memory.get(key) is None:
+                # Larger than the whole cache
+                return
+            self._features[key] = (prefix, stored)
+            for h in prefix:
+                self._index.setdefault((scope, h), set()).add(key)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "entries": len(self.memory),
+            "bytes": self.memory.weight,
+            "index_keys": len(self._index),
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self.memory.clear()
+            self._index.clear()
+            self._features.clear()
+
+
+def _create_near_cache() -> Optional[NearDuplicateCache]:
+    if not settings.response_cache_enabled or not settings.near_cache_scenes:
+        return None
+    return NearDuplicateCache(
+        max_entries=settings.near_cache_max_entries,
+        max_bytes=settings.near_cache_max_bytes,
+        ttl=settings.near_cache_ttl,
+    )
+
+
+near_cache = _create_near_cache()
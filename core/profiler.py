@@ -0,0 +1,141 @@
+"""Opt-in sampling profiler attributing event loop stacks to the traced request that is running"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from typing import Dict, Optional, Set
+
+from core.config import settings
+from core.tracing import Trace, current_trace
+
+logger = logging.getLogger(__name__)
+
+MAX_DEPTH = 128
+
+
+class SamplingProfiler:
+    """Sample the event loop thread's stack every PROFILER_INTERVAL_MS while requests are traced
+
+    Each sample is charged, as a folded stack, to the trace of the task the
+    loop is running at that moment. Tasks are mapped to traces when they are
+    created (through a task factory), so work a request hands to other tasks
+    (streamed bodies, hedged attempts, coalesced calls) is charged to it too.
+    Samples taken while the loop runs another request's code count as
+    ``other_samples`` for every traced request that is in flight, which shows
+    time lost to a busy loop. Nothing runs while no request is in flight.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._parent_factory = None
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.Task, Trace]" = weakref.WeakKeyDictionary()
+        self._active: Set[Trace] = set()
+        self._wake = threading.Event()
+        self._labels: Dict[object, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.stats: Dict[str, int] = {"samples": 0, "idle": 0, "untraced": 0}
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start sampling the thread running ``loop`` (call from that loop)"""
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self._parent_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)
+        self._thread = threading.Thread(target=self._run, name="uniai-profiler", daemon=True)
+        self._thread.start()
+
+    def uninstall(self) -> None:
+        if self._loop is not None:
+            self._loop.set_task_factory(self._parent_factory)
+            self._loop = None
+            self._wake.set()
+
+    def _task_factory(self, loop, coro, **kwargs):
+        if self._parent_factory is not None:
+            task = self._parent_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        context = kwargs.get("context")
+        trace = context.get(current_trace) if context is not None else current_trace.get()
+        if trace is not None:
+            self._tasks[task] = trace
+        return task
+
+    def start(self, trace: Trace) -> None:
+        """Profile a request from the task serving it"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._tasks[task] = trace
+        self._active.add(trace)
+        self._wake.set()
+
+    def stop(self, trace: Trace) -> None:
+        self._active.discard(trace)
+        if not self._active:
+            self._wake.clear()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            label = f"{code.co_qualname} ({os.path.basename(path)})"
+            self._labels[code] = label
+        return label
+
+    def _fold(self, frame) -> str:
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _sample(self) -> None:
+        active = list(self._active)
+        if not active or self._loop is None:
+            return
+        task = asyncio.tasks._current_tasks.get(self._loop)
+        if task is None:
+            # Waiting for I/O: nothing to charge
+            self.stats["idle"] += 1
+            return
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        self.stats["samples"] += 1
+        trace = self._tasks.get(task)
+        if trace is None or trace not in self._active:
+            # Not request work, or a task that outlived its request
+            trace = None
+            self.stats["untraced"] += 1
+        else:
+            trace.add_sample(self._fold(frame))
+        for other in active:
+            if other is not trace:
+                other.other_samples += 1
+
+    def _run(self) -> None:
+        while self._loop is not None:
+            self._wake.wait()
+            time.sleep(self.interval)
+            try:
+                self._sample()
+            except Exception as e:
+                # Never take the process down over a diagnostic
+                logger.warning(f"Profiler sample failed: {e}")
+
+    def info(self) -> Dict[str, int]:
+        return {**self.stats, "active": len(self._active)}
+
+
+def _create_profiler() -> Optional[SamplingProfiler]:
+    if not settings.profiler_enabled:
+        return None
+    return SamplingProfiler(settings.profiler_interval_ms / 1000)
+
+
+profiler = _create_profiler()
@@ -0,0 +1,126 @@
+"""Compiled scene configuration: system prompts, prompt templates and supported models"""
+import json
+import os
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, Optional
+
+# langchain is imported when the first template is compiled, not when the settings load
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+
+
+@lru_cache(maxsize=256)
+def compile_chat_template(system_prompt: Optional[str] = None) -> "ChatPromptTemplate":
+    """Chat template of an optional system prompt, optional ``history`` and ``{user_input}``
+
+    The system prompt is sent verbatim, so braces in it (e.g. JSON examples)
+    are not treated as template variables. ``history`` is a list of
+    ``(role, text)`` messages placed between them for session turns; it is
+    left out when not given.
+    """
+    from langchain_core.messages import SystemMessage
+    from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder
+
+    messages = []
+    if system_prompt:
+        messages.append(SystemMessage(content=system_prompt))
+    messages.append(MessagesPlaceholder("history", optional=True))
+    messages.append(HumanMessagePromptTemplate.from_template("{user_input}"))
+    return ChatPromptTemplate.from_messages(messages)
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str, system_prompt: Optional[str] = None) -> "ChatPromptTemplate":
+    """Prompt template compiled from a format string, after an optional verbatim system prompt"""
+    from langchain_core.messages import SystemMessage
+    from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
+
+    if not system_prompt:
+        return ChatPromptTemplate.from_template(template)
+    return ChatPromptTemplate.from_messages([
+        SystemMessage(content=system_prompt),
+        HumanMessagePromptTemplate.from_template(template),
+    ])
+
+
+class SceneConfig:
+    """Immutable, validated snapshot of the scene and model configuration
+
+    Everything is parsed and validated when the snapshot is built, so a bad
+    config is rejected up front instead of failing requests. Templates are
+    compiled by ``precompile()`` (at warm-up and on reload) or on first use.
+    The settings swap in a new snapshot as a whole on reload; requests that
+    already hold the old one finish with it.
+    """
+
+    def __init__(self, prompts: Dict[str, str], models: Iterable[str], source: str = "env", version: int = 1):
+        if not isinstance(prompts, dict):
+            raise ValueError("system_prompts must be an object of scene id -> prompt")
+        for scene_id, prompt in prompts.items():
+            if not isinstance(prompt, str) or not prompt.strip():
+                raise ValueError(f"System prompt for scene '{scene_id}' must be a non-empty string")
+        if not isinstance(models, (list, tuple, set, frozenset)) or not all(isinstance(m, str) and m for m in models):
+            raise ValueError("supported_models must be a list of model names")
+
+        self.prompts: Dict[str, str] = dict(prompts)
+        self.models: FrozenSet[str] = frozenset(models)
+        # Keyed by prompt text, which is what providers receive
+        self._templates: Dict[Optional[str], "ChatPromptTemplate"] = {}
+        self.source = source
+        self.version = version
+        self.loaded_at = time.time()
+
+    @classmethod
+    def from_sources(cls, env_prompts: Dict[str, str], env_models: Iterable[str],
+                     config_file: str = "", version: int = 1) -> "SceneConfig":
+        """Build a snapshot from the environment, overridden by CONFIG_FILE when set
+
+        CONFIG_FILE is JSON with optional ``system_prompts`` and
+        ``supported_models`` keys; a missing key keeps the environment value.
+        """
+        if not config_file:
+            return cls(env_prompts, env_models, "env", version)
+        try:
+            with open(config_file, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Cannot load config file '{config_file}': {e}") from e
+        if not isinstance(data, dict):
+            raise ValueError(f"Config file '{config_file}' must contain a JSON object")
+        return cls(
+            data.get("system_prompts", env_prompts),
+            data.get("supported_models", env_models),
+            config_file,
+            version,
+        )
+
+    @staticmethod
+    def file_mtime(config_file: str) -> Optional[float]:
+        try:
+            return os.stat(config_file).st_mtime
+        except OSError:
+            return None
+
+    def get_prompt(self, scene_id: str) -> Optional[str]:
+        return self.prompts.get(scene_id)
+
+    def precompile(self) -> "SceneConfig":
+        """Compile the chat template of every scene (and of chat without a scene)"""
+        for prompt in (None, *self.prompts.values()):
+            self._templates[prompt] = compile_chat_template(prompt)
+        return self
+
+    def template_for(self, system_prompt: Optional[str]) -> "ChatPromptTemplate":
+        """Compiled chat template for a system prompt"""
+        template = self._templates.get(system_prompt or None)
+        return template if template is not None else compile_chat_template(system_prompt or None)
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "loaded_at": int(self.loaded_at),
+            "scenes": sorted(self.prompts),
+            "models": sorted(self.models),
+        }
@@ -0,0 +1,237 @@
+"""Server-side chat sessions: recent turns kept verbatim plus a rolling summary of older ones"""
+import json
+import secrets
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from core.cache import LRUCache, make_cache_key
+from core.config import settings
+from core.shared import SharedState, shared_state
+from utils.tokens import MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# session_id a request sends to start a conversation; the server issues the real id
+NEW_SESSION = "new"
+
+T = TypeVar("T")
+
+
+def turn_tokens(user: str, assistant: str) -> int:
+    """Estimated prompt tokens one turn adds when it is sent as history"""
+    return estimate_tokens(user) + estimate_tokens(assistant) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+class ChatSession:
+    """One conversation
+
+    ``turns`` holds the most recent ``[user, assistant, tokens]`` exchanges,
+    sent verbatim with the next request. When they outgrow the window the
+    oldest ones move to ``pending`` to be folded into ``summary`` (or are
+    dropped when summarization is off). ``folded`` counts the turns that are
+    no longer kept at all.
+    """
+
+    def __init__(
+            self,
+            turns: Optional[List[list]] = None,
+            pending: Optional[List[list]] = None,
+            summary: str = "",
+            folded: int = 0,
+            created_at: Optional[float] = None,
+            updated_at: Optional[float] = None,
+    ):
+        self.turns = turns or []
+        self.pending = pending or []
+        self.summary = summary
+        self.folded = folded
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+
+    @classmethod
+    def from_json(cls, data: str) -> "ChatSession":
+        return cls(**json.loads(data))
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "turns": self.turns,
+            "pending": self.pending,
+            "summary": self.summary,
+            "folded": self.folded,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }, ensure_ascii=False)
+
+    @property
+    def window_tokens(self) -> int:
+        return sum(turn[2] for turn in self.turns)
+
+    def add_turn(self, user: str, assistant: str, window_tokens: int, summarize: bool) -> None:
+        """Append a turn, sliding the window when it no longer fits"""
+        self.turns.append([user, assistant, turn_tokens(user, assistant)])
+        self.updated_at = time.time()
+        tokens = self.window_tokens
+        if tokens <= window_tokens:
+            return
+        # Slide by half a window at once rather than a turn at a time, so the
+        # history prefix stays the same (and upstream-cacheable) for the next turns
+        while self.turns and tokens > window_tokens // 2:
+            turn = self.turns.pop(0)
+            tokens -= turn[2]
+            if summarize:
+                self.pending.append(turn)
+            else:
+                self.folded += 1
+        # Turns waiting for a summary are kept up to one window's worth
+        pending_tokens = sum(turn[2] for turn in self.pending)
+        while self.pending and pending_tokens > window_tokens:
+            pending_tokens -= self.pending.pop(0)[2]
+            self.folded += 1
+
+    def fold(self, folded: int, count: int, summary: str) -> bool:
+        """Replace the first ``count`` pending turns by ``summary``
+
+        ``folded`` is the value the summary was started from; if the session
+        moved on since (another summary landed first), nothing changes.
+        """
+        if self.folded != folded or len(self.pending) < count:
+            return False
+        del self.pending[:count]
+        self.folded += count
+        self.summary = summary
+        return True
+
+    def history(self, budget: int) -> Tuple[List[Tuple[str, str]], int]:
+        """``(role, text)`` messages for the next prompt and their estimated tokens
+
+        The summary comes first, then as many of the most recent turns as fit
+        in ``budget``.
+        """
+        messages: List[Tuple[str, str]] = []
+        tokens = 0
+        if self.summary:
+            text = SUMMARY_PREFIX + self.summary
+            cost = estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+            if cost <= budget:
+                messages.append(("system", text))
+                tokens += cost
+        recent: List[Tuple[str, str]] = []
+        for user, assistant, cost in reversed(self.turns):
+            if tokens + cost > budget:
+                break
+            recent += [("ai", assistant), ("human", user)]
+            tokens += cost
+        return messages + recent[::-1], tokens
+
+
+class SessionStore:
+    """Chat sessions keyed by (user, session id)
+
+    Sessions are stored as JSON in an in-process LRU bounded by count and
+    bytes with an idle TTL or, with several workers, in the shared SQLite
+    state so that any worker can serve the next turn. Updates are atomic
+    read-modify-writes in both cases.
+    """
+
+    def __init__(self, shared: Optional[SharedState] = None):
+        self.shared = shared
+        self.memory = None if shared is not None else LRUCache(
+            max_size=settings.session_max_sessions,
+            ttl=settings.session_ttl,
+            sliding=True,
+            max_weight=settings.session_max_bytes,
+            weigher=lambda value: len(value.encode("utf-8")),
+        )
+        self.stats: Dict[str, int] = {"created": 0, "turns": 0, "summaries": 0, "summary_failures": 0}
+
+    @staticmethod
+    def _key(user_id: str, session_id: str) -> str:
+        # Another user's session with the same id is simply a different session
+        return make_cache_key("session", user_id, session_id)
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run one of the calls below, off the event loop when it goes to the shared state"""
+        if self.shared is not None:
+            return await self.shared.run(fn, *args)
+        return fn(*args)
+
+    def get(self, user_id: str, session_id: str) -> Optional[ChatSession]:
+        key = self._key(user_id, session_id)
+        if self.shared is not None:
+            data = self.shared.get_session(key, settings.session_ttl)
+        else:
+            data = self.memory.get(key)
+        return ChatSession.from_json(data) if data is not None else None
+
+    def _update(
+            self,
+            user_id: str,
+            session_id: str,
+            change: Callable[[ChatSession], bool],
+            create: bool = False,
+    ) -> Optional[ChatSession]:
+        """Apply ``change`` to a session atomically; it returns whether anything changed"""
+        result: Dict[str, ChatSession] = {}
+
+        def apply(data: Optional[str]) -> Optional[str]:
+            if data is None and not create:
+                return None
+            session = ChatSession.from_json(data) if data is not None else ChatSession()
+            result["session"] = session
+            if not change(session):
+                return None
+            if data is None:
+                self.stats["created"] += 1
+            return session.to_json()
+
+        key = self._key(user_id, session_id)
+        if self.shared is not None:
+            self.shared.update_session(key, apply, settings.session_ttl, settings.session_max_sessions)
+        else:
+            data = apply(self.memory.get(key))
+            if data is not None:
+                self.memory.set(key, data)
+        return result.get("session")
+
+    def create(self, user_id: str) -> str:
+        """Start an empty session under a new unguessable id and return the id
+
+        Ids are only ever issued here, so a client cannot pick (or guess)
+        the id of someone else's conversation.
+        """
+        session_id = secrets.token_urlsafe(24)
+        self._update(user_id, session_id, lambda session: True, create=True)
+        return session_id
+
+    def add_turn(self, user_id: str, session_id: str, user: str, assistant: str) -> Optional[ChatSession]:
+        """Record a finished turn; None if the session expired or was deleted meanwhile"""
+        def change(session: ChatSession) -> bool:
+            session.add_turn(user, assistant, settings.session_window_tokens, settings.session_summary)
+            return True
+
+        self.stats["turns"] += 1
+        return self._update(user_id, session_id, change)
+
+    def fold(self, user_id: str, session_id: str, folded: int, count: int, summary: str) -> bool:
+        session = self._update(user_id, session_id, lambda s: s.fold(folded, count, summary))
+        return session is not None and session.folded == folded + count
+
+    def delete(self, user_id: str, session_id: str) -> bool:
+        key = self._key(user_id, session_id)
+        if self.shared is not None:
+            return self.shared.delete_session(key)
+        return self.memory.pop(key) is not None
+
+    def info(self) -> Dict[str, Any]:
+        if self.shared is not None:
+            return {**self.stats, "shared": True}
+        return {**self.stats, "shared": False, "sessions": len(self.memory), "bytes": self.memory.weight}
+
+
+def _create_session_store() -> Optional[SessionStore]:
+    if not settings.sessions_enabled:
+        return None
+    return SessionStore(shared_state)
+
+
+session_store = _create_session_store()
@@ -0,0 +1,224 @@
+"""State shared by every worker process through a local SQLite file"""
+import asyncio
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Buckets idle this long are full again and can be dropped
+BUCKET_IDLE_SECONDS = 120.0
+PURGE_EVERY = 1000
+
+T = TypeVar("T")
+
+
+class SharedState:
+    """Token buckets, in-flight leases, coalesced results and chat sessions shared across worker processes
+
+    Every operation is a short transaction on a WAL-mode SQLite file, so
+    workers on the same host see one set of rate limits and one owner per
+    in-flight upstream call without running a separate service. Times are
+    wall-clock seconds because monotonic clocks are per process.
+
+    Calls block while another worker holds the write lock (at most
+    SHARED_STATE_BUSY_TIMEOUT), so async code runs them through ``run``,
+    which keeps the event loop serving other requests meanwhile.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._calls = 0
+        # Calls are serialized on the one connection anyway, so one thread is enough
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="uniai-shared")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at)")
+        # Generous while creating the schema above, short for request-path calls
+        self._conn.execute(f"PRAGMA busy_timeout = {int(settings.shared_state_busy_timeout * 1000)}")
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run one of the blocking calls below off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args))
+
+    def take_tokens(self, charges: List[Tuple[str, float, float]]) -> float:
+        """Charge ``(bucket key, per-minute budget, amount)`` to every bucket or to none
+
+        Same arithmetic as the in-process TokenBucket: a bucket holds up to
+        one minute of budget and refills continuously. Returns 0 when the
+        charge was made, otherwise the seconds until it would fit.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                wait = 0.0
+                levels = []
+                for key, per_minute, amount in charges:
+                    rate = per_minute / 60.0
+                    row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                    tokens = per_minute if row is None else min(per_minute, row[0] + (now - row[1]) * rate)
+                    amount = min(amount, per_minute)
+                    if tokens < amount:
+                        wait = max(wait, (amount - tokens) / rate)
+                    levels.append((key, tokens - amount))
+                if wait == 0:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                        [(key, tokens, now) for key, tokens in levels],
+                    )
+                self._calls += 1
+                if self._calls % PURGE_EVERY == 0:
+                    self._conn.execute("DELETE FROM buckets WHERE updated < ?", (now - BUCKET_IDLE_SECONDS,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        """Become the worker making the call for key, unless a live lease is held by another"""
+        now = time.time()
+        with self._lock:
+            return self._conn.execute(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at <= ? OR leases.owner = excluded.owner",
+                (key, self.owner, now + ttl, now),
+            ).rowcount == 1
+
+    def lease_held(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row is not None
+
+    def release_lease(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def publish_result(self, key: str, data: str, ttl: float) -> None:
+        """Hand the result of a coalesced call to workers waiting on its lease"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, data, expires_at) VALUES (?, ?, ?)", (key, data, now + ttl)
+            )
+            self._calls += 1
+            if self._calls % PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+
+    def get_result(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM results WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def get_session(self, key: str, ttl: float) -> Optional[str]:
+        """Session data, refreshing its idle expiry; None when absent or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE sessions SET expires_at = ? WHERE key = ? AND expires_at > ? RETURNING data",
+                (now + ttl, key, now),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def update_session(
+            self,
+            key: str,
+            update: Callable[[Optional[str]], Optional[str]],
+            ttl: float,
+            max_sessions: int,
+    ) -> Optional[str]:
+        """Read-modify-write a session in one transaction, so concurrent turns are not lost
+
+        ``update`` gets the current data (None when absent or expired) and
+        returns the new data, or None to leave it as is. Creating a session
+        drops expired ones and the least recently used beyond
+        ``max_sessions``. Returns the data now stored.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT data FROM sessions WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                current = row[0] if row is not None else None
+                data = update(current)
+                if data is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO sessions (key, data, expires_at) VALUES (?, ?, ?)",
+                        (key, data, now + ttl),
+                    )
+                    if current is None:
+                        self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+                        self._conn.execute(
+                            "DELETE FROM sessions WHERE key IN "
+                            "(SELECT key FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                            (max_sessions,),
+                        )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return data if data is not None else current
+
+    def delete_session(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM sessions WHERE key = ?", (key,)).rowcount == 1
+
+    def info(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            buckets = self._conn.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+            leases = self._conn.execute("SELECT COUNT(*) FROM leases WHERE expires_at > ?", (now,)).fetchone()[0]
+            results = self._conn.execute("SELECT COUNT(*) FROM results WHERE expires_at > ?", (now,)).fetchone()[0]
+            sessions = self._conn.execute("SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (now,)).fetchone()[0]
+        return {
+            "path": self.path, "owner": self.owner, "buckets": buckets, "leases": leases,
+            "results": results, "sessions": sessions,
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            self._conn.close()
+
+
+def _create_shared_state() -> Optional[SharedState]:
+    if not settings.shared_state_enabled:
+        return None
+    return SharedState(settings.shared_state_path)
+
+
+shared_state = _create_shared_state()
@@ -0,0 +1,142 @@
+"""Single-flight coalescing of identical in-flight calls"""
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+from core.config import settings
+from core.shared import shared_state
+from core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class Codec(NamedTuple):
+    """Turns a call's result into text other workers can read, and back"""
+    encode: Callable[[Any], str]
+    decode: Callable[[str], Any]
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its result.
+
+    The first caller for a key (the leader) starts the call in its own task;
+    callers that arrive while it is still running wait on the same task.
+    The task is shielded, so a waiter disconnecting does not cancel the call
+    for everyone else.
+
+    With several workers, the leader also takes a lease on the key in the
+    shared state. If another worker already holds it, the leader waits for
+    that lease to go away and then picks up that worker's result before
+    making the call itself: through ``recheck`` (typically an async shared
+    response cache lookup) or, for calls that are not cached, from the shared state,
+    where the leader publishes its result encoded with ``codec``.
+    """
+
+    # After a shared state failure, coalesce within this worker only for this long
+    SHARED_RETRY_AFTER = 1.0
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._shared_down_until = 0.0
+        self.stats: Dict[str, int] = {"leaders": 0, "coalesced": 0, "peer_waits": 0, "peer_hits": 0}
+
+    async def do(
+            self,
+            key: Optional[str],
+            fn: Callable[[], Awaitable[Any]],
+            recheck: Optional[Callable[[], Awaitable[Any]]] = None,
+            codec: Optional[Codec] = None,
+    ) -> Any:
+        if key is None:
+            return await fn()
+
+        task = self._calls.get(key)
+        with span("single_flight", leader=task is None):
+            if task is None:
+                task = asyncio.ensure_future(self._lead(key, fn, recheck, codec))
+                self._calls[key] = task
+                task.add_done_callback(lambda done: self._forget(key, done))
+                self.stats["leaders"] += 1
+            else:
+                self.stats["coalesced"] += 1
+            return await asyncio.shield(task)
+
+    async def _lead(
+            self,
+            key: str,
+            fn: Callable[[], Awaitable[Any]],
+            recheck: Optional[Callable[[], Awaitable[Any]]],
+            codec: Optional[Codec],
+    ) -> Any:
+        if shared_state is None or (recheck is None and codec is None):
+            return await fn()
+
+        try:
+            leased = await shared_state.run(self._acquire, key)
+            if leased is None:
+                return await fn()
+            if not leased:
+                # Another worker is making this call: wait for it, then use its result
+                self.stats["peer_waits"] += 1
+                with span("peer_wait"):
+                    while await shared_state.run(shared_state.lease_held, key):
+                        await asyncio.sleep(settings.lease_poll_interval)
+                result = await recheck() if recheck is not None else await self._published(key, codec)
+                if result is not None:
+                    self.stats["peer_hits"] += 1
+                    return result
+                leased = await shared_state.run(self._acquire, key)
+        except sqlite3.Error as e:
+            # Coalescing is an optimisation; never fail the call over it
+            logger.warning(f"Shared lease for single-flight failed: {e}")
+            return await fn()
+
+        try:
+            result = await fn()
+            if recheck is None:
+                # Nothing else carries the result to other workers; publish it before releasing the lease
+                try:
+                    await shared_state.run(
+                        shared_state.publish_result, key, codec.encode(result), max(5.0, 10 * settings.lease_poll_interval)
+                    )
+                except sqlite3.Error as e:
+                    logger.warning(f"Publishing single-flight result failed: {e}")
+            return result
+        finally:
+            if leased:
+                try:
+                    await shared_state.run(shared_state.release_lease, key)
+                except sqlite3.Error as e:
+                    # The lease expires by itself after REQUEST_DEADLINE
+                    logger.warning(f"Releasing shared single-flight lease failed: {e}")
+
+    def _acquire(self, key: str) -> Optional[bool]:
+        """Take the shared lease on key; None while the shared state is being left alone after a failure"""
+        # Checked when the call gets its turn, so calls queued behind a failing one do not wait too
+        if time.monotonic() < self._shared_down_until:
+            return None
+        try:
+            return shared_state.acquire_lease(key, settings.request_deadline)
+        except sqlite3.Error:
+            self._shared_down_until = time.monotonic() + self.SHARED_RETRY_AFTER
+            raise
+
+    @staticmethod
+    async def _published(key: str, codec: Codec) -> Any:
+        data = await shared_state.run(shared_state.get_result, key)
+        return codec.decode(data) if data is not None else None
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def info(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": len(self._calls)}
+
+
+singleflight = SingleFlight()
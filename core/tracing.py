@@ -0,0 +1,190 @@
+"""Per-request traces: request ids, timing spans and a ring buffer of slow or requested traces"""
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+
+MAX_SPANS = 256
+# Distinct folded stacks kept per profile; further samples are counted under OTHER_STACKS
+MAX_STACKS = 1000
+OTHER_STACKS = "[other stacks]"
+# Request ids that are safe to echo in a header and to look up
+_REQUEST_ID = re.compile(r"^[\x21-\x7e]{1,128}$")
+
+# Trace of the request being served, set by TracingMiddleware
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_parent_span: ContextVar[int] = ContextVar("parent_span", default=-1)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_request_id(value: Any) -> bool:
+    return isinstance(value, str) and _REQUEST_ID.match(value) is not None
+
+
+class Trace:
+    """Spans (and, with the profiler on, stack samples) of one request
+
+    Spans are ``[name, parent index, start ms, duration ms, attributes]``
+    relative to the start of the request; a span still open when the
+    request ends has no duration.
+    """
+
+    def __init__(self, request_id: str, method: str, path: str, debug: bool = False):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.debug = debug
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.status: Optional[int] = None
+        self.duration_ms: Optional[float] = None
+        self.spans: List[list] = []
+        # Folded stack -> samples while this request's code was running on the event loop
+        self.stacks: Dict[str, int] = {}
+        # Samples taken while the event loop was running something else
+        self.other_samples = 0
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def add_sample(self, stack: str) -> None:
+        if stack not in self.stacks and len(self.stacks) >= MAX_STACKS:
+            stack = OTHER_STACKS
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def finish(self, status: Optional[int]) -> None:
+        self.status = status
+        self.duration_ms = round(self.elapsed_ms(), 3)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "started_at": round(self.started_at, 3),
+            "debug": self.debug,
+            "spans": len(self.spans),
+            "samples": sum(self.stacks.values()),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **self.summary(),
+            "spans": [
+                {"name": name, "parent": parent, "start_ms": start, "duration_ms": duration, **(attrs or {})}
+                for name, parent, start, duration, attrs in self.spans
+            ],
+            "profile": {
+                "interval_ms": settings.profiler_interval_ms,
+                "samples": sum(self.stacks.values()),
+                "other_samples": self.other_samples,
+                "stacks": [
+                    {"stack": stack, "count": count}
+                    for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])
+                ],
+            } if settings.profiler_enabled else None,
+        }
+
+    def folded(self) -> str:
+        """Profile in the folded-stack format read by flamegraph.pl and speedscope"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class span:
+    """Time a block as a span of the current request: ``with span("cache_lookup"): ...``
+
+    Does nothing outside a traced request. Spans opened inside the block
+    (including in tasks it starts) are recorded as its children.
+    """
+
+    __slots__ = ("name", "attrs", "_trace", "_index", "_token", "_started")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._trace = None
+
+    def __enter__(self):
+        trace = current_trace.get()
+        if trace is not None and len(trace.spans) < MAX_SPANS:
+            self._trace = trace
+            self._started = time.perf_counter()
+            self._index = len(trace.spans)
+            start_ms = round((self._started - trace._started) * 1000, 3)
+            trace.spans.append([self.name, _parent_span.get(), start_ms, None, self.attrs or None])
+            self._token = _parent_span.set(self._index)
+        return self
+
+    def set(self, **attrs) -> None:
+        """Add attributes, e.g. an outcome known only at the end of the block"""
+        if self._trace is not None:
+            entry = self._trace.spans[self._index]
+            entry[4] = {**(entry[4] or {}), **attrs}
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._trace is not None:
+            self._trace.spans[self._index][3] = round((time.perf_counter() - self._started) * 1000, 3)
+            if exc_type is not None:
+                self.set(error=exc_type.__name__)
+            _parent_span.reset(self._token)
+            self._trace = None
+        return False
+
+
+def set_request_id(scope, request_id: Any) -> None:
+    """Adopt the client's request_id (e.g. from the body) for the current request"""
+    if not valid_request_id(request_id):
+        return
+    scope.setdefault("state", {})["request_id"] = request_id
+    trace = current_trace.get()
+    if trace is not None:
+        trace.request_id = request_id
+
+
+class TraceStore:
+    """Ring buffer of finished traces worth keeping: slow ones and those asked for"""
+
+    def __init__(self, size: int):
+        self._traces: "deque[Trace]" = deque(maxlen=max(size, 1))
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"traced": 0, "slow": 0, "debug": 0}
+
+    def finish(self, trace: Trace) -> bool:
+        """Count a finished trace and keep it if it is slow or was requested; returns whether kept"""
+        slow = trace.duration_ms is not None and trace.duration_ms >= settings.trace_slow_ms
+        with self._lock:
+            self.stats["traced"] += 1
+            if not slow and not trace.debug:
+                return False
+            self.stats["slow" if slow else "debug"] += 1
+            self._traces.append(trace)
+        return True
+
+    def get(self, request_id: str) -> Optional[Trace]:
+        """Most recent kept trace with this request id"""
+        with self._lock:
+            for trace in reversed(self._traces):
+                if trace.request_id == request_id:
+                    return trace
+        return None
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = list(self._traces)[-limit:]
+        return [trace.summary() for trace in reversed(traces)]
+
+    def info(self) -> Dict[str, Any]:
+        return {**self.stats, "kept": len(self._traces), "capacity": self._traces.maxlen}
+
+
+trace_store = TraceStore(settings.trace_buffer_size)
@@ -1,16 +1,52 @@
+import asyncio
 import os
-import uvicorn
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from api.v1 import chat, schedule
+from api import metrics
+from api.v1 import admin, chat, jobs, schedule
+from core.config import settings
 from core.exceptions import UniAIException
-from middleware import exception_handler
+from core.jobs import job_queue
+from core.profiler import profiler
+from middleware import AdmissionMiddleware, MetricsMiddleware, TracingMiddleware, exception_handler
+from providers.registry import registry
+from services.warmup import warmup
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sampling profiler for slow or debug-flagged requests (PROFILER_ENABLED)
+    if profiler is not None:
+        profiler.install(asyncio.get_running_loop())
+    # Providers are imported lazily; load them and build clients/chains before the first request
+    if settings.startup_warmup:
+        warmup()
+    # Pick up CONFIG_FILE edits without restarting workers
+    watcher = None
+    if settings.config_file and settings.config_reload_interval > 0:
+        watcher = asyncio.create_task(settings.watch_config_file())
+    # Background job workers; jobs left running by a previous process are requeued
+    if settings.jobs_enabled:
+        await job_queue.start()
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    if settings.jobs_enabled:
+        await job_queue.stop()
+    # Release pooled upstream connections
+    await registry.aclose()
+    if profiler is not None:
+        profiler.uninstall()
+
 
 app = FastAPI(
     title="UniAI",
     description="Universal AI Backend Platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -22,6 +58,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Rate limits and priority queueing for model calls
+app.add_middleware(AdmissionMiddleware)
+
+# Request ids and timing spans; outside admission so queueing time is traced
+app.add_middleware(TracingMiddleware)
+
+# Outermost, so rejected and failed requests are counted too
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 # Add exception handlers
 app.add_exception_handler(UniAIException, exception_handler)
 app.add_exception_handler(Exception, exception_handler)
@@ -29,6 +75,11 @@ app.add_exception_handler(Exception, exception_handler)
 # Include routers
 app.include_router(chat.router, prefix="/api/v1")
 app.include_router(schedule.router, prefix="/api/v1")
+if settings.jobs_enabled:
+    app.include_router(jobs.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
+if settings.metrics_enabled:
+    app.include_router(metrics.router)
 
 
 @app.get("/")
@@ -41,5 +92,11 @@ def health_check():
     return {"status": "healthy", "version": "1.0.0"}
 
 if __name__ == "__main__":
+    import uvicorn
+
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    if settings.workers > 1:
+        # Each worker imports the app itself; `kill -HUP <pid>` restarts them one by one
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=settings.workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
@@ -1,4 +1,7 @@
 """Middleware modules"""
+from .admission import AdmissionMiddleware, admission
 from .exception_handler import exception_handler
+from .metrics import MetricsMiddleware
+from .tracing import TracingMiddleware
 
-__all__ = ["exception_handler"]
\ No newline at end of file
+__all__ = ["AdmissionMiddleware", "MetricsMiddleware", "TracingMiddleware", "admission", "exception_handler"]
\ No newline at end of file
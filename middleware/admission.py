@@ -0,0 +1,359 @@
+"""Admission control: per-user/per-role token buckets and a priority-queued concurrency cap"""
+import asyncio
+import heapq
+import hmac
+import itertools
+import logging
+import math
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.cache import LRUCache
+from core.config import settings
+from core.tracing import set_request_id, span
+from core.shared import shared_state
+from utils.fast_json import dumps_bytes, loads
+from utils.time_utils import get_current_timestamp
+from utils.tokens import estimate_chat_tokens, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Rough completion size assumed for schedule planning when estimating tokens
+SCHEDULE_COMPLETION_TOKENS = 2048
+
+
+class TokenBucket:
+    """Classic token bucket holding up to one minute of budget"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` tokens are available (0 when they are now)"""
+        self._refill(now)
+        # A single request larger than the whole bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Request and token budgets per user and per role
+
+    A request is admitted only when every bucket it draws from has room, and
+    then it is charged to all of them at once; otherwise nothing is charged
+    and the longest wait is returned for Retry-After. With several workers
+    the buckets live in the shared state, so limits hold across processes;
+    if the shared state cannot be reached in time the request is admitted.
+    """
+
+    # After a shared state failure, admit without asking it for this long
+    SHARED_RETRY_AFTER = 1.0
+
+    def __init__(self):
+        self.shared_errors = 0
+        self._shared_down_until = 0.0
+        self._lock = threading.Lock()
+        # Idle users' buckets are full again after a minute, so they can be dropped
+        self._buckets = LRUCache(max_size=settings.admission_max_users, ttl=120.0, sliding=True)
+
+    def _bucket(self, key: Tuple[str, str, str], per_minute: int) -> Optional[TokenBucket]:
+        if per_minute <= 0:
+            return None
+        return self._buckets.get_or_create(key, lambda: TokenBucket(per_minute))
+
+    def _plan(self, user: str, role: str, requests: int, tokens: int) -> List[Tuple[TokenBucket, int]]:
+        limits = settings.get_role_limits(role)
+        plan = [
+            (self._bucket(("user", user, "requests"), limits["user_requests_per_minute"]), requests),
+            (self._bucket(("user", user, "tokens"), limits["user_tokens_per_minute"]), tokens),
+            (self._bucket(("role", role, "requests"), limits["requests_per_minute"]), requests),
+            (self._bucket(("role", role, "tokens"), limits["tokens_per_minute"]), tokens),
+        ]
+        return [(bucket, amount) for bucket, amount in plan if bucket is not None]
+
+    @staticmethod
+    def _shared_charges(user: str, role: str, requests: int, tokens: int) -> List[Tuple[str, float, float]]:
+        limits = settings.get_role_limits(role)
+        charges = [
+            (f"user:{user}:requests", limits["user_requests_per_minute"], requests),
+            (f"user:{user}:tokens", limits["user_tokens_per_minute"], tokens),
+            (f"role:{role}:requests", limits["requests_per_minute"], requests),
+            (f"role:{role}:tokens", limits["tokens_per_minute"], tokens),
+        ]
+        return [charge for charge in charges if charge[1] > 0]
+
+    def _take_shared(self, charges: List[Tuple[str, float, float]]) -> float:
+        # Checked when the call gets its turn, so calls queued behind a failing one do not wait too
+        if time.monotonic() < self._shared_down_until:
+            return 0.0
+        try:
+            return shared_state.take_tokens(charges)
+        except sqlite3.Error:
+            self._shared_down_until = time.monotonic() + self.SHARED_RETRY_AFTER
+            raise
+
+    async def acquire(self, user: str, role: str, requests: int, tokens: int) -> float:
+        """Charge the buckets and return 0, or return the seconds to wait"""
+        if shared_state is not None:
+            charges = self._shared_charges(user, role, requests, tokens)
+            if not charges:
+                return 0.0
+            try:
+                return await shared_state.run(self._take_shared, charges)
+            except sqlite3.Error as e:
+                # Fail open: a busy shared state must not take the service down with it
+                self.shared_errors += 1
+                logger.warning(f"Shared rate limit unavailable, admitting requests for {self.SHARED_RETRY_AFTER}s: {e}")
+                return 0.0
+        with self._lock:
+            plan = self._plan(user, role, requests, tokens)
+            now = time.monotonic()
+            wait = max((bucket.wait_time(amount, now) for bucket, amount in plan), default=0.0)
+            if wait > 0:
+                return wait
+            for bucket, amount in plan:
+                bucket.take(amount)
+            return 0.0
+
+
+class PriorityLimiter:
+    """Global concurrency cap whose waiters are served lowest priority value first"""
+
+    def __init__(self, limit: int, queue_size: int):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    async def acquire(self, priority: int, timeout: float) -> Optional[str]:
+        """Take a slot, queueing by priority for at most ``timeout`` seconds
+
+        Returns None once a slot is held, otherwise why it was refused
+        ("queue_full" or "queue_timeout").
+        """
+        if self.limit <= 0:
+            return None
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return None
+        if self.queued >= self.queue_size:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return None
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up
+                self.release()
+            waiter.cancel()
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            waiter.cancel()
+            raise
+
+    def release(self) -> None:
+        if self.limit <= 0:
+            return
+        # Hand the slot straight to the best waiter that is still waiting
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionController:
+    """Rate limits plus concurrency cap, shared by every AdmissionMiddleware"""
+
+    def __init__(self):
+        self.rate_limiter = RateLimiter()
+        self.limiter = PriorityLimiter(settings.max_concurrent_requests, settings.admission_queue_size)
+        self.stats: Dict[str, int] = {"admitted": 0, "rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "active": self.limiter.active,
+            "queued": self.limiter.queued,
+            "max_concurrent": self.limiter.limit,
+            "shared_errors": self.rate_limiter.shared_errors,
+        }
+
+
+admission = AdmissionController()
+
+
+def _chat_cost(item: Dict[str, Any]) -> int:
+    """Estimated prompt tokens plus the completion budget of one chat request"""
+    parameters = item.get("parameters") if isinstance(item.get("parameters"), dict) else {}
+    prompt_id = parameters.get("prompt_id")
+    system_prompt = settings.get_prompt(prompt_id) if isinstance(prompt_id, str) else None
+    max_tokens = parameters.get("max_tokens", 100)
+    # A session request also carries up to a window of earlier turns
+    history = settings.session_window_tokens if item.get("session_id") else 0
+    return estimate_chat_tokens(str(parameters.get("prompt", "")), system_prompt) + history \
+        + (max_tokens if isinstance(max_tokens, int) else 100)
+
+
+def _verified_role(headers: Dict[str, str]) -> Optional[str]:
+    """The role whose ROLE_TOKENS entry matches the X-Role-Token header, if any"""
+    token = headers.get("x-role-token")
+    if not token:
+        return None
+    for role, expected in settings.role_tokens.items():
+        if expected and hmac.compare_digest(token, str(expected)):
+            return role
+    return None
+
+
+def describe_request(path: str, body: Dict[str, Any], headers: Dict[str, str], client: Optional[str]):
+    """Work out (user, role, request count, estimated tokens, is_batch) for a request body
+
+    Neither the body's user_info nor the X-User-Id / X-User-Role headers are
+    authenticated, so only a caller presenting a ROLE_TOKENS token gets that
+    role and has its user_info.user_id (else X-User-Id) trusted. Everyone else
+    is a "user" limited by client address, whatever role or id it claims.
+    """
+    is_batch = path.endswith("/batch")
+    items = body.get("requests") if is_batch and isinstance(body.get("requests"), list) else [body]
+    items = [item for item in items if isinstance(item, dict)] or [{}]
+
+    role = _verified_role(headers)
+    if role is None:
+        role, user = "user", str(client or "anonymous")
+    else:
+        user_info = items[0].get("user_info") if isinstance(items[0].get("user_info"), dict) else {}
+        user = str(user_info.get("user_id") or headers.get("x-user-id") or client or "anonymous")
+
+    if "/schedule/" in path:
+        tokens = estimate_tokens(str(body.get("prompt", ""))) + SCHEDULE_COMPLETION_TOKENS
+    else:
+        tokens = sum(_chat_cost(item) for item in items)
+    return user, role, len(items), tokens, is_batch
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting model calls by rate limits and priority
+
+    Only POST requests under ``/api/v1`` (except admin) are controlled. The
+    body is read once to find the caller and estimate its cost, then replayed
+    to the app. Rejections are 429 responses with a Retry-After header.
+    """
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    @staticmethod
+    def _controlled(scope) -> bool:
+        path = scope.get("path", "")
+        return (
+            settings.admission_enabled
+            and scope["type"] == "http"
+            and scope.get("method") == "POST"
+            and path.startswith("/api/v1/")
+            and not path.startswith("/api/v1/admin")
+        )
+
+    async def __call__(self, scope, receive, send):
+        if not self._controlled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        messages, chunks = [], []
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+
+        try:
+            body = loads(b"".join(chunks) or b"{}")
+        except ValueError:
+            body = {}
+        if not isinstance(body, dict):
+            body = {}
+        set_request_id(scope, body.get("request_id"))
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        client = scope["client"][0] if scope.get("client") else None
+        user, role, requests, tokens, is_batch = describe_request(scope["path"], body, headers, client)
+
+        controller = self.controller
+        with span("admission", user=user, role=role, tokens=tokens) as admission_span:
+            wait = await controller.rate_limiter.acquire(user, role, requests, tokens)
+            if wait > 0:
+                admission_span.set(outcome="rate_limited")
+                controller.stats["rate_limited"] += 1
+                await self._reject(send, body, f"Rate limit exceeded for user '{user}'", wait)
+                return
+
+            priority = settings.get_role_priority(role)
+            if is_batch:
+                priority = max(priority, settings.get_role_priority("batch"))
+            # Time spent here is queueing behind the concurrency cap
+            refused = await controller.limiter.acquire(priority, settings.admission_queue_timeout)
+            admission_span.set(outcome=refused or "admitted")
+        if refused is not None:
+            controller.stats[refused] += 1
+            await self._reject(send, body, "Server is busy, please retry later", 1.0)
+            return
+
+        controller.stats["admitted"] += 1
+        pending = list(messages)
+
+        async def replay():
+            if pending:
+                return pending.pop(0)
+            return await receive()
+
+        try:
+            await self.app(scope, replay, send)
+        finally:
+            controller.limiter.release()
+
+    @staticmethod
+    async def _reject(send, body: Dict[str, Any], message: str, retry_after: float) -> None:
+        payload = dumps_bytes({
+            "code": 429,
+            "message": message,
+            "request_id": str(body.get("request_id", "unknown")),
+            "timestamp": get_current_timestamp(),
+        })
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
@@ -2,15 +2,15 @@
 import logging
 
 from fastapi import Request, HTTPException
-from fastapi.responses import JSONResponse
 
 from core.exceptions import UniAIException
+from utils.fast_json import FastJSONResponse
 from utils.time_utils import get_current_timestamp
 
 logger = logging.getLogger(__name__)
 
 
-async def exception_handler(request: Request, exc: Exception) -> JSONResponse:
+async def exception_handler(request: Request, exc: Exception) -> FastJSONResponse:
     """Unified exception handler"""
 
     # Get request ID (if exists)
@@ -18,8 +18,8 @@ async def exception_handler(request: Request, exc: Exception) -> JSONResponse:
 
     if isinstance(exc, UniAIException):
         # Custom exception
-        logger.warning(f"UniAI Exception: {exc.message}")
-        return JSONResponse(
+        logger.warning(f"UniAI Exception [{request_id}]: {exc.message}")
+        return FastJSONResponse(
             status_code=exc.code,
             content={
                 "code": exc.code,
@@ -31,8 +31,8 @@ async def exception_handler(request: Request, exc: Exception) -> JSONResponse:
 
     elif isinstance(exc, HTTPException):
         # FastAPI HTTP exception
-        logger.warning(f"HTTP Exception: {exc.detail}")
-        return JSONResponse(
+        logger.warning(f"HTTP Exception [{request_id}]: {exc.detail}")
+        return FastJSONResponse(
             status_code=exc.status_code,
             content={
                 "code": exc.status_code,
@@ -44,8 +44,8 @@ async def exception_handler(request: Request, exc: Exception) -> JSONResponse:
 
     else:
         # Unknown exception
-        logger.error(f"Unexpected error: {str(exc)}", exc_info=True)
-        return JSONResponse(
+        logger.error(f"Unexpected error [{request_id}]: {str(exc)}", exc_info=True)
+        return FastJSONResponse(
             status_code=500,
             content={
                 "code": 500,
@@ -0,0 +1,94 @@
+"""Request metrics middleware"""
+import time
+from typing import List, Optional, Pattern, Set, Tuple
+
+from starlette.routing import compile_path
+
+try:
+    from fastapi.routing import iter_route_contexts
+except ImportError:
+    # FastAPI versions that flatten included routers into app.routes
+    iter_route_contexts = None
+
+from core.metrics import (
+    HTTP_IN_FLIGHT,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    RESPONSE_CACHE,
+    current_route,
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording count, latency and in-flight requests per route
+
+    Requests are labelled with the path template of the route they match
+    (``/api/v1/schedule/jobs/{job_id}``), so ids in paths do not become
+    labels; paths that match no route are grouped under "other" to keep label
+    cardinality bounded. The response cache outcome is read from the
+    ``X-Cache`` header, and the route label is published to ``current_route``
+    for stage timings further down the stack.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # Route paths without parameters, and (regex, template) of those with them
+        self._static: Optional[Set[str]] = None
+        self._templates: List[Tuple[Pattern, str]] = []
+
+    def _load_routes(self, app) -> None:
+        routes = getattr(app, "routes", [])
+        if iter_route_contexts is not None:
+            routes = iter_route_contexts(routes)
+        static = set()
+        for route in routes:
+            path = getattr(route, "path", None)
+            if not path:
+                continue
+            regex, template, convertors = compile_path(path)
+            if convertors:
+                self._templates.append((regex, template))
+            else:
+                static.add(path)
+        self._static = static
+
+    def _route(self, scope) -> str:
+        if self._static is None:
+            self._load_routes(scope.get("app"))
+        path = scope.get("path", "")
+        if path in self._static:
+            return path
+        for regex, template in self._templates:
+            if regex.match(path):
+                return template
+        return "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route(scope)
+        method = scope.get("method", "GET")
+        token = current_route.set(route)
+        in_flight = HTTP_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"x-cache":
+                        RESPONSE_CACHE.labels(route, value.decode("latin-1")).inc()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            in_flight.dec()
+            HTTP_REQUESTS.labels(route, method, str(status)).inc()
+            HTTP_REQUEST_SECONDS.labels(route, method).observe(time.perf_counter() - started)
+            current_route.reset(token)
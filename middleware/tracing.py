@@ -0,0 +1,77 @@
+"""Request tracing middleware"""
+import hmac
+import logging
+
+from core.config import settings
+from core.profiler import profiler
+from core.tracing import Trace, current_trace, new_request_id, trace_store, valid_request_id
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-uniai-profile"
+
+
+class TracingMiddleware:
+    """ASGI middleware giving every request an id and a trace of timing spans
+
+    The id is the client's ``X-Request-Id`` header if it sent a usable one,
+    otherwise a new one; the body's ``request_id`` replaces it once the
+    admission middleware has read the body. It is exposed as
+    ``request.state.request_id`` and echoed in the ``X-Request-Id`` response
+    header. Traces slower than TRACE_SLOW_MS, and those asked for with an
+    ``X-UniAI-Profile`` header carrying ADMIN_TOKEN (ignored while none is
+    set), are logged and kept for the admin trace endpoints.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _debug(value: bytes) -> bool:
+        return bool(settings.admin_token) and hmac.compare_digest(value.decode("latin-1"), settings.admin_token)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id, debug = None, False
+        for name, value in scope.get("headers", []):
+            name = name.lower()
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+            elif name == PROFILE_HEADER:
+                debug = self._debug(value)
+        if not valid_request_id(request_id):
+            request_id = new_request_id()
+
+        scope.setdefault("state", {})["request_id"] = request_id
+        trace = Trace(request_id, scope.get("method", "GET"), scope.get("path", ""), debug)
+        token = current_trace.set(trace)
+        if profiler is not None:
+            profiler.start(trace)
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", trace.request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            if profiler is not None:
+                profiler.stop(trace)
+            current_trace.reset(token)
+            trace.finish(status)
+            if trace_store.finish(trace) and not trace.debug:
+                slowest = sorted((s for s in trace.spans if s[3] is not None), key=lambda s: -s[3])[:3]
+                spans = ", ".join(f"{name}={duration:.0f}ms" for name, _, _, duration, _ in slowest)
+                logger.warning(
+                    f"Slow request {trace.method} {trace.path} {trace.duration_ms:.0f}ms "
+                    f"request_id={trace.request_id}" + (f" slowest spans: {spans}" if spans else "")
+                )
@@ -1,8 +1,10 @@
-from .request import ChatRequest, Parameters, UserInfo
-from .response import ChatResponse, ChatResponseData, Model, Usage, ErrorResponse
+from .request import BatchChatRequest, ChatRequest, Parameters, UserInfo
+from .response import ChatResponse, ChatResponseData, Model, Usage, ErrorResponse, BatchChatItem, BatchChatResponse
+from .response import SessionInfo, SessionTurn
 from .schedule import Event, ScheduleRequest, ScheduleResponse
 
 __all__ = [
+    "BatchChatRequest",
     "ChatRequest",
     "Parameters",
     "UserInfo",
@@ -11,6 +13,10 @@ __all__ = [
     "Model",
     "Usage",
     "ErrorResponse",
+    "BatchChatItem",
+    "BatchChatResponse",
+    "SessionInfo",
+    "SessionTurn",
     "Event",
     "ScheduleRequest",
     "ScheduleResponse"
@@ -1,8 +1,9 @@
-from typing import Optional
+from typing import Any, List, Optional
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, field_validator, model_validator
 
 from core.config import settings
+from core.metrics import stage
 
 
 class Parameters(BaseModel):
@@ -43,9 +44,58 @@ class ChatRequest(BaseModel):
     parameters: Parameters
     user_info: UserInfo
     request_id: str
+    stream: bool = False
+    session_id: Optional[str] = None  # "new" starts a server-side conversation, whose issued id continues it
+
+    @field_validator('session_id')
+    @classmethod
+    def validate_session_id(cls, v):
+        if v is None:
+            return v
+        if not settings.sessions_enabled:
+            raise ValueError("Sessions are disabled")
+        if not 1 <= len(v) <= 128:
+            raise ValueError("Session id must be 1 to 128 characters")
+        return v
+
+    @model_validator(mode='wrap')
+    @classmethod
+    def time_validation(cls, data, handler):
+        """Record validation (including Parameters) as the "validation" stage"""
+        with stage("validation"):
+            return handler(data)
 
     @field_validator('model')
     def validate_model(v):
-        if hasattr(settings, 'models') and v not in settings.models:
+        if not settings.is_model_supported(v):
             raise ValueError(f"Model '{v}' not found")
         return v
+
+
+class BatchChatRequest(BaseModel):
+    # Items are validated one by one when the batch runs, so an invalid item fails alone
+    requests: List[Any]
+    request_id: str
+    concurrency: Optional[int] = None
+
+    @model_validator(mode='wrap')
+    @classmethod
+    def time_validation(cls, data, handler):
+        with stage("validation"):
+            return handler(data)
+
+    @field_validator('requests')
+    @classmethod
+    def validate_requests(cls, v):
+        if not v:
+            raise ValueError("Batch must contain at least one request")
+        if len(v) > settings.batch_max_size:
+            raise ValueError(f"Batch size must not exceed {settings.batch_max_size}")
+        return v
+
+    @field_validator('concurrency')
+    @classmethod
+    def validate_concurrency(cls, v):
+        if v is not None and v < 1:
+            raise ValueError("Concurrency must be at least 1")
+        return v
@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
@@ -11,6 +13,9 @@ class Usage(BaseModel):
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    # Prompt tokens served from / missing the upstream prefix cache, when reported
+    prompt_cache_hit_tokens: Optional[int] = None
+    prompt_cache_miss_tokens: Optional[int] = None
 
 
 class ChatResponseData(BaseModel):
@@ -25,6 +30,7 @@ class ChatResponse(BaseModel):
     data: ChatResponseData
     request_id: str
     timestamp: int
+    session_id: Optional[str] = None  # Server-issued id of the session the turn was added to
 
 
 class ErrorResponse(BaseModel):
@@ -32,3 +38,35 @@ class ErrorResponse(BaseModel):
     message: str
     request_id: str
     timestamp: int
+
+
+class BatchChatItem(BaseModel):
+    index: int
+    success: bool
+    data: Optional[ChatResponse] = None
+    error: Optional[ErrorResponse] = None
+
+
+class BatchChatResponse(BaseModel):
+    code: int = 200
+    message: str = "success"
+    results: List[BatchChatItem]
+    succeeded: int
+    failed: int
+    request_id: str
+    timestamp: int
+
+
+class SessionTurn(BaseModel):
+    user: str
+    assistant: str
+
+
+class SessionInfo(BaseModel):
+    session_id: str
+    turns: List[SessionTurn]  # Sent verbatim with the next request of the session
+    summary: Optional[str] = None  # Rolling summary of earlier turns, when SESSION_SUMMARY is on
+    earlier_turns: int  # Turns no longer sent verbatim (summarized or dropped)
+    window_tokens: int
+    created_at: int
+    updated_at: int
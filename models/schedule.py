@@ -1,13 +1,23 @@
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+from core.metrics import stage
+from models.response import Usage
 
 
 class ScheduleRequest(BaseModel):
     prompt: str 
     request_id: str
 
+    @model_validator(mode='wrap')
+    @classmethod
+    def time_validation(cls, data, handler):
+        """校验耗时计入 "validation" 阶段"""
+        with stage("validation"):
+            return handler(data)
+
 
 class Event(BaseModel):
     title: str
@@ -19,10 +29,85 @@ class Event(BaseModel):
     start_date: Optional[str] = None
     end_date: Optional[str] = None
 
+class LLMTask(BaseModel):
+    """模型返回的任务，不含具体时间；开始/结束时间由本地排程引擎分配"""
+    title: str
+    description: str
+    duration: int  # 分钟
+    priority: str  # high, medium, low
+    category: str
+    suggested_time: Optional[str] = None  # morning, afternoon, evening
+    day: int = 0  # 相对今天的天数，0 为今天，1 为明天
+
 class LLMResponse(BaseModel):
-    events: list[Event]
+    events: list[LLMTask]
+
+class LLMTaskUpdate(BaseModel):
+    """对已有任务的修改，只包含需要改动的字段"""
+    id: int  # 当前日程中的任务编号
+    title: Optional[str] = None
+    description: Optional[str] = None
+    duration: Optional[int] = None
+    priority: Optional[str] = None
+    category: Optional[str] = None
+    suggested_time: Optional[str] = None
+    day: Optional[int] = None
+
+class LLMPatch(BaseModel):
+    """重新规划时模型返回的补丁"""
+    remove: list[int] = []
+    modify: list[LLMTaskUpdate] = []
+    add: list[LLMTask] = []
 
 class ScheduleResponse(BaseModel):
     """日程规划请求模型"""
     events: List[Event]
     request_id: str
+    usage: Optional[Usage] = None  # 命中缓存时为空
+
+
+class ScheduleReplanRequest(BaseModel):
+    """重新规划请求：已有日程加上修改描述"""
+    schedule: ScheduleResponse  # 之前 /schedule/plan 返回的结果
+    change: str
+    request_id: str
+
+    @model_validator(mode='wrap')
+    @classmethod
+    def time_validation(cls, data, handler):
+        """校验耗时计入 "validation" 阶段"""
+        with stage("validation"):
+            return handler(data)
+
+
+class EventChange(BaseModel):
+    index: int  # 在原日程 events 中的下标
+    event: Event
+
+
+class ScheduleReplanResponse(BaseModel):
+    """重新规划结果：只包含改动的部分，未列出的任务保持原来的时间"""
+    added: List[Event]
+    removed: List[int]  # 被删除任务在原日程 events 中的下标
+    modified: List[EventChange]
+    request_id: str
+    usage: Optional[Usage] = None  # 命中缓存时为空
+
+
+class ScheduleJobRequest(ScheduleRequest):
+    """后台日程规划任务：与 ScheduleRequest 相同，可选回调地址"""
+    callback_url: Optional[str] = None  # 任务完成后 POST 结果到该地址
+
+
+class ScheduleJobResponse(BaseModel):
+    """后台任务状态，完成后 result 为 ScheduleResponse，失败时 error 为 {code, message}"""
+    job_id: str
+    status: str  # queued, running, succeeded, failed
+    request_id: str
+    result: Optional[ScheduleResponse] = None
+    error: Optional[Dict[str, Any]] = None
+    webhook_status: Optional[str] = None  # delivered, failed；未设置回调时为空
+    created_at: int
+    started_at: Optional[int] = None
+    finished_at: Optional[int] = None
+    expires_at: int
@@ -0,0 +1,124 @@
+"""Provider abstraction shared by all model backends"""
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel
+
+
+class ProviderResponse:
+    """Mock response object to match langchain interface"""
+
+    def __init__(self, content: str, response_metadata: dict = None):
+        self.content = content
+        self.response_metadata = response_metadata or {}
+
+
+class StructuredResponse:
+    """Completion parsed into a response schema, with the raw completion's metadata"""
+
+    def __init__(self, parsed: BaseModel, response_metadata: dict = None):
+        self.parsed = parsed
+        self.response_metadata = response_metadata or {}
+
+
+class BaseProvider(ABC):
+    """Interface every model backend implements
+
+    ``name`` is reported to clients as the model provider. Async methods are
+    the primary path; the sync variants exist for scripts and legacy callers.
+    """
+
+    name: str = "base"
+
+    def warmup(
+            self,
+            system_prompts: Iterable[Optional[str]] = (None,),
+            temperature: float = 0.7,
+            max_tokens: int = 100,
+            structured: Iterable[Dict[str, Any]] = (),
+    ) -> None:
+        """Build clients and compiled chains before the first request (optional)
+
+        ``system_prompts`` are warmed for chat calls with the given sampling
+        parameters; each ``structured`` item holds get_structured_response
+        arguments other than ``input_variables``.
+        """
+
+    @abstractmethod
+    def get_response(
+            self,
+            prompt: str,
+            system_prompt: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: int = 100,
+            history: Sequence[Tuple[str, str]] = (),
+            **kwargs
+    ) -> ProviderResponse:
+        """Get a chat completion for a user prompt
+
+        ``history`` holds earlier ``(role, text)`` messages of a session
+        ("system", "human" or "ai"), sent between the system prompt and the prompt.
+        """
+
+    @abstractmethod
+    async def aget_response(
+            self,
+            prompt: str,
+            system_prompt: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: int = 100,
+            history: Sequence[Tuple[str, str]] = (),
+            **kwargs
+    ) -> ProviderResponse:
+        """Async variant of get_response"""
+
+    @abstractmethod
+    def astream_response(
+            self,
+            prompt: str,
+            system_prompt: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: int = 100,
+            history: Sequence[Tuple[str, str]] = (),
+            **kwargs
+    ) -> AsyncIterator[ProviderResponse]:
+        """Stream a chat completion; the last item carries the usage metadata"""
+
+    @abstractmethod
+    def astream_json(
+            self,
+            template: str,
+            input_variables: Dict[str, Any],
+            temperature: float = 0.7,
+            max_tokens: int = None,
+            system_prompt: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream the raw text of a JSON-mode completion"""
+
+    @abstractmethod
+    def get_structured_response(
+            self,
+            template: str,
+            input_variables: Dict[str, Any],
+            response_schema: Type[BaseModel],
+            temperature: float = 0.7,
+            max_tokens: int = None,
+            system_prompt: Optional[str] = None
+    ) -> StructuredResponse:
+        """Get a completion parsed into response_schema (``.parsed``) with its token usage
+
+        ``system_prompt`` is sent verbatim ahead of the rendered template, so
+        static instructions form a stable prefix for upstream prompt caching.
+        """
+
+    @abstractmethod
+    async def aget_structured_response(
+            self,
+            template: str,
+            input_variables: Dict[str, Any],
+            response_schema: Type[BaseModel],
+            temperature: float = 0.7,
+            max_tokens: int = None,
+            system_prompt: Optional[str] = None
+    ) -> StructuredResponse:
+        """Async variant of get_structured_response"""
@@ -1,57 +1,267 @@
 import logging
 import os
-from typing import Optional, Dict, Any, Type
+import time
+from typing import Optional, Dict, Any, Type, Callable, Hashable, AsyncIterator, Iterable, NamedTuple, Sequence, Tuple
 
+import httpx
 from dotenv import load_dotenv
 
 # 加载 .env 文件
 load_dotenv()
 
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
 from langchain_deepseek.chat_models import ChatDeepSeek
 from pydantic import BaseModel
 
+from core.cache import LRUCache
+from core.config import settings
 from core.exceptions import ProviderException
+from core.metrics import TIME_TO_FIRST_TOKEN, record_usage, stage
+from core.scenes import compile_template
+from providers.base import BaseProvider, ProviderResponse, StructuredResponse
 
+# Kept for existing imports
+DeepSeekResponse = ProviderResponse
 
-class DeepSeekResponse:
-    """Mock response object to match langchain interface"""
 
-    def __init__(self, content: str, response_metadata: dict = None):
-        self.content = content
-        self.response_metadata = response_metadata or {}
+def _create_prompt_template(system_prompt: Optional[str] = None) -> ChatPromptTemplate:
+    """Chat prompt template for a system prompt, precompiled for configured scenes"""
+    return settings.scenes.template_for(system_prompt)
 
 
-def _create_prompt_template(system_prompt: Optional[str] = None) -> ChatPromptTemplate:
-    """Create chat prompt template using langchain prompt builders"""
-    messages = []
+class _Chain(NamedTuple):
+    """Compiled prompt template, chat model and optional output parser
 
-    if system_prompt:
-        system_template = SystemMessagePromptTemplate.from_template(system_prompt)
-        messages.append(system_template)
+    The parts are run one after another instead of as a single LCEL
+    sequence so that prompt building, the upstream call and parsing can be
+    timed as separate stages.
+    """
+    prompt: ChatPromptTemplate
+    model: Runnable
+    parser: Optional[Runnable] = None
 
-    human_template = HumanMessagePromptTemplate.from_template("{user_input}")
-    messages.append(human_template)
 
-    return ChatPromptTemplate.from_messages(messages)
+class DeepSeekProvider(BaseProvider):
+    """DeepSeek provider using langchain prompt templates
 
+    Compiled chains are cached per (kind, model, temperature, max_tokens,
+    prompt) so repeated calls reuse the same chat model, prompt template and
+    underlying pooled HTTP client. Any OpenAI-compatible endpoint can be
+    targeted through ``base_url``.
+    """
 
-class DeepSeekProvider:
-    """DeepSeek provider using langchain prompt templates"""
+    name = "deepseek"
 
-    def __init__(self):
-        self.api_key = os.getenv("DEEPSEEK_API_KEY")
+    def __init__(
+            self,
+            http_client: Optional[httpx.Client] = None,
+            http_async_client: Optional[httpx.AsyncClient] = None,
+            model: str = "deepseek-chat",
+            api_key: Optional[str] = None,
+            base_url: Optional[str] = None,
+    ):
+        self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
         if not self.api_key:
-            raise ProviderException("deepseek", "DeepSeek API key not found")
+            raise ProviderException(self.name, "DeepSeek API key not found")
+        self.model = model
+        self.base_url = base_url or settings.deepseek_api_base
+        self.http_client = http_client
+        self.http_async_client = http_async_client
+        self._chains = LRUCache(
+            max_size=settings.chain_cache_size,
+            ttl=settings.chain_cache_idle_ttl,
+            sliding=True,
+        )
 
-    def _create_chat_model(self, temperature: float = 0, max_tokens: int = None) -> ChatDeepSeek:
+    def _create_chat_model(self, temperature: float = 0, max_tokens: int = None, **kwargs) -> ChatDeepSeek:
         """Create and configure ChatDeepSeek model"""
         return ChatDeepSeek(
             api_key=self.api_key,
-            model="deepseek-chat",
+            api_base=self.base_url,
+            model=self.model,
             temperature=temperature,
             max_tokens=max_tokens,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+            # Retries are done by the registry, inside the request deadline
+            max_retries=0,
+            **kwargs,
+        )
+
+    def _get_chain(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return a cached compiled chain, building it on first use"""
+        return self._chains.get_or_create((self.model,) + key, factory)
+
+    def _chat_chain(self, system_prompt: Optional[str], temperature: float, max_tokens: int):
+        """Get the chain used by get_response"""
+        def build():
+            chat_model = self._create_chat_model(temperature, max_tokens)
+            return _Chain(_create_prompt_template(system_prompt), chat_model)
+
+        return self._get_chain(("chat", temperature, max_tokens, system_prompt), build)
+
+    def _stream_chain(self, system_prompt: Optional[str], temperature: float, max_tokens: int):
+        """Get the chain used by astream_response (reports usage in the final chunk)"""
+        def build():
+            chat_model = self._create_chat_model(temperature, max_tokens, stream_usage=True)
+            return _Chain(_create_prompt_template(system_prompt), chat_model)
+
+        return self._get_chain(("stream", temperature, max_tokens, system_prompt), build)
+
+    def _template_chain(self, template: str, temperature: float, max_tokens: int):
+        """Get the chain used by get_response_with_custom_template"""
+        def build():
+            chat_model = self._create_chat_model(temperature, max_tokens)
+            return _Chain(compile_template(template), chat_model)
+
+        return self._get_chain(("template", temperature, max_tokens, template), build)
+
+    def _json_stream_chain(
+            self,
+            template: str,
+            temperature: float,
+            max_tokens: Optional[int],
+            system_prompt: Optional[str] = None,
+    ):
+        """Get the chain used by astream_json (JSON output mode, raw text)"""
+        def build():
+            chat_model = self._create_chat_model(temperature, max_tokens, stream_usage=True)
+            json_model = chat_model.bind(response_format={"type": "json_object"})
+            return _Chain(compile_template(template, system_prompt), json_model)
+
+        return self._get_chain(("json_stream", temperature, max_tokens, template, system_prompt), build)
+
+    def _structured_chain(
+            self,
+            template: str,
+            response_schema: Type[BaseModel],
+            temperature: float,
+            max_tokens: Optional[int],
+            system_prompt: Optional[str] = None,
+    ):
+        """Get the chain used by get_structured_response
+
+        with_structured_output returns the tool-bound model followed by its
+        parser; keeping them apart preserves the raw AIMessage (and its token
+        usage) and lets parsing be timed on its own.
+        """
+        def build():
+            chat_model = self._create_chat_model(temperature, max_tokens)
+            model_with_structure = chat_model.with_structured_output(response_schema)
+            prompt_template = compile_template(template, system_prompt)
+            return _Chain(prompt_template, model_with_structure.first, model_with_structure.last)
+
+        key = ("structured", temperature, max_tokens, template, response_schema, system_prompt)
+        return self._get_chain(key, build)
+
+    def warmup(
+            self,
+            system_prompts: Iterable[Optional[str]] = (None,),
+            temperature: float = 0.7,
+            max_tokens: int = 100,
+            structured: Iterable[Dict[str, Any]] = (),
+    ) -> None:
+        """Compile the chat, streaming and structured chains up front (also builds the API clients)"""
+        for system_prompt in system_prompts:
+            self._chat_chain(system_prompt, temperature, max_tokens)
+            self._stream_chain(system_prompt, temperature, max_tokens)
+        for kwargs in structured:
+            self._structured_chain(
+                kwargs["template"],
+                kwargs["response_schema"],
+                kwargs.get("temperature", 0.7),
+                kwargs.get("max_tokens"),
+                kwargs.get("system_prompt"),
+            )
+
+    @staticmethod
+    def _token_usage(usage_metadata: Optional[Dict[str, Any]]) -> Dict[str, int]:
+        """Convert LangChain usage metadata into OpenAI-style token usage
+
+        When the upstream reports prompt (context) cache hits, the prompt is
+        also split into DeepSeek's prompt_cache_hit_tokens / _miss_tokens.
+        """
+        usage = usage_metadata or {}
+        token_usage = {
+            "prompt_tokens": usage.get("input_tokens", 0),
+            "completion_tokens": usage.get("output_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+        }
+        cache_hit = (usage.get("input_token_details") or {}).get("cache_read")
+        if cache_hit is not None:
+            token_usage["prompt_cache_hit_tokens"] = cache_hit
+            token_usage["prompt_cache_miss_tokens"] = token_usage["prompt_tokens"] - cache_hit
+        return token_usage
+
+    def _response_metadata(
+            self,
+            temperature: float,
+            max_tokens: Optional[int],
+            usage_metadata: Optional[Dict[str, Any]] = None,
+            **extra
+    ) -> Dict[str, Any]:
+        """Create response metadata"""
+        return {
+            "token_usage": self._token_usage(usage_metadata),
+            "model_name": self.model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            **extra,
+        }
+
+    def _invoke(self, chain: _Chain, variables: Dict[str, Any]) -> AIMessage:
+        """Build the prompt and call the model, timing each stage"""
+        with stage("prompt_build"):
+            prompt_value = chain.prompt.invoke(variables)
+        started = time.perf_counter()
+        with stage("upstream"):
+            message = chain.model.invoke(prompt_value)
+        record_usage(self.model, message.usage_metadata, time.perf_counter() - started)
+        return message
+
+    async def _ainvoke(self, chain: _Chain, variables: Dict[str, Any]) -> AIMessage:
+        """Async variant of _invoke"""
+        with stage("prompt_build"):
+            prompt_value = chain.prompt.invoke(variables)
+        started = time.perf_counter()
+        with stage("upstream"):
+            message = await chain.model.ainvoke(prompt_value)
+        record_usage(self.model, message.usage_metadata, time.perf_counter() - started)
+        return message
+
+    async def _astream(self, chain: _Chain, variables: Dict[str, Any]) -> AsyncIterator[Any]:
+        """Stream message chunks, recording time to first token and token usage"""
+        with stage("prompt_build"):
+            prompt_value = chain.prompt.invoke(variables)
+        started = time.perf_counter()
+        first_token = None
+        usage = None
+        async for chunk in chain.model.astream(prompt_value):
+            if chunk.content and first_token is None:
+                first_token = time.perf_counter()
+                TIME_TO_FIRST_TOKEN.labels(self.model).observe(first_token - started)
+            if chunk.usage_metadata:
+                usage = chunk.usage_metadata
+            yield chunk
+        record_usage(self.model, usage, time.perf_counter() - (first_token or started))
+
+    def _structured_result(
+            self,
+            chain: _Chain,
+            message: AIMessage,
+            temperature: float,
+            max_tokens: Optional[int],
+    ) -> StructuredResponse:
+        """Parse a tool-call message into the response schema"""
+        with stage("parse"):
+            parsed = chain.parser.invoke(message)
+        if parsed is None:
+            raise ValueError("Model returned no structured output")
+        return StructuredResponse(
+            parsed=parsed,
+            response_metadata=self._response_metadata(temperature, max_tokens, message.usage_metadata),
         )
 
     def get_response(
@@ -60,41 +270,69 @@ class DeepSeekProvider:
             system_prompt: Optional[str] = None,
             temperature: float = 0.7,
             max_tokens: int = 100,
+            history: Sequence[Tuple[str, str]] = (),
             **kwargs
     ) -> DeepSeekResponse:
         """Get response from DeepSeek using langchain prompt templates"""
         try:
-            # Create chat model
-            chat_model = self._create_chat_model(temperature, max_tokens)
-
-            # Create prompt template
-            prompt_template = _create_prompt_template(system_prompt)
+            chain = self._chat_chain(system_prompt, temperature, max_tokens)
+            message = self._invoke(chain, {"user_input": prompt, "history": list(history)})
+            return DeepSeekResponse(
+                content=message.content,
+                response_metadata=self._response_metadata(temperature, max_tokens, message.usage_metadata),
+            )
 
-            # Create output parser
-            output_parser = StrOutputParser()
+        except Exception as e:
+            raise ProviderException(self.name, f"Error calling DeepSeek API: {str(e)}") from e
 
-            # Create chain using langchain LCEL (LangChain Expression Language)
-            chain = prompt_template | chat_model | output_parser
+    async def aget_response(
+            self,
+            prompt: str,
+            system_prompt: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: int = 100,
+            history: Sequence[Tuple[str, str]] = (),
+            **kwargs
+    ) -> DeepSeekResponse:
+        """Async variant of get_response"""
+        try:
+            chain = self._chat_chain(system_prompt, temperature, max_tokens)
+            message = await self._ainvoke(chain, {"user_input": prompt, "history": list(history)})
+            return DeepSeekResponse(
+                content=message.content,
+                response_metadata=self._response_metadata(temperature, max_tokens, message.usage_metadata),
+            )
 
-            # Execute chain with input
-            content = chain.invoke({"user_input": prompt})
+        except Exception as e:
+            raise ProviderException(self.name, f"Error calling DeepSeek API: {str(e)}") from e
 
-            # Create response metadata
-            response_metadata = {
-                "token_usage": {
-                    "prompt_tokens": 0,  # DeepSeek may not expose this directly
-                    "completion_tokens": 0,
-                    "total_tokens": 0
-                },
-                "model_name": "deepseek-chat",
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            }
+    async def astream_response(
+            self,
+            prompt: str,
+            system_prompt: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: int = 100,
+            history: Sequence[Tuple[str, str]] = (),
+            **kwargs
+    ) -> AsyncIterator[DeepSeekResponse]:
+        """Stream a response token by token
 
-            return DeepSeekResponse(content=content, response_metadata=response_metadata)
+        Yields one DeepSeekResponse per content delta. The last item has empty
+        content and carries the token usage in its response metadata.
+        """
+        usage = None
+        try:
+            chain = self._stream_chain(system_prompt, temperature, max_tokens)
+            async for chunk in self._astream(chain, {"user_input": prompt, "history": list(history)}):
+                if chunk.usage_metadata:
+                    usage = chunk.usage_metadata
+                if chunk.content:
+                    yield DeepSeekResponse(content=chunk.content)
 
         except Exception as e:
-            raise ProviderException("deepseek", f"Error calling DeepSeek API: {str(e)}")
+            raise ProviderException(self.name, f"Error calling DeepSeek API: {str(e)}") from e
+
+        yield DeepSeekResponse(content="", response_metadata=self._response_metadata(temperature, max_tokens, usage))
 
     def get_response_with_custom_template(
             self,
@@ -105,38 +343,60 @@ class DeepSeekProvider:
     ) -> DeepSeekResponse:
         """Get response using a custom prompt template"""
         try:
-            # Create chat model
-            chat_model = self._create_chat_model(temperature, max_tokens)
-
-            # Create custom prompt template
-            prompt_template = ChatPromptTemplate.from_template(template)
-
-            # Create output parser
-            output_parser = StrOutputParser()
+            chain = self._template_chain(template, temperature, max_tokens)
+            message = self._invoke(chain, input_variables)
+            return DeepSeekResponse(
+                content=message.content,
+                response_metadata=self._response_metadata(
+                    temperature, max_tokens, message.usage_metadata, template=template
+                ),
+            )
 
-            # Create chain
-            chain = prompt_template | chat_model | output_parser
+        except Exception as e:
+            raise ProviderException(self.name, f"Error calling DeepSeek API: {str(e)}") from e
 
-            # Execute chain with input variables
-            content = chain.invoke(input_variables)
+    async def aget_response_with_custom_template(
+            self,
+            template: str,
+            input_variables: Dict[str, Any],
+            temperature: float = 0.7,
+            max_tokens: int = 100
+    ) -> DeepSeekResponse:
+        """Async variant of get_response_with_custom_template"""
+        try:
+            chain = self._template_chain(template, temperature, max_tokens)
+            message = await self._ainvoke(chain, input_variables)
+            return DeepSeekResponse(
+                content=message.content,
+                response_metadata=self._response_metadata(
+                    temperature, max_tokens, message.usage_metadata, template=template
+                ),
+            )
 
-            # Create response metadata
-            response_metadata = {
-                "token_usage": {
-                    "prompt_tokens": 0,
-                    "completion_tokens": 0,
-                    "total_tokens": 0
-                },
-                "model_name": "deepseek-chat",
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "template": template
-            }
+        except Exception as e:
+            raise ProviderException(self.name, f"Error calling DeepSeek API: {str(e)}") from e
 
-            return DeepSeekResponse(content=content, response_metadata=response_metadata)
+    async def astream_json(
+            self,
+            template: str,
+            input_variables: Dict[str, Any],
+            temperature: float = 0.7,
+            max_tokens: int = None,
+            system_prompt: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream the raw text of a JSON-mode completion
+
+        The template must ask for JSON output; callers parse the partial
+        document themselves.
+        """
+        try:
+            chain = self._json_stream_chain(template, temperature, max_tokens, system_prompt)
+            async for chunk in self._astream(chain, input_variables):
+                if chunk.content:
+                    yield chunk.content
 
         except Exception as e:
-            raise ProviderException("deepseek", f"Error calling DeepSeek API: {str(e)}")
+            raise ProviderException(self.name, f"Error calling DeepSeek API with JSON streaming: {str(e)}") from e
 
     def get_structured_response(
             self,
@@ -144,29 +404,35 @@ class DeepSeekProvider:
             input_variables: Dict[str, Any],
             response_schema: Type[BaseModel],
             temperature: float = 0.7,
-            max_tokens: int = None
-    ) -> BaseModel:
+            max_tokens: int = None,
+            system_prompt: Optional[str] = None
+    ) -> StructuredResponse:
         """Get structured response using LangChain's with_structured_output"""
         try:
-            # Create chat model
-            chat_model = self._create_chat_model(temperature, max_tokens)
-
-            # Use LangChain's structured output functionality
-            model_with_structure = chat_model.with_structured_output(response_schema)
+            chain = self._structured_chain(template, response_schema, temperature, max_tokens, system_prompt)
+            message = self._invoke(chain, input_variables)
+            return self._structured_result(chain, message, temperature, max_tokens)
 
-            # Create custom prompt template
-            prompt_template = ChatPromptTemplate.from_template(template)
-
-            # Create chain with structured output
-            chain = prompt_template | model_with_structure
-
-            # Execute chain with input variables and get structured response
-            structured_result = chain.invoke(input_variables)
+        except Exception as e:
+            raise ProviderException(self.name, f"Error calling DeepSeek API with structured output: {str(e)}") from e
 
-            return structured_result
+    async def aget_structured_response(
+            self,
+            template: str,
+            input_variables: Dict[str, Any],
+            response_schema: Type[BaseModel],
+            temperature: float = 0.7,
+            max_tokens: int = None,
+            system_prompt: Optional[str] = None
+    ) -> StructuredResponse:
+        """Async variant of get_structured_response"""
+        try:
+            chain = self._structured_chain(template, response_schema, temperature, max_tokens, system_prompt)
+            message = await self._ainvoke(chain, input_variables)
+            return self._structured_result(chain, message, temperature, max_tokens)
 
         except Exception as e:
-            raise ProviderException("deepseek", f"Error calling DeepSeek API with structured output: {str(e)}")
+            raise ProviderException(self.name, f"Error calling DeepSeek API with structured output: {str(e)}") from e
 
 
 # Backward compatibility function
@@ -177,5 +443,10 @@ def get_deepseek_response(
         max_tokens: int = 100
 ) -> DeepSeekResponse:
     """Backward compatibility function for existing code"""
-    provider = DeepSeekProvider()
-    return provider.get_response(prompt, system_prompt, temperature, max_tokens)
+    from providers.registry import registry
+
+    response, _ = registry.call(
+        "deepseek-chat",
+        lambda provider: provider.get_response(prompt, system_prompt, temperature, max_tokens),
+    )
+    return response
@@ -0,0 +1,65 @@
+"""Request hedging: send a duplicate when a call runs past its usual latency"""
+from collections import deque
+from typing import Any, Dict, Optional
+
+from core.config import settings
+
+
+class HedgePolicy:
+    """Hedge delay and extra-call budget for one model and call kind
+
+    The delay is a percentile of recently observed latencies, so only calls
+    that are already slower than usual get a duplicate. The budget is a token
+    bucket that earns ``budget_ratio`` tokens per request and spends one per
+    hedge, which caps hedging at that fraction of traffic plus a small burst.
+    """
+
+    def __init__(self, budget_ratio: float):
+        self.budget_ratio = budget_ratio
+        self.tokens = float(settings.hedge_budget_burst)
+        self._samples: deque = deque(maxlen=settings.hedge_sample_size)
+        self._delay: Optional[float] = None
+        self._since_refresh = 0
+        self.stats: Dict[str, int] = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_exhausted": 0}
+
+    def observe(self, latency: float) -> None:
+        """Record the latency of a completed call"""
+        self._samples.append(latency)
+        self._since_refresh += 1
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None until enough samples exist"""
+        if len(self._samples) < settings.hedge_min_samples:
+            return None
+        # Re-sorting every request is wasted work; the percentile moves slowly
+        if self._delay is None or self._since_refresh >= 16:
+            ordered = sorted(self._samples)
+            index = min(len(ordered) - 1, int(len(ordered) * settings.hedge_percentile / 100))
+            self._delay = max(ordered[index], settings.hedge_min_delay)
+            self._since_refresh = 0
+        return self._delay
+
+    def admit(self) -> None:
+        """Count a primary request and earn its share of hedge budget"""
+        self.stats["requests"] += 1
+        self.tokens = min(float(settings.hedge_budget_burst), self.tokens + self.budget_ratio)
+
+    def try_spend(self) -> bool:
+        """Take one hedge from the budget if any is left"""
+        if self.tokens < 1.0:
+            self.stats["budget_exhausted"] += 1
+            return False
+        self.tokens -= 1.0
+        self.stats["hedged"] += 1
+        return True
+
+    def info(self) -> Dict[str, Any]:
+        requests = self.stats["requests"]
+        hedged = self.stats["hedged"]
+        return {
+            **self.stats,
+            "hedge_rate": round(hedged / requests, 4) if requests else 0.0,
+            "win_rate": round(self.stats["hedge_wins"] / hedged, 4) if hedged else 0.0,
+            "delay_ms": round(self._delay * 1000, 1) if self._delay is not None else None,
+            "budget_tokens": round(self.tokens, 2),
+        }
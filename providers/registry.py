@@ -0,0 +1,523 @@
+"""Process-wide provider registry with latency-aware routing"""
+import asyncio
+import importlib
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+import httpx
+
+from core.config import settings
+from core.metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_RETRIES, UPSTREAM_SECONDS
+from core.tracing import span
+from core.exceptions import (
+    CircuitOpenException,
+    DeadlineExceededException,
+    ModelNotSupportedException,
+    ProviderException,
+)
+from providers.base import BaseProvider
+from providers.hedging import HedgePolicy
+from providers.resilience import (
+    FATAL,
+    TRANSIENT,
+    CircuitBreaker,
+    Deadline,
+    backoff_delay,
+    classify_error,
+    retry_after,
+)
+
+# Provider classes by backend kind, imported on first use: the langchain/openai
+# stack behind them is most of the application's import time
+PROVIDER_CLASSES = {
+    "deepseek": "providers.deepseek.DeepSeekProvider",
+    "stub": "providers.stub.StubProvider",
+}
+
+
+class Backend:
+    """One upstream serving a model, with live latency and error-rate estimates"""
+
+    def __init__(
+            self,
+            name: str,
+            provider: str,
+            model: str,
+            weight: float = 1.0,
+            upstream_model: Optional[str] = None,
+            base_url: Optional[str] = None,
+            api_key_env: Optional[str] = None,
+            options: Optional[dict] = None,
+    ):
+        self.name = name
+        self.kind = provider
+        self.model = model
+        self.weight = float(weight)
+        self.upstream_model = upstream_model or model
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+        self.options = options or {}
+        self.provider: Optional[BaseProvider] = None
+
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.breaker = CircuitBreaker(settings.circuit_failure_threshold, settings.circuit_reset_timeout)
+
+    def record(self, latency: Optional[float], ok: bool, healthy: Optional[bool] = None) -> None:
+        """Fold one call outcome into the EWMA estimates and the circuit breaker
+
+        ``healthy=True`` marks a failure that was not the upstream's fault
+        (a bad request, unparsable output): it neither counts against the
+        circuit nor closes it, and only releases a half-open probe.
+        """
+        if ok:
+            self.breaker.record(True)
+        elif healthy:
+            self.breaker.release()
+        else:
+            self.breaker.record(False)
+        alpha = settings.routing_ewma_alpha
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+        self.error_ewma += alpha * ((0.0 if ok else 1.0) - self.error_ewma)
+        if latency is not None:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += alpha * (latency - self.latency_ewma)
+
+    def score(self, default_latency: float) -> float:
+        """Routing weight: configured weight over expected latency, penalised by errors"""
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        return self.weight / (max(latency, 1e-3) * (1 + settings.routing_error_penalty * self.error_ewma))
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "provider": self.kind,
+            "weight": self.weight,
+            "latency_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "error_rate": round(self.error_ewma, 4),
+            "requests": self.requests,
+            "errors": self.errors,
+            "circuit": self.breaker.info(),
+        }
+
+
+class ProviderRegistry:
+    """Maps model names to weighted backends and owns the pooled HTTP clients
+
+    Each call is routed to a backend picked at random in proportion to its
+    score, so traffic drifts away from backends whose recent latency or error
+    rate is worse without starving them of the probes needed to recover.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+        self._backends: Dict[str, List[Backend]] = self._load_backends()
+        self._hedge_policies: Dict[Tuple[str, str], HedgePolicy] = {}
+        self.retry_stats: Dict[str, int] = {"retries": 0, "gave_up": 0, "deadline_exceeded": 0}
+
+    @staticmethod
+    def _load_backends() -> Dict[str, List[Backend]]:
+        backends = {}
+        for model, entries in settings.provider_backends.items():
+            backends[model] = [
+                Backend(
+                    name=entry.get("name", entry.get("provider", "deepseek")),
+                    provider=entry.get("provider", "deepseek"),
+                    model=model,
+                    weight=entry.get("weight", 1.0),
+                    upstream_model=entry.get("model"),
+                    base_url=entry.get("base_url"),
+                    api_key_env=entry.get("api_key_env"),
+                    options=entry.get("options"),
+                )
+                for entry in entries
+            ]
+        return backends
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        )
+
+    @property
+    def http_client(self) -> httpx.Client:
+        """Shared keep-alive client for synchronous upstream calls"""
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(
+                        limits=self._limits(),
+                        timeout=settings.http_timeout,
+                    )
+        return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        """Shared keep-alive client for asynchronous upstream calls"""
+        if self._http_async_client is None:
+            with self._lock:
+                if self._http_async_client is None:
+                    self._http_async_client = httpx.AsyncClient(
+                        limits=self._limits(),
+                        timeout=settings.http_timeout,
+                    )
+        return self._http_async_client
+
+    def has_model(self, model: str) -> bool:
+        return bool(self._backends.get(model))
+
+    def backends(self, model: str) -> List[Backend]:
+        return self._backends.get(model, [])
+
+    def get_provider(self, backend: Backend) -> BaseProvider:
+        """Get the backend's provider instance, creating it on first use"""
+        if backend.provider is not None:
+            return backend.provider
+
+        path = PROVIDER_CLASSES.get(backend.kind)
+        if path is None:
+            raise ProviderException(backend.kind, "Unknown provider")
+
+        with self._lock:
+            provider_class = self._provider_class(path)
+            if backend.provider is None:
+                backend.provider = provider_class(
+                    http_client=self.http_client,
+                    http_async_client=self.http_async_client,
+                    model=backend.upstream_model,
+                    api_key=os.getenv(backend.api_key_env) if backend.api_key_env else None,
+                    base_url=backend.base_url,
+                    **backend.options,
+                )
+        return backend.provider
+
+    @staticmethod
+    def _provider_class(path: str) -> Type[BaseProvider]:
+        module, _, name = path.rpartition(".")
+        return getattr(importlib.import_module(module), name)
+
+    def warmup(self, model: str, **kwargs) -> None:
+        """Create the providers of every backend for model and let them build clients and chains
+
+        Keyword arguments are passed to ``BaseProvider.warmup``.
+        """
+        for backend in self.backends(model):
+            self.get_provider(backend).warmup(**kwargs)
+
+    def select(self, model: str, exclude: Tuple[Backend, ...] = ()) -> Backend:
+        """Pick a backend for model, weighted by live latency and error rate
+
+        Backends whose circuit is open are skipped; if that leaves nothing,
+        the call fails fast with CircuitOpenException.
+        """
+        candidates = [b for b in self.backends(model) if b.weight > 0 and b not in exclude]
+        if not candidates:
+            if not self.has_model(model):
+                raise ModelNotSupportedException(model)
+            raise ProviderException(model, "No backend available")
+        candidates = [b for b in candidates if b.breaker.available()]
+        if not candidates:
+            raise CircuitOpenException(model)
+
+        if len(candidates) == 1:
+            backend = candidates[0]
+        else:
+            # Unmeasured backends are assumed as fast as the best one so they get probed
+            measured = [b.latency_ewma for b in candidates if b.latency_ewma is not None]
+            default_latency = min(measured) if measured else 1.0
+            scores = [b.score(default_latency) for b in candidates]
+            backend = random.choices(candidates, weights=scores)[0]
+        backend.breaker.acquire()
+        return backend
+
+    def _select_retry(self, model: str, failed: List[Backend], error: Optional[Exception]) -> Backend:
+        """Prefer a backend that has not failed this request yet
+
+        If every circuit has opened in the meantime the previous attempt's
+        error is re-raised, since it says more than "unavailable".
+        """
+        if not failed:
+            return self.select(model)
+        try:
+            return self.select(model, exclude=tuple(failed))
+        except (CircuitOpenException, ProviderException):
+            pass
+        try:
+            return self.select(model)
+        except CircuitOpenException:
+            raise error
+
+    def _retry_delay(self, model: str, error: Exception, attempt: int, deadline: Deadline) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up"""
+        if classify_error(error) == FATAL:
+            return None
+        delay = max(backoff_delay(attempt), retry_after(error) or 0.0)
+        if attempt >= settings.retry_max_attempts or delay >= deadline.remaining():
+            self.retry_stats["gave_up"] += 1
+            UPSTREAM_RETRIES.labels(model, "gave_up").inc()
+            return None
+        self.retry_stats["retries"] += 1
+        UPSTREAM_RETRIES.labels(model, "retried").inc()
+        return delay
+
+    @staticmethod
+    def _record_failure(backend: Backend, latency: Optional[float], error: Exception) -> None:
+        healthy = classify_error(error) != TRANSIENT
+        backend.record(latency, ok=False, healthy=healthy)
+
+    def call(
+            self,
+            model: str,
+            operation: Callable[[BaseProvider], Any],
+            deadline: Optional[Deadline] = None,
+    ) -> Tuple[Any, Backend]:
+        """Run a synchronous provider operation on a routed backend, retrying transient failures
+
+        A blocking call cannot be interrupted, so here the deadline only
+        decides whether another attempt may start.
+        """
+        deadline = deadline or Deadline(settings.request_deadline)
+        failed: List[Backend] = []
+        error: Optional[Exception] = None
+        while True:
+            backend = self._select_retry(model, failed, error)
+            started = time.perf_counter()
+            try:
+                with span("attempt", backend=backend.name, model=model):
+                    result = operation(self.get_provider(backend))
+            except Exception as e:
+                UPSTREAM_SECONDS.labels(model, backend.name, "error").observe(time.perf_counter() - started)
+                self._record_failure(backend, time.perf_counter() - started, e)
+                error = e
+                failed.append(backend)
+                delay = self._retry_delay(model, e, len(failed), deadline)
+                if delay is None:
+                    raise
+                with span("retry_backoff", delay=round(delay, 3)):
+                    time.sleep(delay)
+                continue
+            latency = time.perf_counter() - started
+            UPSTREAM_SECONDS.labels(model, backend.name, "ok").observe(latency)
+            backend.record(latency, ok=True)
+            return result, backend
+
+    async def _attempt(
+            self,
+            backend: Backend,
+            operation: Callable[[BaseProvider], Awaitable[Any]],
+            policy: Optional[HedgePolicy] = None,
+    ) -> Tuple[Any, Backend]:
+        in_flight = UPSTREAM_IN_FLIGHT.labels(backend.model)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            with span("attempt", backend=backend.name, model=backend.model):
+                result = await operation(self.get_provider(backend))
+        except asyncio.CancelledError:
+            UPSTREAM_SECONDS.labels(backend.model, backend.name, "cancelled").observe(time.perf_counter() - started)
+            backend.breaker.release()
+            raise
+        except Exception as e:
+            UPSTREAM_SECONDS.labels(backend.model, backend.name, "error").observe(time.perf_counter() - started)
+            self._record_failure(backend, time.perf_counter() - started, e)
+            raise
+        finally:
+            in_flight.dec()
+        latency = time.perf_counter() - started
+        UPSTREAM_SECONDS.labels(backend.model, backend.name, "ok").observe(latency)
+        backend.record(latency, ok=True)
+        if policy is not None:
+            policy.observe(latency)
+        return result, backend
+
+    def _hedge_policy(self, model: str, kind: str) -> HedgePolicy:
+        policy = self._hedge_policies.get((model, kind))
+        if policy is None:
+            policy = self._hedge_policies.setdefault((model, kind), HedgePolicy(settings.get_hedge_budget(model)))
+        return policy
+
+    async def _hedged(
+            self,
+            model: str,
+            backend: Backend,
+            operation: Callable[[BaseProvider], Awaitable[Any]],
+            kind: str,
+    ) -> Tuple[Any, Backend]:
+        """One attempt, duplicated on another backend if it runs past the hedge delay"""
+        if not settings.hedge_enabled:
+            return await self._attempt(backend, operation)
+
+        policy = self._hedge_policy(model, kind)
+        policy.admit()
+        primary = asyncio.ensure_future(self._attempt(backend, operation, policy))
+        tasks = [primary]
+        try:
+            delay = policy.delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and policy.try_spend():
+                    try:
+                        hedge_backend = self.select(model, exclude=(backend,))
+                    except (CircuitOpenException, ProviderException):
+                        hedge_backend = backend
+                    tasks.append(asyncio.ensure_future(self._attempt(hedge_backend, operation, policy)))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            policy.stats["hedge_wins"] += 1
+                        return task.result()
+            # Every attempt failed: surface the primary's error
+            raise primary.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+    async def acall(
+            self,
+            model: str,
+            operation: Callable[[BaseProvider], Awaitable[Any]],
+            kind: str = "default",
+            deadline: Optional[Deadline] = None,
+    ) -> Tuple[Any, Backend]:
+        """Run an async provider operation on a routed backend
+
+        Transient failures are retried with jittered exponential backoff,
+        preferring a backend that has not failed yet, for as long as the
+        attempts fit inside the request deadline. With hedging enabled, an
+        attempt still running after the recent latency percentile for
+        (model, kind) is duplicated on another backend; the first success
+        wins and the other call is cancelled. ``kind`` keeps latency samples
+        of very different calls apart.
+        """
+        deadline = deadline or Deadline(settings.request_deadline)
+        failed: List[Backend] = []
+        error: Optional[Exception] = None
+        while True:
+            backend = self._select_retry(model, failed, error)
+            try:
+                return await asyncio.wait_for(
+                    self._hedged(model, backend, operation, kind),
+                    timeout=deadline.remaining(),
+                )
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and deadline.expired:
+                    backend.record(None, ok=False)
+                    self.retry_stats["deadline_exceeded"] += 1
+                    UPSTREAM_RETRIES.labels(model, "deadline_exceeded").inc()
+                    raise DeadlineExceededException(deadline.seconds) from e
+                error = e
+                failed.append(backend)
+                delay = self._retry_delay(model, e, len(failed), deadline)
+                if delay is None:
+                    raise
+                with span("retry_backoff", delay=round(delay, 3)):
+                    await asyncio.sleep(delay)
+
+    async def astream(
+            self,
+            model: str,
+            operation: Callable[[BaseProvider], AsyncIterator[Any]],
+            deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[Tuple[Any, Backend]]:
+        """Stream from a routed backend, yielding (item, backend) pairs
+
+        Transient failures before the first item are retried like ``acall``;
+        once an item has been yielded the caller has sent it on, so a later
+        failure is recorded on the backend and re-raised. Streams are not
+        hedged: a duplicate stream would pay for every token twice. As in
+        ``call``, the deadline only decides whether another attempt may start.
+        """
+        deadline = deadline or Deadline(settings.request_deadline)
+        failed: List[Backend] = []
+        error: Optional[Exception] = None
+        while True:
+            backend = self._select_retry(model, failed, error)
+            in_flight = UPSTREAM_IN_FLIGHT.labels(model)
+            in_flight.inc()
+            started = time.perf_counter()
+            stream = None
+            streamed = False
+            try:
+                # The span covers the wait for the first item; it must not stay open across a yield
+                with span("attempt", backend=backend.name, model=model):
+                    stream = operation(self.get_provider(backend)).__aiter__()
+                    try:
+                        first = await stream.__anext__()
+                    except StopAsyncIteration:
+                        stream = None
+                if stream is not None:
+                    streamed = True
+                    yield first, backend
+                    async for item in stream:
+                        yield item, backend
+            except (asyncio.CancelledError, GeneratorExit):
+                UPSTREAM_SECONDS.labels(model, backend.name, "cancelled").observe(time.perf_counter() - started)
+                backend.breaker.release()
+                raise
+            except Exception as e:
+                UPSTREAM_SECONDS.labels(model, backend.name, "error").observe(time.perf_counter() - started)
+                # The time to a failure mid-stream says nothing about the backend's latency
+                self._record_failure(backend, None, e)
+                if streamed:
+                    raise
+                error = e
+                failed.append(backend)
+                delay = self._retry_delay(model, e, len(failed), deadline)
+                if delay is None:
+                    raise
+                with span("retry_backoff", delay=round(delay, 3)):
+                    await asyncio.sleep(delay)
+                continue
+            finally:
+                in_flight.dec()
+                if stream is not None and hasattr(stream, "aclose"):
+                    await stream.aclose()
+            UPSTREAM_SECONDS.labels(model, backend.name, "ok").observe(time.perf_counter() - started)
+            backend.record(None, ok=True)
+            return
+
+    def info(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {model: [b.info() for b in backends] for model, backends in self._backends.items()}
+
+    def retry_info(self) -> Dict[str, int]:
+        return dict(self.retry_stats)
+
+    def hedge_info(self) -> Dict[str, Dict[str, Any]]:
+        return {f"{model}:{kind}": policy.info() for (model, kind), policy in self._hedge_policies.items()}
+
+    async def aclose(self) -> None:
+        """Close pooled connections and drop cached providers"""
+        with self._lock:
+            http_client, self._http_client = self._http_client, None
+            http_async_client, self._http_async_client = self._http_async_client, None
+            for backends in self._backends.values():
+                for backend in backends:
+                    backend.provider = None
+        if http_client is not None:
+            http_client.close()
+        if http_async_client is not None:
+            await http_async_client.aclose()
+
+
+registry = ProviderRegistry()
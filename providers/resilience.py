@@ -0,0 +1,165 @@
+"""Error classification, retry backoff, deadlines and circuit breaking for upstream calls"""
+import asyncio
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+import httpx
+
+from core.config import settings
+
+# Error classes
+TRANSIENT = "transient"            # upstream trouble: retry, counts against the circuit
+INVALID_OUTPUT = "invalid_output"  # model returned unparsable output: retry only
+FATAL = "fatal"                    # our request is wrong: never retry
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def _causes(exc: BaseException) -> Iterator[BaseException]:
+    """The error followed by the chain of errors it was raised from"""
+    while exc is not None:
+        yield exc
+        exc = exc.__cause__
+
+
+def _openai():
+    """The openai package if a provider has loaded it; its errors cannot occur before that"""
+    return sys.modules.get("openai")
+
+
+def _classify_one(exc: BaseException) -> Optional[str]:
+    openai = _openai()
+    if openai is not None:
+        if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError)):
+            return TRANSIENT
+        if isinstance(exc, openai.APIStatusError):
+            if exc.status_code in RETRYABLE_STATUS or exc.status_code >= 500:
+                return TRANSIENT
+            return FATAL
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+        return TRANSIENT
+    # Parse and schema validation errors (including langchain's OutputParserException) are ValueErrors
+    if isinstance(exc, ValueError):
+        return INVALID_OUTPUT
+    return None
+
+
+def classify_error(exc: BaseException) -> str:
+    """Sort an upstream failure into TRANSIENT, INVALID_OUTPUT or FATAL
+
+    The provider wrapper is unwrapped and the outermost error we recognise
+    decides, so an APIConnectionError is not mistaken for its OSError cause.
+    """
+    for cause in _causes(exc):
+        kind = _classify_one(cause)
+        if kind is not None:
+            return kind
+    return FATAL
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the upstream asked us to wait, from a Retry-After header"""
+    openai = _openai()
+    if openai is None:
+        return None
+    for cause in _causes(exc):
+        if isinstance(cause, openai.APIStatusError):
+            try:
+                return float(cause.response.headers.get("retry-after", ""))
+            except ValueError:
+                return None
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number ``attempt`` (1-based)"""
+    cap = min(settings.retry_max_delay, settings.retry_base_delay * 2 ** (attempt - 1))
+    return random.uniform(0, cap)
+
+
+class Deadline:
+    """Absolute time budget for one request, shared by all of its attempts"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """Per-backend breaker: closed -> open after consecutive failures -> half-open probe
+
+    While open the backend is skipped by routing. Once ``reset_timeout`` has
+    passed a single probe is let through (half-open); its success closes the
+    circuit and its failure opens it again. A probe that ends without a
+    verdict is released for the next call; one that never reports back at
+    all is replaced after another ``reset_timeout``.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether a call may be routed here now (no state change)"""
+        if self.state == self.CLOSED:
+            return True
+        return time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def acquire(self) -> None:
+        """Claim the half-open probe when the open period is over"""
+        with self._lock:
+            if self.state != self.CLOSED and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                # Re-arm the timer so only one probe goes out per reset_timeout
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give back a claimed half-open probe without a verdict on the backend
+
+        For calls that ended without saying anything about the upstream's
+        health (our own bad request, unparsable output, a cancelled call):
+        the state and failure count stay as they are, and the next call may
+        probe straight away.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+    def record(self, healthy: bool) -> None:
+        with self._lock:
+            if healthy:
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+        }
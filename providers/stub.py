@@ -0,0 +1,41 @@
+"""Local OpenAI-compatible stub backend for tests, benchmarks and local runs"""
+from typing import Optional
+
+import httpx
+
+from providers.deepseek import DeepSeekProvider
+from providers.stub_server import STUB_BASE_URL, StubBehavior, StubTransport
+
+
+class StubProvider(DeepSeekProvider):
+    """OpenAI-compatible stub backend for tests, benchmarks and local runs
+
+    Without ``base_url`` every call is answered in-process by a
+    ``StubTransport`` shaped by the StubBehavior options (latency, token_rate,
+    error_rate, ...); with one it talks to a stub server started by
+    ``start_in_process`` or ``python -m providers.stub_server``.
+    """
+
+    name = "stub"
+
+    def __init__(
+            self,
+            http_client: Optional[httpx.Client] = None,
+            http_async_client: Optional[httpx.AsyncClient] = None,
+            model: str = "deepseek-chat",
+            api_key: Optional[str] = None,
+            base_url: Optional[str] = None,
+            **behavior,
+    ):
+        if base_url is None:
+            transport = StubTransport(StubBehavior.from_options(behavior))
+            http_client = httpx.Client(transport=transport)
+            http_async_client = httpx.AsyncClient(transport=transport)
+            base_url = STUB_BASE_URL
+        super().__init__(
+            http_client=http_client,
+            http_async_client=http_async_client,
+            model=model,
+            api_key=api_key or "stub",
+            base_url=base_url,
+        )
@@ -0,0 +1,466 @@
+"""OpenAI-compatible stub upstream
+
+Speaks the ``/chat/completions`` wire protocol (plain, streaming, tool
+calling and JSON mode). ``StubTransport`` answers in-process as an httpx
+transport; ``create_app``/``start_in_process`` expose the same protocol as a
+local HTTP server. ``StubBehavior`` shapes both: a latency distribution,
+the streaming token rate, the reply length and injected errors. This module
+deliberately does not import the application config so benchmarks can start
+it before configuring UniAI.
+
+Run it standalone with ``python -m providers.stub_server --port 9000``.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import socket
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Union
+
+import httpx
+
+STUB_EVENTS = {
+    "events": [
+        {
+            "title": "Review algorithms",
+            "description": "Sorting and searching",
+            "duration": 120,
+            "priority": "high",
+            "category": "study",
+            "suggested_time": "morning",
+            "day": 1,
+        },
+        {
+            "title": "Workout",
+            "description": "Strength training",
+            "duration": 60,
+            "priority": "medium",
+            "category": "health",
+            "suggested_time": "evening",
+            "day": 1,
+        },
+    ]
+}
+
+# Re-planning patch: drop the first task, lengthen the second, add one
+STUB_PATCH = {
+    "remove": [0],
+    "modify": [{"id": 1, "duration": 90}],
+    "add": [{
+        "title": "Read a paper",
+        "description": "Skim the related work section",
+        "duration": 45,
+        "priority": "low",
+        "category": "study",
+        "suggested_time": "afternoon",
+        "day": 1,
+    }],
+}
+
+STUB_BASE_URL = "http://stub.local/v1"
+
+ERROR_MESSAGES = {
+    429: "Rate limit reached for requests",
+    500: "The server had an error while processing your request",
+    502: "Bad gateway",
+    503: "The engine is currently overloaded, please try again later",
+}
+
+
+class LatencyDistribution:
+    """Upstream latency in seconds, parsed from a ``kind:params`` spec
+
+    - ``fixed:1.0`` (or just ``1.0``)
+    - ``uniform:0.5,1.5`` (low, high)
+    - ``normal:1.0,0.2`` (mean, stddev; clipped at zero)
+    - ``lognormal:0.8,0.5`` (median, sigma; the long tail real LLM APIs show)
+    - ``exponential:1.0`` (mean)
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+
+    def __init__(self, kind: str = "fixed", params: Sequence[float] = (0.0,)):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}'")
+        if len(params) != self.KINDS[kind]:
+            raise ValueError(f"Latency distribution '{kind}' takes {self.KINDS[kind]} parameter(s)")
+        self.kind = kind
+        self.params = tuple(float(p) for p in params)
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, "LatencyDistribution"]) -> "LatencyDistribution":
+        if isinstance(spec, LatencyDistribution):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("fixed", (spec,))
+        kind, _, params = str(spec).partition(":")
+        if not params:
+            return cls("fixed", (float(kind),))
+        return cls(kind.strip(), [float(p) for p in params.split(",")])
+
+    def sample(self, rng: random.Random) -> float:
+        a = self.params[0]
+        if self.kind == "fixed":
+            return a
+        if self.kind == "uniform":
+            return rng.uniform(a, self.params[1])
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(a, self.params[1]))
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(a), self.params[1]) if a > 0 else 0.0
+        return rng.expovariate(1 / a) if a > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.kind}:{','.join(f'{p:g}' for p in self.params)}"
+
+
+class StubBehavior:
+    """How the stub answers: latency, streaming rate, reply length and errors
+
+    ``latency`` is the time to the first byte. Streams then send
+    ``token_rate`` chunks per second (0 sends them all at once). A fraction
+    ``error_rate`` of requests fail with one of ``error_statuses``, and a
+    fraction ``timeout_rate`` stall for ``stall`` seconds first so client
+    deadlines can be exercised. ``reply_tokens`` pads plain replies to a
+    fixed number of chunks; ``seed`` makes a run repeatable.
+    """
+
+    def __init__(
+            self,
+            latency: Union[str, float, LatencyDistribution] = 0.0,
+            token_rate: float = 0.0,
+            reply_tokens: int = 0,
+            error_rate: float = 0.0,
+            error_statuses: Sequence[int] = (500, 503, 429),
+            timeout_rate: float = 0.0,
+            stall: float = 60.0,
+            seed: Optional[int] = None,
+    ):
+        self.latency = LatencyDistribution.parse(latency)
+        self.token_rate = float(token_rate)
+        self.reply_tokens = int(reply_tokens)
+        self.error_rate = float(error_rate)
+        self.error_statuses = tuple(int(s) for s in error_statuses)
+        self.timeout_rate = float(timeout_rate)
+        self.stall = float(stall)
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def from_options(cls, options: Optional[dict]) -> "StubBehavior":
+        return cls(**(options or {}))
+
+    def options(self) -> dict:
+        """Picklable constructor arguments, for passing to a server process"""
+        return {
+            "latency": str(self.latency),
+            "token_rate": self.token_rate,
+            "reply_tokens": self.reply_tokens,
+            "error_rate": self.error_rate,
+            "error_statuses": list(self.error_statuses),
+            "timeout_rate": self.timeout_rate,
+            "stall": self.stall,
+            "seed": self.seed,
+        }
+
+    def sample_latency(self) -> float:
+        return self.latency.sample(self.rng)
+
+    def token_interval(self) -> float:
+        return 1 / self.token_rate if self.token_rate > 0 else 0.0
+
+    def sample_fault(self) -> Optional[str]:
+        """None, "error" or "stall" for the next request"""
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            return "error"
+        if roll < self.error_rate + self.timeout_rate:
+            return "stall"
+        return None
+
+    def error_payload(self):
+        status = self.rng.choice(self.error_statuses)
+        message = ERROR_MESSAGES.get(status, "Injected stub error")
+        return status, {"error": {"message": message, "type": "stub_injected_error", "code": status}}
+
+
+def _last_user_message(body: dict) -> str:
+    for message in reversed(body.get("messages", [])):
+        if message.get("role") == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+    return ""
+
+
+def _reply_text(body: dict, behavior: Optional[StubBehavior] = None) -> str:
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps(STUB_EVENTS, ensure_ascii=False)
+    text = f"[stub] {_last_user_message(body)[:200]}"
+    if behavior is not None and behavior.reply_tokens * 4 > len(text):
+        text = (text + " lorem" * behavior.reply_tokens)[:behavior.reply_tokens * 4]
+    return text
+
+
+# System prompts seen so far, to emulate DeepSeek's prefix (context) cache
+_cached_prefixes: Set[str] = set()
+PREFIX_CACHE_UNIT = 64
+
+
+def _prefix_cache_hit(body: dict) -> int:
+    """Prompt tokens a prefix cache would serve: a repeated system prompt, in 64-token units"""
+    messages = body.get("messages", [])
+    if not messages or messages[0].get("role") != "system":
+        return 0
+    prefix = f"{body.get('model')}\n{messages[0].get('content', '')}"
+    if prefix not in _cached_prefixes:
+        if len(_cached_prefixes) >= 10000:
+            _cached_prefixes.clear()
+        _cached_prefixes.add(prefix)
+        return 0
+    return len(str(messages[0].get("content", ""))) // 4 // PREFIX_CACHE_UNIT * PREFIX_CACHE_UNIT
+
+
+def _usage(body: dict, completion_tokens: int) -> Dict[str, int]:
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4 + 1
+    cache_hit = _prefix_cache_hit(body)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_cache_hit_tokens": cache_hit,
+        "prompt_cache_miss_tokens": prompt_tokens - cache_hit,
+    }
+
+
+def completion_payload(body: dict, behavior: Optional[StubBehavior] = None) -> dict:
+    """Build a non-streaming chat.completion response for a request body"""
+    finish_reason = "stop"
+    if body.get("tools"):
+        tool = body["tools"][0]["function"]["name"]
+        message = {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [{
+                "id": "call_0",
+                "type": "function",
+                "function": {"name": tool, "arguments": json.dumps(
+                    STUB_PATCH if tool == "LLMPatch" else STUB_EVENTS, ensure_ascii=False
+                )},
+            }],
+        }
+        finish_reason = "tool_calls"
+        completion_tokens = 60
+    else:
+        content = _reply_text(body, behavior)
+        message = {"role": "assistant", "content": content}
+        completion_tokens = len(stream_tokens(body, behavior))
+
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "deepseek-chat"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": _usage(body, completion_tokens),
+    }
+
+
+def stream_tokens(body: dict, behavior: Optional[StubBehavior] = None) -> List[str]:
+    """Split the reply into the token deltas a streaming response sends"""
+    text = _reply_text(body, behavior)
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def stream_chunk(body: dict, delta: Optional[dict] = None, finish_reason: str = None, usage: dict = None) -> bytes:
+    """Encode one chat.completion.chunk SSE frame"""
+    payload = {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "deepseek-chat"),
+        "choices": [] if usage is not None else [{"index": 0, "delta": delta or {}, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        payload["usage"] = usage
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode()
+
+
+def iter_stream(body: dict, behavior: Optional[StubBehavior] = None) -> Iterator[bytes]:
+    """Yield the full SSE frame sequence for a streaming request"""
+    tokens = stream_tokens(body, behavior)
+    yield stream_chunk(body, {"role": "assistant", "content": ""})
+    for token in tokens:
+        yield stream_chunk(body, {"content": token})
+    yield stream_chunk(body, finish_reason="stop")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield stream_chunk(body, usage=_usage(body, len(tokens)))
+    yield b"data: [DONE]\n\n"
+
+
+async def _paced(frames: Iterator[bytes], interval: float) -> AsyncIterator[bytes]:
+    for frame in frames:
+        yield frame
+        if interval:
+            await asyncio.sleep(interval)
+
+
+def _paced_sync(frames: Iterator[bytes], interval: float) -> Iterator[bytes]:
+    for frame in frames:
+        yield frame
+        if interval:
+            time.sleep(interval)
+
+
+def handle_request(request: httpx.Request) -> httpx.Response:
+    """httpx mock-transport handler answering /chat/completions instantly"""
+    if not request.url.path.endswith("/chat/completions"):
+        return httpx.Response(404, json={"error": {"message": "Not found"}})
+    body = json.loads(request.content or b"{}")
+    if body.get("stream"):
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=b"".join(iter_stream(body)))
+    return httpx.Response(200, json=completion_payload(body))
+
+
+class StubTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport answering /chat/completions in-process with StubBehavior
+
+    The async path sleeps on the event loop, so a single process can hold
+    thousands of simulated in-flight upstream calls.
+    """
+
+    def __init__(self, behavior: Optional[StubBehavior] = None):
+        self.behavior = behavior or StubBehavior()
+
+    def _prepare(self, request: httpx.Request):
+        """(delay, immediate response or None, parsed body)"""
+        behavior = self.behavior
+        if not request.url.path.endswith("/chat/completions"):
+            return 0.0, httpx.Response(404, json={"error": {"message": "Not found"}}), None
+        fault = behavior.sample_fault()
+        delay = behavior.stall if fault == "stall" else behavior.sample_latency()
+        if fault == "error":
+            status, payload = behavior.error_payload()
+            return delay, httpx.Response(status, json=payload), None
+        return delay, None, json.loads(request.content or b"{}")
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        delay, response, body = self._prepare(request)
+        time.sleep(delay)
+        if response is not None:
+            return response
+        if body.get("stream"):
+            frames = _paced_sync(iter_stream(body, self.behavior), self.behavior.token_interval())
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=frames)
+        return httpx.Response(200, json=completion_payload(body, self.behavior))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        delay, response, body = self._prepare(request)
+        await asyncio.sleep(delay)
+        if response is not None:
+            return response
+        if body.get("stream"):
+            frames = _paced(iter_stream(body, self.behavior), self.behavior.token_interval())
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=frames)
+        return httpx.Response(200, json=completion_payload(body, self.behavior))
+
+
+def create_app(latency: Union[str, float] = 1.0, token_interval: Optional[float] = None,
+               behavior: Optional[StubBehavior] = None):
+    """Create an ASGI stub upstream
+
+    ``latency`` (seconds or a distribution spec) and ``token_interval`` are
+    shorthands used when no ``behavior`` is given.
+    """
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    if behavior is None:
+        behavior = StubBehavior(latency=latency, token_rate=1 / token_interval if token_interval else 100.0)
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        fault = behavior.sample_fault()
+        await asyncio.sleep(behavior.stall if fault == "stall" else behavior.sample_latency())
+        if fault == "error":
+            status, payload = behavior.error_payload()
+            return JSONResponse(payload, status_code=status)
+
+        if not body.get("stream"):
+            return JSONResponse(completion_payload(body, behavior))
+        return StreamingResponse(_paced(iter_stream(body, behavior), behavior.token_interval()),
+                                 media_type="text/event-stream")
+
+    return Starlette(routes=[
+        Route("/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    ])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(port: int, options: dict, host: str = "127.0.0.1") -> None:
+    import uvicorn
+
+    app = create_app(behavior=StubBehavior.from_options(options))
+    uvicorn.run(app, host=host, port=port, log_level="warning", backlog=4096)
+
+
+def start_in_process(latency: Union[str, float] = 1.0, **options) -> str:
+    """Serve the stub from a daemon process and return its base URL
+
+    A separate process keeps the upstream's CPU work off the benchmarked
+    process, so the numbers reflect UniAI alone. Keyword arguments are
+    StubBehavior options; streams default to 100 chunks per second.
+    """
+    options = {"token_rate": 100.0, **options, "latency": str(LatencyDistribution.parse(latency))}
+    port = _free_port()
+    multiprocessing.Process(target=_serve, args=(port, options), daemon=True).start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5", help="seconds or kind:params distribution spec")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="streamed chunks per second (0 = no pacing)")
+    parser.add_argument("--reply-tokens", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-statuses", default="500,503,429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--stall", type=float, default=60.0)
+    args = parser.parse_args()
+
+    options = StubBehavior(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(",")],
+        timeout_rate=args.timeout_rate,
+        stall=args.stall,
+    ).options()
+    print(f"Stub upstream on http://{args.host}:{args.port}/v1 ({options})")
+    _serve(args.port, options, args.host)
+
+
+if __name__ == "__main__":
+    main()
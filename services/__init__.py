@@ -1,4 +1,5 @@
 from .chat_service import ChatService
 from .schedule_service import ScheduleService
+from .session_service import SessionService
 
-__all__ = ["ChatService", "ScheduleService"]
+__all__ = ["ChatService", "ScheduleService", "SessionService"]
@@ -1,48 +1,494 @@
-from models.response import ChatResponse, ChatResponseData, Model, Usage
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Optional, Tuple
+
+from pydantic import ValidationError
+
+from models.request import ChatRequest
+from models.response import (
+    BatchChatItem,
+    BatchChatResponse,
+    ChatResponse,
+    ChatResponseData,
+    ErrorResponse,
+    Model,
+    Usage,
+)
+from core.cache import cache_status, make_cache_key, response_cache
 from core.config import settings
-from core.exceptions import ModelNotSupportedException, ProviderException
+from core.near_cache import near_cache
+from core.exceptions import (
+    ContextLengthExceededException,
+    ModelNotSupportedException,
+    ProviderException,
+    SceneNotFoundException,
+    UniAIException,
+)
+from core.singleflight import Codec, singleflight
+from core.tracing import span
+from services.session_service import SessionService
+from utils.streaming import format_sse
 from utils.time_utils import get_current_timestamp
-from providers.deepseek import get_deepseek_response
+from utils.tokens import estimate_chat_tokens, trim_to_tokens
+from providers.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Coalesced results handed to other workers when the response cache does not carry them
+DATA_CODEC = Codec(lambda data: data.model_dump_json(), ChatResponseData.model_validate_json)
+
 
 class ChatService:
     @staticmethod
-    def process_chat_request(request):
+    def _resolve_system_prompt(request):
+        """Resolve the scene system prompt for a request"""
+        scene_id = request.parameters.prompt_id
+        if not scene_id:
+            return None
+        system_prompt = settings.get_prompt(scene_id)
+        if system_prompt is None:
+            # Removed by a config reload after the request was validated
+            raise SceneNotFoundException(scene_id)
+        return system_prompt
+
+    @staticmethod
+    def fit_context(request):
+        """Check a request against the model's context window before calling upstream
+
+        max_tokens is lowered to what the window leaves after the estimated
+        prompt. A prompt that leaves less than MIN_COMPLETION_TOKENS is
+        rejected, or with CONTEXT_OVERFLOW=trim cut from the start. Returns
+        the request itself when nothing had to change, else an adjusted copy.
+        """
+        parameters = request.parameters
+        system_prompt = ChatService._resolve_system_prompt(request)
+        window = settings.get_context_window(request.model)
+        prompt = parameters.prompt
+        prompt_tokens = estimate_chat_tokens(prompt, system_prompt)
+        min_completion = min(parameters.max_tokens, settings.min_completion_tokens)
+
+        if window - prompt_tokens < min_completion:
+            if settings.context_overflow != "trim":
+                raise ContextLengthExceededException(request.model, prompt_tokens, window)
+            budget = window - estimate_chat_tokens("", system_prompt) - min_completion
+            prompt = trim_to_tokens(prompt, budget)
+            if not prompt:
+                raise ContextLengthExceededException(request.model, prompt_tokens, window)
+            logger.info(f"Trimmed prompt from ~{prompt_tokens} tokens request_id={request.request_id}")
+            prompt_tokens = estimate_chat_tokens(prompt, system_prompt)
+
+        max_tokens = min(parameters.max_tokens, window - prompt_tokens)
+        if prompt is parameters.prompt and max_tokens == parameters.max_tokens:
+            return request
+        return request.model_copy(update={
+            "parameters": parameters.model_copy(update={"prompt": prompt, "max_tokens": max_tokens}),
+        })
+
+    @staticmethod
+    def _history_budget(request, system_prompt) -> Tuple[int, int]:
+        """Tokens the context window leaves after the prompt, and of those what history may use"""
+        parameters = request.parameters
+        left = settings.get_context_window(request.model) - estimate_chat_tokens(parameters.prompt, system_prompt)
+        return left, left - min(parameters.max_tokens, settings.min_completion_tokens)
+
+    @staticmethod
+    def _fit_history(request, left: int, history_tokens: int):
+        parameters = request.parameters
+        max_tokens = min(parameters.max_tokens, left - history_tokens)
+        if max_tokens == parameters.max_tokens:
+            return request
+        return request.model_copy(update={
+            "parameters": parameters.model_copy(update={"max_tokens": max_tokens}),
+        })
+
+    @staticmethod
+    def _session_history(request, system_prompt):
+        """History for a session request, and the request with max_tokens lowered to what it leaves
+
+        History gets what the context window leaves after the prompt and the
+        minimum completion; it is empty for requests without a session. A
+        ``session_id: "new"`` request comes back naming the session created for it.
+        """
+        if not request.session_id:
+            return [], request
+        request = SessionService.open(request)
+        left, budget = ChatService._history_budget(request, system_prompt)
+        history, history_tokens = SessionService.history(request, budget)
+        return history, ChatService._fit_history(request, left, history_tokens)
+
+    @staticmethod
+    async def _asession_history(request, system_prompt):
+        """_session_history for async callers"""
+        if not request.session_id:
+            return [], request
+        request = await SessionService.aopen(request)
+        left, budget = ChatService._history_budget(request, system_prompt)
+        history, history_tokens = await SessionService.ahistory(request, budget)
+        return history, ChatService._fit_history(request, left, history_tokens)
+
+    @staticmethod
+    def _request_key(request, system_prompt) -> str:
+        """Canonical key identifying the upstream call a request would make"""
+        return make_cache_key(
+            "chat",
+            request.model,
+            system_prompt,
+            request.parameters.prompt,
+            request.parameters.temperature,
+            request.parameters.max_tokens,
+        )
+
+    @staticmethod
+    def _cache_key(request, request_key: str, use_cache: bool):
+        """Response cache key for a request, or None when caching does not apply"""
+        # Session replies depend on the conversation so far, so they are never shared
+        if response_cache is None or not use_cache or request.session_id \
+                or not settings.is_response_cache_enabled(request.parameters.prompt_id):
+            cache_status.set("BYPASS")
+            return None
+        return request_key
+
+    @staticmethod
+    def _cached_data(cache_key) -> Optional[ChatResponseData]:
+        """Cached response data"""
+        cached = response_cache.get(cache_key) if cache_key is not None else None
+        return ChatResponseData.model_validate_json(cached) if cached is not None else None
+
+    @staticmethod
+    async def _acached_data(cache_key) -> Optional[ChatResponseData]:
+        """_cached_data for async callers, also used to pick up a result another worker just stored"""
+        cached = await response_cache.aget(cache_key) if cache_key is not None else None
+        return ChatResponseData.model_validate_json(cached) if cached is not None else None
+
+    @staticmethod
+    def _near_scope(request, system_prompt) -> str:
+        """Everything but the prompt that identifies an upstream call, for near-duplicate lookups"""
+        return make_cache_key(
+            "chat", request.model, system_prompt, request.parameters.temperature, request.parameters.max_tokens
+        )
+
+    @staticmethod
+    def _near_data(request, system_prompt) -> Optional[ChatResponseData]:
+        """Cached response to a near-duplicate prompt, for scenes that opt in"""
+        threshold = settings.get_near_cache_threshold(request.parameters.prompt_id)
+        if near_cache is None or threshold is None:
+            return None
+        cached = near_cache.get(ChatService._near_scope(request, system_prompt), request.parameters.prompt, threshold)
+        return ChatResponseData.model_validate_json(cached) if cached is not None else None
+
+    @staticmethod
+    def _serve_cached(request, system_prompt, data: Optional[ChatResponseData], lookup):
+        """Response for an exact cache lookup's result, falling back to a near-duplicate"""
+        status = "HIT"
+        if data is None:
+            data = ChatService._near_data(request, system_prompt)
+            status = "NEAR"
+        if data is None:
+            status = "MISS"
+        lookup.set(status=status)
+        cache_status.set(status)
+        if data is None:
+            return None
+        return ChatResponse(
+            data=data,
+            request_id=request.request_id,
+            timestamp=get_current_timestamp()
+        )
+
+    @staticmethod
+    def _cached_response(request, cache_key, system_prompt):
+        """Serve a request from the response cache if possible"""
+        if cache_key is None:
+            return None
+        with span("cache_lookup") as lookup:
+            return ChatService._serve_cached(request, system_prompt, ChatService._cached_data(cache_key), lookup)
+
+    @staticmethod
+    async def _acached_response(request, cache_key, system_prompt):
+        """_cached_response for async callers"""
+        if cache_key is None:
+            return None
+        with span("cache_lookup") as lookup:
+            data = await ChatService._acached_data(cache_key)
+            return ChatService._serve_cached(request, system_prompt, data, lookup)
+
+    @staticmethod
+    def _store_near(request, system_prompt, value: str) -> None:
+        threshold = settings.get_near_cache_threshold(request.parameters.prompt_id)
+        if near_cache is not None and threshold is not None:
+            near_cache.set(ChatService._near_scope(request, system_prompt), request.parameters.prompt, value, threshold)
+
+    @staticmethod
+    def _store_data(request, system_prompt, cache_key, data: ChatResponseData) -> None:
+        if cache_key is None:
+            return
+        value = data.model_dump_json()
+        response_cache.set(cache_key, value)
+        ChatService._store_near(request, system_prompt, value)
+
+    @staticmethod
+    async def _astore_data(request, system_prompt, cache_key, data: ChatResponseData) -> None:
+        """_store_data for async callers"""
+        if cache_key is None:
+            return
+        value = data.model_dump_json()
+        await response_cache.aset(cache_key, value)
+        ChatService._store_near(request, system_prompt, value)
+
+    @staticmethod
+    def _build_response(request, response_obj, provider_name: str) -> ChatResponse:
+        """Wrap a provider response into the public ChatResponse"""
+        return ChatResponse(
+            data=ChatService._build_data(request, response_obj, provider_name),
+            request_id=request.request_id,
+            timestamp=get_current_timestamp(),
+            session_id=request.session_id,
+        )
+
+    @staticmethod
+    def _build_data(request, response_obj, provider_name: str) -> ChatResponseData:
+        """Request-independent part of the response: what is cached and shared by coalesced calls"""
+        usage = response_obj.response_metadata.get('token_usage', {})
+
+        return ChatResponseData(
+            result=response_obj.content,
+            model=Model(
+                name=request.model,
+                provider=provider_name,
+                version=response_obj.response_metadata.get('model_name', 'unknown')
+            ),
+            usage=Usage(
+                prompt_tokens=usage.get('prompt_tokens', 0),
+                completion_tokens=usage.get('completion_tokens', 0),
+                total_tokens=usage.get('total_tokens', 0),
+                prompt_cache_hit_tokens=usage.get('prompt_cache_hit_tokens'),
+                prompt_cache_miss_tokens=usage.get('prompt_cache_miss_tokens'),
+            )
+        )
+
+    @staticmethod
+    def process_chat_request(request, use_cache: bool = True):
         """Core business logic for processing chat requests"""
-        system_prompt = None
-        if request.parameters.prompt_id:
-            system_prompt = settings.get_prompt(request.parameters.prompt_id)
+        request = ChatService.fit_context(request)
+        system_prompt = ChatService._resolve_system_prompt(request)
+
+        if registry.has_model(request.model):
+            history, request = ChatService._session_history(request, system_prompt)
+            request_key = ChatService._request_key(request, system_prompt)
+            cache_key = ChatService._cache_key(request, request_key, use_cache)
+            cached = ChatService._cached_response(request, cache_key, system_prompt)
+            if cached is not None:
+                return cached
 
-        if request.model == "deepseek-chat":
             try:
-                response_obj = get_deepseek_response(
-                    request.parameters.prompt, 
-                    system_prompt=system_prompt,
-                    temperature=request.parameters.temperature,
-                    max_tokens=request.parameters.max_tokens
+                response_obj, backend = registry.call(
+                    request.model,
+                    lambda provider: provider.get_response(
+                        request.parameters.prompt,
+                        system_prompt=system_prompt,
+                        temperature=request.parameters.temperature,
+                        max_tokens=request.parameters.max_tokens,
+                        history=history,
+                    ),
                 )
-                
-                usage = response_obj.response_metadata.get('token_usage', {})
-                
-                response_data = ChatResponseData(
-                    result=response_obj.content,
-                    model=Model(
-                        name=request.model,
-                        provider="deepseek",
-                        version=response_obj.response_metadata.get('model_name', 'unknown')
+                response = ChatService._build_response(request, response_obj, backend.provider.name)
+                ChatService._store_data(request, system_prompt, cache_key, response.data)
+                SessionService.record_turn(request, response.data.result)
+                return response
+            except UniAIException:
+                raise
+            except Exception as e:
+                raise ProviderException("chat_service", str(e))
+
+        raise ModelNotSupportedException(request.model)
+
+    @staticmethod
+    async def aprocess_chat_request(request, use_cache: bool = True):
+        """Async variant of process_chat_request that never blocks the event loop"""
+        request = ChatService.fit_context(request)
+        system_prompt = ChatService._resolve_system_prompt(request)
+
+        if registry.has_model(request.model):
+            history, request = await ChatService._asession_history(request, system_prompt)
+            request_key = ChatService._request_key(request, system_prompt)
+            cache_key = ChatService._cache_key(request, request_key, use_cache)
+            cached = await ChatService._acached_response(request, cache_key, system_prompt)
+            if cached is not None:
+                return cached
+
+            async def fetch() -> ChatResponseData:
+                response_obj, backend = await registry.acall(
+                    request.model,
+                    lambda provider: provider.aget_response(
+                        request.parameters.prompt,
+                        system_prompt=system_prompt,
+                        temperature=request.parameters.temperature,
+                        max_tokens=request.parameters.max_tokens,
+                        history=history,
                     ),
-                    usage=Usage(
-                        prompt_tokens=usage.get('prompt_tokens', 0),
-                        completion_tokens=usage.get('completion_tokens', 0),
-                        total_tokens=usage.get('total_tokens', 0)
-                    )
+                    kind="chat",
                 )
+                data = ChatService._build_data(request, response_obj, backend.provider.name)
+                await ChatService._astore_data(request, system_prompt, cache_key, data)
+                return data
 
+            try:
+                # Identical requests in flight at the same time (in any worker) share one upstream call
+                data = await singleflight.do(
+                    request_key if use_cache and settings.single_flight_enabled and not request.session_id else None,
+                    fetch,
+                    recheck=(lambda: ChatService._acached_data(cache_key)) if cache_key is not None else None,
+                    codec=DATA_CODEC,
+                )
+                await SessionService.arecord_turn(request, data.result)
                 return ChatResponse(
-                    data=response_data,
+                    data=data,
                     request_id=request.request_id,
-                    timestamp=get_current_timestamp()
+                    timestamp=get_current_timestamp(),
+                    session_id=request.session_id,
                 )
+            except UniAIException:
+                raise
             except Exception as e:
-                raise ProviderException("deepseek", str(e))
-        
-        raise ModelNotSupportedException(request.model)
\ No newline at end of file
+                raise ProviderException("chat_service", str(e))
+
+        raise ModelNotSupportedException(request.model)
+
+    @staticmethod
+    async def aprocess_batch_request(batch, use_cache: bool = True) -> BatchChatResponse:
+        """Run a batch of chat requests concurrently under a concurrency limit
+
+        Results keep the order of the input. An item that fails validation
+        or processing is reported as an error entry and does not fail the
+        rest of the batch.
+        """
+        concurrency = min(batch.concurrency or settings.batch_concurrency, settings.batch_concurrency)
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        def failed(index, request_id: str, code: int, message: str) -> BatchChatItem:
+            return BatchChatItem(
+                index=index,
+                success=False,
+                error=ErrorResponse(
+                    code=code,
+                    message=message,
+                    request_id=request_id,
+                    timestamp=get_current_timestamp()
+                )
+            )
+
+        async def run(index, item) -> BatchChatItem:
+            try:
+                request = ChatRequest.model_validate(item)
+            except ValidationError as e:
+                request_id = item.get("request_id") if isinstance(item, dict) else None
+                errors = "; ".join(
+                    f"{'.'.join(str(part) for part in error['loc']) or 'item'}: {error['msg']}" for error in e.errors()
+                )
+                return failed(index, str(request_id or batch.request_id), 422, f"Invalid request: {errors}")
+            async with semaphore:
+                try:
+                    response = await ChatService.aprocess_chat_request(request, use_cache=use_cache)
+                    return BatchChatItem(index=index, success=True, data=response)
+                except Exception as e:
+                    if isinstance(e, UniAIException):
+                        code, message = e.code, e.message
+                    else:
+                        logger.error(f"Unexpected batch item error: {str(e)}", exc_info=True)
+                        code, message = 500, "Internal server error"
+                    return failed(index, request.request_id, code, message)
+
+        results = await asyncio.gather(*(run(i, r) for i, r in enumerate(batch.requests)))
+        succeeded = sum(1 for item in results if item.success)
+
+        return BatchChatResponse(
+            results=results,
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            request_id=batch.request_id,
+            timestamp=get_current_timestamp()
+        )
+
+    @staticmethod
+    def check_model(request):
+        """Raise before any streaming starts if the model cannot be served"""
+        if not registry.has_model(request.model):
+            raise ModelNotSupportedException(request.model)
+
+    @staticmethod
+    async def astream_chat_request(request) -> AsyncIterator[str]:
+        """Stream a chat completion as Server-Sent Events
+
+        Callers should pass the request through fit_context first, so that
+        oversized prompts are rejected before the stream starts.
+
+        Each content delta is sent as its own frame. The final frame carries
+        the model info, token usage, time-to-first-token and request_id, and is
+        followed by the ``[DONE]`` sentinel. Failures after the stream has
+        started are reported as an ``error`` event. A session turn is only
+        recorded once the whole reply has streamed; callers should open a
+        ``session_id: "new"`` session first to send its id in a header.
+        """
+        ChatService.check_model(request)
+        system_prompt = ChatService._resolve_system_prompt(request)
+        history, request = await ChatService._asession_history(request, system_prompt)
+
+        started = time.perf_counter()
+        ttft_ms = None
+        parts = []
+        try:
+            async for chunk, backend in registry.astream(
+                request.model,
+                lambda provider: provider.astream_response(
+                    request.parameters.prompt,
+                    system_prompt=system_prompt,
+                    temperature=request.parameters.temperature,
+                    max_tokens=request.parameters.max_tokens,
+                    history=history,
+                ),
+            ):
+                if chunk.content:
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                        logger.info(f"chat stream ttft_ms={ttft_ms:.1f} request_id={request.request_id}")
+                    parts.append(chunk.content)
+                    yield format_sse({"request_id": request.request_id, "delta": chunk.content})
+                    continue
+
+                usage = chunk.response_metadata.get('token_usage', {})
+                yield format_sse({
+                    "request_id": request.request_id,
+                    "done": True,
+                    "model": {
+                        "name": request.model,
+                        "provider": backend.provider.name,
+                        "version": chunk.response_metadata.get('model_name', 'unknown'),
+                    },
+                    "usage": Usage(
+                        prompt_tokens=usage.get('prompt_tokens', 0),
+                        completion_tokens=usage.get('completion_tokens', 0),
+                        total_tokens=usage.get('total_tokens', 0),
+                        prompt_cache_hit_tokens=usage.get('prompt_cache_hit_tokens'),
+                        prompt_cache_miss_tokens=usage.get('prompt_cache_miss_tokens'),
+                    ).model_dump(),
+                    "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+                    "session_id": request.session_id,
+                    "timestamp": get_current_timestamp(),
+                })
+            await SessionService.arecord_turn(request, "".join(parts))
+            yield format_sse("[DONE]")
+
+        except Exception as e:
+            if isinstance(e, UniAIException):
+                code, message = e.code, e.message
+                logger.warning(f"chat stream failed request_id={request.request_id}: {message}")
+            else:
+                code, message = 500, "Internal server error"
+                logger.error(f"chat stream failed request_id={request.request_id}: {e}", exc_info=True)
+            yield format_sse({
+                "code": code,
+                "message": message,
+                "request_id": request.request_id,
+                "timestamp": get_current_timestamp(),
+            }, event="error")
@@ -1,114 +1,540 @@
 import json
+import logging
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 import time
 
-from core.exceptions import ProviderException
-from models.schedule import ScheduleRequest, ScheduleResponse, Event, LLMResponse
-from providers.deepseek import DeepSeekProvider
+from pydantic import ValidationError
+
+from core.cache import cache_status, make_cache_key, response_cache
+from core.config import settings
+from core.near_cache import near_cache
+from core.metrics import stage
+from core.exceptions import ProviderException, UniAIException
+from core.singleflight import Codec, singleflight
+from core.tracing import span
+from models.response import Usage
+from models.schedule import (
+    Event, EventChange, LLMPatch, LLMResponse, LLMTask, ScheduleReplanRequest, ScheduleReplanResponse,
+    ScheduleRequest, ScheduleResponse,
+)
+from providers.registry import registry
+from services.slot_planner import SlotPlanner
+from utils.streaming import JSONArrayItemParser
+from utils.time_utils import get_current_datetime, get_current_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+# 日程规划系统提示：静态指令作为逐字节不变的 system 前缀，命中上游前缀（上下文）缓存
+SCHEDULE_SYSTEM_PROMPT = """\
+你是一个专业的日程规划AI助手，具有丰富的心理学和时间管理知识。你的任务是帮助用户制定切实可行、高效且个性化的日程安排。用户的需求描述在用户消息中给出。
+
+## 你的任务
+1. **深度分析用户需求**：理解用户的真实意图和目标
+2. **可行性评估**：评估计划的现实性和可执行性
+3. **智能优化建议**：基于时间管理最佳实践提供改进建议
+4. **个性化调整**：考虑用户偏好和约束条件
+5. **语言一致性**：使用与用户输入相同的语言回复
+6. **日程规划**：根据用户需求和偏好，规划日程安排
+7. **任务时长**: 评估当前用户想计划的事情，需要多长的时间才能完成，根据任务的难度和复杂度，以及用户的需求和偏好，给出合理的任务时长
+
+## 分析维度
+- **时间合理性**：任务时长是否合理？是否需要休息时间？
+- **优先级排序**：重要且紧急的任务是否优先安排？
+- **精力管理**：是否考虑了人的精力曲线（上午精力充沛，下午相对较低）？
+- **任务关联性**：相似类型的任务是否可以集中处理？
+- **缓冲时间**：是否预留了应对突发情况的缓冲时间？
+- **可持续性**：这个计划是否可持续执行？
+- **任务数量**：任务数量是否合理？是否需要减少任务数量？
+- **任务难度**：任务难度是否合理？是否需要降低难度？
+- **任务细分化**：任务是否可以细分？是否需要细分？请不要把多个任务合并为一个任务，任务需要按照天数来规划到每天的任务
+
+## 输出要求
+请以JSON格式返回优化后的日程安排，包含以下字段：
+
+    {
+        "events": [
+            {
+                "title": "事件标题（使用用户输入语言）",
+                "description": "详细描述（包含优化建议和可行性说明）",
+                "duration": 持续时间（分钟，考虑实际可行性）,
+                "priority": "优先级（high/medium/low，基于重要性和紧急性）",
+                "category": "类别（study/work/health/entertainment/personal等）",
+                "suggested_time": "建议时间（morning/afternoon/evening，基于任务性质和精力曲线）",
+                "day": 第几天（相对今天的天数，0为今天，1为明天）
+            }
+        ]
+    }
+
+## 优化原则
+1. **SMART原则**：确保每个任务都是具体、可衡量、可达成、相关、有时限的
+2. **帕累托原则**：80%的成果来自20%的努力，优先安排高价值任务
+3. **时间块管理**：将相似任务集中处理，减少切换成本
+4. **精力匹配**：将需要高专注度的任务安排在精力充沛的时间段
+5. **现实缓冲**：预留15-20%的缓冲时间应对意外情况
+6. **渐进式安排**：避免过度安排，确保计划可持续执行
+
+## 注意事项
+- 如果用户的需求明显不现实，请提供合理的调整建议
+- 考虑用户的个人偏好和约束条件
+- 使用与用户输入相同的语言
+- 在描述中说明为什么这样安排以及如何提高执行效率
+- 请不要把多个任务合并为一个任务，任务需要按照天数来规划到每天的任务
+- 可以提出众多的Event，Event之间可以出现重复
+- 不要给出具体的开始和结束时间，系统会根据时长、优先级和建议时间自动安排互不重叠的时间段并预留缓冲时间
+"""
+
+# 日期与用户输入放在最后，只有这一部分随请求变化
+SCHEDULE_TEMPLATE = "今天是{today}。\n用户描述：{user_prompt}"
+
+WEEKDAYS = "一二三四五六日"
+
+# 重新规划系统提示：只把当前日程的摘要和修改描述发给模型，模型只返回改动的部分
+REPLAN_SYSTEM_PROMPT = """\
+你是一个专业的日程规划AI助手。用户消息中给出当前日程（每行一个任务，行首数字为任务编号）和用户的修改要求，请按要求修改日程。
+
+## 输出要求
+请以JSON格式返回修改补丁，只包含需要改动的任务，不要重复未改动的任务：
+
+    {
+        "remove": [要删除的任务编号],
+        "modify": [
+            {"id": 任务编号, "duration": 修改后的持续时间（只填写需要修改的字段）}
+        ],
+        "add": [
+            {
+                "title": "事件标题（使用用户输入语言）",
+                "description": "详细描述",
+                "duration": 持续时间（分钟）,
+                "priority": "优先级（high/medium/low）",
+                "category": "类别（study/work/health/entertainment/personal等）",
+                "suggested_time": "建议时间（morning/afternoon/evening）",
+                "day": 第几天（相对今天的天数，0为今天，1为明天）
+            }
+        ]
+    }
+
+modify 中可修改的字段：title、description、duration、priority、category、suggested_time、day。
+
+## 注意事项
+- 只改动与用户要求相关的任务，其他任务保持不变
+- 使用与用户输入相同的语言
+- 不要给出具体的开始和结束时间，系统会在保留未改动任务时间的前提下自动安排
+"""
+
+REPLAN_TEMPLATE = "今天是{today}。\n当前日程：\n{schedule}\n修改要求：{change}"
+
+# 模型可以修改的字段中，会影响时间安排的字段
+TIMING_FIELDS = {"duration", "suggested_time", "day"}
 
 
 class ScheduleService:
     @staticmethod
-    def process_schedule_request(request: ScheduleRequest) -> ScheduleResponse:
+    def _today() -> str:
+        today = get_current_datetime()
+        return f"{today:%Y-%m-%d}（星期{WEEKDAYS[today.weekday()]}）"
+
+    @staticmethod
+    def _variables(request: ScheduleRequest) -> Dict[str, str]:
+        """模板变量：只给出日期，让模型把“明天”等换算成天数偏移"""
+        return {"today": ScheduleService._today(), "user_prompt": request.prompt}
+
+    @staticmethod
+    def _request_key(request: ScheduleRequest, variables: Dict[str, str]) -> str:
+        """标识一次上游调用的规范化键（同一天内相同的描述得到相同的任务）"""
+        return make_cache_key(
+            "schedule", settings.schedule_model, SCHEDULE_SYSTEM_PROMPT, SCHEDULE_TEMPLATE,
+            variables["today"], request.prompt, 0, settings.schedule_max_tokens
+        )
+
+    @staticmethod
+    def _cache_key(request_key: str, use_cache: bool):
+        """结果缓存键；不使用缓存时返回None"""
+        if response_cache is None or not use_cache or not settings.is_response_cache_enabled("schedule"):
+            cache_status.set("BYPASS")
+            return None
+        return request_key
+
+    @staticmethod
+    def _pair_codec(model) -> Codec:
+        """跨 worker 合并请求时传递 (解析结果, usage)，用于未开启缓存的情况"""
+        def decode(data: str):
+            parsed, usage = json.loads(data)
+            return model.model_validate(parsed), usage
+
+        return Codec(lambda pair: json.dumps([pair[0].model_dump(mode="json"), pair[1]], ensure_ascii=False), decode)
+
+    @staticmethod
+    def _cached_tasks(cache_key) -> Optional[Tuple[LLMResponse, None]]:
+        """缓存中的任务（以及为空的 usage）"""
+        cached = response_cache.get(cache_key) if cache_key is not None else None
+        return (LLMResponse.model_validate_json(cached), None) if cached is not None else None
+
+    @staticmethod
+    async def _acached_tasks(cache_key) -> Optional[Tuple[LLMResponse, None]]:
+        """_cached_tasks 的异步版本（磁盘层不在事件循环中读取），也用于取得其他 worker 刚写入的结果"""
+        cached = await response_cache.aget(cache_key) if cache_key is not None else None
+        return (LLMResponse.model_validate_json(cached), None) if cached is not None else None
+
+    @staticmethod
+    def _near_scope(variables: Dict[str, str]) -> str:
+        """近似缓存的范围：除用户描述外与 _request_key 相同"""
+        return make_cache_key(
+            "schedule", settings.schedule_model, SCHEDULE_SYSTEM_PROMPT, SCHEDULE_TEMPLATE,
+            variables["today"], 0, settings.schedule_max_tokens
+        )
+
+    @staticmethod
+    def _near_tasks(request: ScheduleRequest, variables: Dict[str, str]) -> Optional[Tuple[LLMResponse, None]]:
+        """与当天某个已缓存描述近似（只差空白、标点或个别字词）时复用其任务"""
+        threshold = settings.get_near_cache_threshold("schedule")
+        if near_cache is None or threshold is None:
+            return None
+        cached = near_cache.get(ScheduleService._near_scope(variables), request.prompt, threshold)
+        return (LLMResponse.model_validate_json(cached), None) if cached is not None else None
+
+    @staticmethod
+    def _serve_cached(request: ScheduleRequest, variables: Dict[str, str], cached, lookup):
+        """精确查找未命中时再查近似缓存，命中则按当前时间排程"""
+        status = "HIT"
+        if cached is None:
+            cached = ScheduleService._near_tasks(request, variables)
+            status = "NEAR"
+        if cached is None:
+            status = "MISS"
+        lookup.set(status=status)
+        cache_status.set(status)
+        if cached is None:
+            return None
+        return ScheduleService._build_response(request, *cached)
+
+    @staticmethod
+    def _cached_response(request: ScheduleRequest, cache_key, variables: Dict[str, str]):
+        if cache_key is None:
+            return None
+        with span("cache_lookup") as lookup:
+            return ScheduleService._serve_cached(request, variables, ScheduleService._cached_tasks(cache_key), lookup)
+
+    @staticmethod
+    async def _acached_response(request: ScheduleRequest, cache_key, variables: Dict[str, str]):
+        if cache_key is None:
+            return None
+        with span("cache_lookup") as lookup:
+            cached = await ScheduleService._acached_tasks(cache_key)
+            return ScheduleService._serve_cached(request, variables, cached, lookup)
+
+    @staticmethod
+    def _store_near(request: ScheduleRequest, variables: Dict[str, str], value: str) -> None:
+        threshold = settings.get_near_cache_threshold("schedule")
+        if near_cache is not None and threshold is not None:
+            near_cache.set(ScheduleService._near_scope(variables), request.prompt, value, threshold)
+
+    @staticmethod
+    def _store_result(
+            request: ScheduleRequest, variables: Dict[str, str], cache_key, structured_result: LLMResponse
+    ) -> None:
+        # 缓存模型给出的任务而不是排好的时间，命中缓存时按当前时间重新排程
+        if cache_key is None:
+            return
+        value = structured_result.model_dump_json()
+        response_cache.set(cache_key, value)
+        ScheduleService._store_near(request, variables, value)
+
+    @staticmethod
+    async def _astore_result(
+            request: ScheduleRequest, variables: Dict[str, str], cache_key, structured_result: LLMResponse
+    ) -> None:
+        """_store_result 的异步版本"""
+        if cache_key is None:
+            return
+        value = structured_result.model_dump_json()
+        await response_cache.aset(cache_key, value)
+        ScheduleService._store_near(request, variables, value)
+
+    @staticmethod
+    def _build_response(request: ScheduleRequest, structured_result: LLMResponse, usage) -> ScheduleResponse:
+        # 由本地排程引擎分配互不重叠的开始/结束时间
+        with span("plan", events=len(structured_result.events)):
+            events = SlotPlanner.from_settings().assign(structured_result.events)
+
+        # 创建ScheduleResponse对象（usage 来自上游返回的真实token用量）
+        return ScheduleResponse(
+            events=events,
+            request_id=request.request_id,
+            usage=Usage(**usage) if usage is not None else None,
+        )
+
+    @staticmethod
+    def process_schedule_request(request: ScheduleRequest, use_cache: bool = True) -> ScheduleResponse:
+        variables = ScheduleService._variables(request)
+        cache_key = ScheduleService._cache_key(ScheduleService._request_key(request, variables), use_cache)
+        cached = ScheduleService._cached_response(request, cache_key, variables)
+        if cached is not None:
+            return cached
+
         try:
-            # 创建DeepSeek提供者实例
-            provider = DeepSeekProvider()
-
-            # 构建提示模板
-            template = """
-            你是一个专业的日程规划AI助手，具有丰富的心理学和时间管理知识。你的任务是帮助用户制定切实可行、高效且个性化的日程安排。
-
-            ## 用户需求分析
-            用户描述：{user_prompt}
-
-            ## 你的任务
-            1. **深度分析用户需求**：理解用户的真实意图和目标
-            2. **可行性评估**：评估计划的现实性和可执行性
-            3. **智能优化建议**：基于时间管理最佳实践提供改进建议
-            4. **个性化调整**：考虑用户偏好和约束条件
-            5. **语言一致性**：使用与用户输入相同的语言回复
-            6. **日程规划**：根据用户需求和偏好，规划日程安排
-            7. **任务时长**: 评估当前用户想计划的事情，需要多长的时间才能完成，根据任务的难度和复杂度，以及用户的需求和偏好，给出合理的任务时长
-
-            ## 分析维度
-            - **时间合理性**：任务时长是否合理？是否需要休息时间？
-            - **优先级排序**：重要且紧急的任务是否优先安排？
-            - **精力管理**：是否考虑了人的精力曲线（上午精力充沛，下午相对较低）？
-            - **任务关联性**：相似类型的任务是否可以集中处理？
-            - **缓冲时间**：是否预留了应对突发情况的缓冲时间？
-            - **可持续性**：这个计划是否可持续执行？
-            - **任务数量**：任务数量是否合理？是否需要减少任务数量？
-            - **任务难度**：任务难度是否合理？是否需要降低难度？
-            - **任务细分化**：任务是否可以细分？是否需要细分？请不要把多个任务合并为一个任务，任务需要按照天数来规划到每天的任务
-            
-            ## 输出要求
-            请以JSON格式返回优化后的日程安排，包含以下字段：
-
-                {{
-                    "events": [
-                        {{
-                            "title": "事件标题（使用用户输入语言）",
-                            "description": "详细描述（包含优化建议和可行性说明）",
-                            "duration": 持续时间（分钟，考虑实际可行性）,
-                            "priority": "优先级（high/medium/low，基于重要性和紧急性）",
-                            "category": "类别（study/work/health/entertainment/personal等）",
-                            "suggested_time": "建议时间（morning/afternoon/evening，基于任务性质和精力曲线）"
-                        }}
-                    ]
-                }}
-            
-            ## 优化原则
-            1. **SMART原则**：确保每个任务都是具体、可衡量、可达成、相关、有时限的
-            2. **帕累托原则**：80%的成果来自20%的努力，优先安排高价值任务
-            3. **时间块管理**：将相似任务集中处理，减少切换成本
-            4. **精力匹配**：将需要高专注度的任务安排在精力充沛的时间段
-            5. **现实缓冲**：预留15-20%的缓冲时间应对意外情况
-            6. **渐进式安排**：避免过度安排，确保计划可持续执行
-
-            ## 注意事项
-            - 如果用户的需求明显不现实，请提供合理的调整建议
-            - 考虑用户的个人偏好和约束条件
-            - 使用与用户输入相同的语言
-            - 在描述中说明为什么这样安排以及如何提高执行效率
-            - 请不要把多个任务合并为一个任务，任务需要按照天数来规划到每天的任务
-            - 可以提出众多的Event，Event之间可以出现重复，但是需要保证每个Event的开始和结束时间不重叠
-            """
-
-            # 准备输入变量
-            variables = {
-                "user_prompt": request.prompt,
-            }
 
-            # 使用结构化输出调用AI服务
-            structured_result = provider.get_structured_response(
-                template=template,
-                input_variables=variables,
-                response_schema=LLMResponse,
-                temperature=0,
-                max_tokens=8192,
+            # 使用结构化输出调用AI服务（由注册表按延迟与错误率选择后端）
+            structured_result, _ = registry.call(
+                settings.schedule_model,
+                lambda provider: provider.get_structured_response(
+                    template=SCHEDULE_TEMPLATE,
+                    system_prompt=SCHEDULE_SYSTEM_PROMPT,
+                    input_variables=variables,
+                    response_schema=LLMResponse,
+                    temperature=0,
+                    max_tokens=settings.schedule_max_tokens,
+                ),
+            )
+
+            response = ScheduleService._build_response(
+                request, structured_result.parsed, structured_result.response_metadata.get("token_usage")
+            )
+            ScheduleService._store_result(request, variables, cache_key, structured_result.parsed)
+            return response
+
+        except UniAIException:
+            # 熔断(503)、超时(504)等错误原样返回
+            raise
+        except Exception as e:
+            # 注册表已按错误类型在截止时间内退避重试，仍失败时统一包装
+            raise ProviderException(
+                "schedule_service", f"Failed {e}"
+            )
+
+    @staticmethod
+    async def aprocess_schedule_request(request: ScheduleRequest, use_cache: bool = True) -> ScheduleResponse:
+        """process_schedule_request 的异步版本，等待上游时不占用线程"""
+        variables = ScheduleService._variables(request)
+        request_key = ScheduleService._request_key(request, variables)
+        cache_key = ScheduleService._cache_key(request_key, use_cache)
+        cached = await ScheduleService._acached_response(request, cache_key, variables)
+        if cached is not None:
+            return cached
+
+        async def fetch():
+            structured_result, _ = await registry.acall(
+                settings.schedule_model,
+                lambda provider: provider.aget_structured_response(
+                    template=SCHEDULE_TEMPLATE,
+                    system_prompt=SCHEDULE_SYSTEM_PROMPT,
+                    input_variables=variables,
+                    response_schema=LLMResponse,
+                    temperature=0,
+                    max_tokens=settings.schedule_max_tokens,
+                ),
+                kind="schedule",
+            )
+            await ScheduleService._astore_result(request, variables, cache_key, structured_result.parsed)
+            return structured_result.parsed, structured_result.response_metadata.get("token_usage")
+
+        try:
+            # 同一时刻相同的请求（包括其他 worker 中的）合并为一次上游调用
+            tasks, usage = await singleflight.do(
+                request_key if use_cache and settings.single_flight_enabled else None,
+                fetch,
+                recheck=(lambda: ScheduleService._acached_tasks(cache_key)) if cache_key is not None else None,
+                codec=ScheduleService._pair_codec(LLMResponse),
+            )
+            # 排程在每个请求中单独进行
+            return ScheduleService._build_response(request, tasks, usage)
+
+        except UniAIException:
+            # 熔断(503)、超时(504)等错误原样返回
+            raise
+        except Exception as e:
+            # 注册表已按错误类型在截止时间内退避重试，仍失败时统一包装
+            raise ProviderException(
+                "schedule_service", f"Failed {e}"
+            )
+
+    @staticmethod
+    async def arun_schedule_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+        """后台任务入口：payload 为 ScheduleRequest，返回 ScheduleResponse"""
+        request = ScheduleRequest.model_validate(payload)
+        return (await ScheduleService.aprocess_schedule_request(request)).model_dump()
+
+    @staticmethod
+    def _replan_context(events: List[Event], planner: SlotPlanner) -> str:
+        """当前日程的紧凑摘要：每行一个任务，省略描述以减少输入 token"""
+        lines = []
+        for index, event in enumerate(events):
+            slot = planner.slot_of(event)
+            if slot is None:
+                when = "未安排"
+            else:
+                day, start, end = slot
+                when = f"第{day}天 {start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}"
+            lines.append(
+                f"{index}. {event.title}｜{event.duration}分钟｜{when}｜{event.priority}｜{event.category}"
             )
+        return "\n".join(lines) or "（空）"
 
-            # 转换为Event对象列表
-            events = []
-            for event_data in structured_result.events:
-                event = Event(
-                    title=event_data.title,
-                    description=event_data.description,
-                    duration=event_data.duration,
-                    priority=event_data.priority,
-                    category=event_data.category,
-                    suggested_time=event_data.suggested_time,
-                    start_date=event_data.start_date,
-                    end_date=event_data.end_date,
-                )
-                events.append(event)
-
-            # 创建ScheduleResponse对象
-            return ScheduleResponse(events=events, request_id=request.request_id)
+    @staticmethod
+    def _apply_patch(
+            events: List[Event], patch: LLMPatch, planner: SlotPlanner
+    ) -> Tuple[List[Event], List[int], List[EventChange]]:
+        """把补丁应用到已有日程：未改动的任务保留原时间，只为改动和新增的任务排程"""
+        removed = sorted({index for index in patch.remove if 0 <= index < len(events)})
+        updates = {}
+        for update in patch.modify:
+            if not 0 <= update.id < len(events) or update.id in removed:
+                logger.warning(f"Ignoring replan update for unknown or removed task {update.id}")
+                continue
+            updates.setdefault(update.id, {}).update(update.model_dump(exclude_none=True, exclude={"id"}))
 
+        moved: List[Tuple[int, LLMTask]] = []
+        modified: List[EventChange] = []
+        for index, event in enumerate(events):
+            if index in removed:
+                continue
+            slot = planner.slot_of(event)
+            current = event.model_dump(include=set(LLMTask.model_fields))
+            current["day"] = slot[0] if slot is not None else 0
+            changed = {k: v for k, v in updates.get(index, {}).items() if current.get(k) != v}
+            if changed.keys() & TIMING_FIELDS or (changed and slot is None):
+                moved.append((index, LLMTask(**{**current, **changed})))
+                continue
+            # 时间不变的任务原样占住自己的时间段
+            planner.reserve(event)
+            if changed:
+                modified.append(EventChange(index=index, event=event.model_copy(update=changed)))
+
+        added: List[Event] = []
+        for index, task in moved:
+            # 修改后超过最长时间段的任务会拆成多段，第一段作为修改，其余作为新增
+            first, *rest = planner.replace(task, events[index])
+            modified.append(EventChange(index=index, event=first))
+            added.extend(rest)
+        added.extend(planner.assign(patch.add))
+        modified.sort(key=lambda change: change.index)
+        return added, removed, modified
+
+    @staticmethod
+    async def areplan_schedule_request(
+            request: ScheduleReplanRequest, use_cache: bool = True
+    ) -> ScheduleReplanResponse:
+        """增量重新规划：模型只看到日程摘要并返回补丁，输出 token 与改动大小成正比"""
+        events = request.schedule.events
+        planner = SlotPlanner.from_settings()
+        variables = {
+            "today": ScheduleService._today(),
+            "schedule": ScheduleService._replan_context(events, planner),
+            "change": request.change,
+        }
+        request_key = make_cache_key(
+            "schedule_replan", settings.schedule_model, REPLAN_SYSTEM_PROMPT, REPLAN_TEMPLATE,
+            variables["today"], variables["schedule"], request.change, 0, settings.schedule_replan_max_tokens
+        )
+        cache_key = ScheduleService._cache_key(request_key, use_cache)
+
+        async def cached_patch():
+            cached = await response_cache.aget(cache_key) if cache_key is not None else None
+            return (LLMPatch.model_validate_json(cached), None) if cached is not None else None
+
+        async def fetch():
+            structured_result, _ = await registry.acall(
+                settings.schedule_model,
+                lambda provider: provider.aget_structured_response(
+                    template=REPLAN_TEMPLATE,
+                    system_prompt=REPLAN_SYSTEM_PROMPT,
+                    input_variables=variables,
+                    response_schema=LLMPatch,
+                    temperature=0,
+                    max_tokens=settings.schedule_replan_max_tokens,
+                ),
+                kind="schedule",
+            )
+            if cache_key is not None:
+                await response_cache.aset(cache_key, structured_result.parsed.model_dump_json())
+            return structured_result.parsed, structured_result.response_metadata.get("token_usage")
+
+        cached = await cached_patch()
+        if cache_key is not None:
+            cache_status.set("HIT" if cached is not None else "MISS")
+
+        try:
+            patch, usage = cached or await singleflight.do(
+                request_key if use_cache and settings.single_flight_enabled else None,
+                fetch,
+                recheck=cached_patch if cache_key is not None else None,
+                codec=ScheduleService._pair_codec(LLMPatch),
+            )
+        except UniAIException:
+            # 熔断(503)、超时(504)等错误原样返回
+            raise
         except Exception as e:
-            # 如果所有重试都失败了
             raise ProviderException(
                 "schedule_service", f"Failed {e}"
             )
+
+        added, removed, modified = ScheduleService._apply_patch(events, patch, planner)
+        return ScheduleReplanResponse(
+            added=added,
+            removed=removed,
+            modified=modified,
+            request_id=request.request_id,
+            usage=Usage(**usage) if usage is not None else None,
+        )
+
+    @staticmethod
+    async def astream_schedule_request(request: ScheduleRequest) -> AsyncIterator[Dict[str, Any]]:
+        """流式日程规划：模型每生成一个完整且校验通过的任务就排程并立即产出
+
+        流式时任务按到达顺序排程（非流式接口会先按优先级和时长排序）。
+
+        依次产出 {"type": "event", ...} 记录，最后是 {"type": "done", ...}；
+        流开始后的错误以 {"type": "error", ...} 记录返回。
+        """
+        index = 0
+        try:
+            parser = JSONArrayItemParser()
+            # 流式输出时按到达顺序逐个排程
+            planner = SlotPlanner.from_settings()
+            variables = ScheduleService._variables(request)
+
+            # 经注册表路由：首个片段之前的临时性错误会重试并计入熔断
+            async for text, _ in registry.astream(
+                settings.schedule_model,
+                lambda provider: provider.astream_json(
+                    template=SCHEDULE_TEMPLATE,
+                    system_prompt=SCHEDULE_SYSTEM_PROMPT,
+                    input_variables=variables,
+                    temperature=0,
+                    max_tokens=settings.schedule_max_tokens,
+                ),
+            ):
+                for raw_event in parser.feed(text):
+                    try:
+                        with stage("parse"):
+                            task = LLMTask.model_validate_json(raw_event)
+                    except ValidationError as e:
+                        # 跳过不完整或不合法的Event，不中断整个流
+                        logger.warning(f"Skipping invalid streamed event: {e}")
+                        continue
+                    for event in planner.place(task):
+                        yield {"type": "event", "index": index, "event": event.model_dump()}
+                        index += 1
+
+            yield {
+                "type": "done",
+                "total_events": index,
+                "request_id": request.request_id,
+                "timestamp": get_current_timestamp(),
+            }
+
+        except Exception as e:
+            if isinstance(e, UniAIException):
+                code, message = e.code, e.message
+                logger.warning(f"schedule stream failed request_id={request.request_id}: {message}")
+            else:
+                code, message = 500, "Internal server error"
+                logger.error(f"schedule stream failed request_id={request.request_id}: {e}", exc_info=True)
+            yield {
+                "type": "error",
+                "code": code,
+                "message": message,
+                "request_id": request.request_id,
+                "timestamp": get_current_timestamp(),
+            }
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+from core.config import settings
+from core.exceptions import SessionNotFoundException
+from core.sessions import NEW_SESSION, ChatSession, session_store
+from models.response import SessionInfo, SessionTurn
+from providers.registry import registry
+from utils.tokens import MESSAGE_OVERHEAD_TOKENS
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Merge the existing summary with the new turns into one concise summary that keeps names, "
+    "facts, decisions and open questions the assistant will need later. "
+    "Write it in the language of the conversation and reply with the summary only."
+)
+
+
+class SessionService:
+    # Sessions with a summary in progress, and the tasks running them (kept referenced until done)
+    _summarizing: Set[Tuple[str, str]] = set()
+    _tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def open(request):
+        """The request itself, or with ``session_id: "new"`` a copy naming a newly created session"""
+        if session_store is None or request.session_id != NEW_SESSION:
+            return request
+        return request.model_copy(update={"session_id": session_store.create(request.user_info.user_id)})
+
+    @staticmethod
+    async def aopen(request):
+        """open() for async callers; shared sessions are created off the event loop"""
+        if session_store is None or request.session_id != NEW_SESSION:
+            return request
+        session_id = await session_store.run(session_store.create, request.user_info.user_id)
+        return request.model_copy(update={"session_id": session_id})
+
+    @staticmethod
+    def _history(request, session: Optional[ChatSession], budget: int) -> Tuple[List[Tuple[str, str]], int]:
+        if session is None:
+            # Never issued to this user, expired or deleted
+            raise SessionNotFoundException(request.session_id)
+        limit = settings.session_window_tokens + settings.session_summary_max_tokens + MESSAGE_OVERHEAD_TOKENS
+        return session.history(min(budget, limit))
+
+    @staticmethod
+    def history(request, budget: int) -> Tuple[List[Tuple[str, str]], int]:
+        """History messages for a session request and their estimated tokens
+
+        At most the session window plus the summary is sent, and never more
+        than ``budget``. Raises SessionNotFoundException for unknown sessions.
+        """
+        if session_store is None or not request.session_id:
+            return [], 0
+        session = session_store.get(request.user_info.user_id, request.session_id)
+        return SessionService._history(request, session, budget)
+
+    @staticmethod
+    async def ahistory(request, budget: int) -> Tuple[List[Tuple[str, str]], int]:
+        """history() for async callers; shared sessions are read off the event loop"""
+        if session_store is None or not request.session_id:
+            return [], 0
+        session = await session_store.run(session_store.get, request.user_info.user_id, request.session_id)
+        return SessionService._history(request, session, budget)
+
+    @staticmethod
+    def record_turn(request, reply: str) -> None:
+        """Add a finished turn to the request's session, summarizing what slid out of the window"""
+        if session_store is None or not request.session_id:
+            return
+        user_id = request.user_info.user_id
+        session = session_store.add_turn(user_id, request.session_id, request.parameters.prompt, reply)
+        SessionService._schedule_summary(request, session)
+
+    @staticmethod
+    async def arecord_turn(request, reply: str) -> None:
+        """record_turn() for async callers; shared sessions are written off the event loop"""
+        if session_store is None or not request.session_id:
+            return
+        session = await session_store.run(
+            session_store.add_turn, request.user_info.user_id, request.session_id, request.parameters.prompt, reply
+        )
+        SessionService._schedule_summary(request, session)
+
+    @staticmethod
+    def _schedule_summary(request, session: Optional[ChatSession]) -> None:
+        if session is None or not settings.session_summary or not session.pending:
+            return
+        key = (request.user_info.user_id, request.session_id)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Synchronous callers: the next async turn of the session picks it up
+            return
+        if key in SessionService._summarizing:
+            return
+        SessionService._summarizing.add(key)
+        task = loop.create_task(SessionService._summarize(
+            request.model, key, session.folded, [turn[:2] for turn in session.pending], session.summary
+        ))
+        SessionService._tasks.add(task)
+        task.add_done_callback(SessionService._tasks.discard)
+
+    @staticmethod
+    async def _summarize(model: str, key: Tuple[str, str], folded: int, pending: List[list], summary: str) -> None:
+        """Fold turns that left the window into the session summary, off the request path"""
+        lines = [f"Existing summary:\n{summary or '(none)'}", "New turns:"]
+        for user, assistant in pending:
+            lines.append(f"User: {user}\nAssistant: {assistant}")
+        try:
+            response_obj, _ = await registry.acall(
+                model,
+                lambda provider: provider.aget_response(
+                    "\n\n".join(lines),
+                    system_prompt=SUMMARY_SYSTEM_PROMPT,
+                    temperature=0,
+                    max_tokens=settings.session_summary_max_tokens,
+                ),
+                kind="summary",
+            )
+            if await session_store.run(session_store.fold, *key, folded, len(pending), response_obj.content.strip()):
+                session_store.stats["summaries"] += 1
+        except Exception as e:
+            # Turns stay pending (bounded) and are retried after the next turn
+            session_store.stats["summary_failures"] += 1
+            logger.warning(f"Session summary failed: {e}")
+        finally:
+            SessionService._summarizing.discard(key)
+
+    @staticmethod
+    async def get_info(session_id: str, user_id: str) -> SessionInfo:
+        session = await session_store.run(session_store.get, user_id, session_id) if session_store is not None else None
+        if session is None:
+            raise SessionNotFoundException(session_id)
+        return SessionInfo(
+            session_id=session_id,
+            turns=[SessionTurn(user=user, assistant=assistant) for user, assistant, _ in session.turns],
+            summary=session.summary or None,
+            earlier_turns=session.folded + len(session.pending),
+            window_tokens=session.window_tokens,
+            created_at=int(session.created_at),
+            updated_at=int(session.updated_at),
+        )
+
+    @staticmethod
+    async def delete(session_id: str, user_id: str) -> None:
+        if session_store is None or not await session_store.run(session_store.delete, user_id, session_id):
+            raise SessionNotFoundException(session_id)
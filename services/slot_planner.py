@@ -0,0 +1,200 @@
+"""本地日程排程引擎：把模型给出的任务分配到互不重叠的时间段"""
+import math
+from bisect import insort
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.config import settings
+from models.schedule import Event, LLMTask
+
+PRIORITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+# 精力曲线：需要高专注度的任务优先放在上午，轻松的任务优先放在晚上
+FOCUS_CATEGORIES = {"study", "work"}
+LIGHT_CATEGORIES = {"entertainment", "personal", "social", "leisure"}
+FOCUS_ORDER = ("morning", "afternoon", "evening")
+DEFAULT_ORDER = ("afternoon", "morning", "evening")
+LIGHT_ORDER = ("evening", "afternoon", "morning")
+
+
+def _parse_windows(windows: Dict[str, Iterable[str]]) -> Dict[str, Tuple[int, int]]:
+    """{"morning": ["08:00", "12:00"], ...} -> {"morning": (480, 720), ...}（距零点的分钟数）"""
+    parsed = {}
+    for name, (start, end) in windows.items():
+        start_h, start_m = (int(part) for part in start.split(":"))
+        end_h, end_m = (int(part) for part in end.split(":"))
+        parsed[name] = (start_h * 60 + start_m, end_h * 60 + end_m)
+    return parsed
+
+
+class SlotPlanner:
+    """贪心排程：按优先级、时长从大到小，把任务放进最早的可用时间段
+
+    每天按时间段（上午/下午/晚上）划分，任务优先放入建议时间段，其次按精力
+    曲线选择；每个任务之后预留 ``buffer_ratio`` 比例的缓冲时间。已占用区间按
+    天保存为有序列表，查找空位是一次线性扫描，保证结果互不重叠且可复现；
+    已占用区间只增不减，所以每个时间段记下放不下的最短时长，排满的时间段
+    不再重复扫描。
+    当天所有时间段都放不下的任务顺延到后一天，超过最长时间段的任务拆成多段，
+    时间段之间的间隙（如午休）不安排任务。
+    """
+
+    def __init__(
+            self,
+            now: datetime,
+            windows: Dict[str, Tuple[int, int]],
+            buffer_ratio: float = 0.15,
+            slot_minutes: int = 5,
+            max_days: int = 14,
+    ):
+        self.now = now
+        self.origin = datetime(now.year, now.month, now.day)
+        self.windows = dict(sorted(windows.items(), key=lambda item: item[1]))
+        self.buffer_ratio = buffer_ratio
+        self.slot_minutes = max(1, slot_minutes)
+        self.max_days = max(1, max_days)
+        self.max_block = max(hi - lo for lo, hi in self.windows.values())
+        # 第几天 -> 已占用的 [开始, 结束) 区间（分钟），按开始时间排序
+        self._busy: Dict[int, List[Tuple[int, int]]] = {}
+        # (第几天, lo, hi) -> 该范围内已确定放不下的最短时长
+        self._no_fit: Dict[Tuple[int, int, int], int] = {}
+
+    @classmethod
+    def from_settings(cls, now: Optional[datetime] = None) -> "SlotPlanner":
+        return cls(
+            now or datetime.now(),
+            _parse_windows(settings.schedule_time_windows),
+            settings.schedule_buffer_ratio,
+            settings.schedule_slot_minutes,
+            settings.schedule_max_days,
+        )
+
+    def _round_up(self, minutes: float) -> int:
+        return int(-(-minutes // self.slot_minutes) * self.slot_minutes)
+
+    def _window_order(self, task: LLMTask) -> List[str]:
+        """候选时间段：建议时间段优先，其次按精力曲线"""
+        if task.category in FOCUS_CATEGORIES or task.priority == "high":
+            curve = FOCUS_ORDER
+        elif task.category in LIGHT_CATEGORIES:
+            curve = LIGHT_ORDER
+        else:
+            curve = DEFAULT_ORDER
+        order = [task.suggested_time] if task.suggested_time in self.windows else []
+        order += [name for name in curve if name in self.windows and name not in order]
+        order += [name for name in self.windows if name not in order]
+        return order
+
+    def _find_slot(self, day: int, lo: int, hi: int, duration: int) -> Optional[int]:
+        """[lo, hi) 内能放下 duration 分钟的最早开始时间"""
+        key = (day, lo, hi)
+        if duration >= self._no_fit.get(key, math.inf):
+            return None
+        if day == 0:
+            # 今天只排当前时间之后
+            lo = max(lo, self.now.hour * 60 + self.now.minute)
+        start = self._round_up(lo)
+        for busy_start, busy_end in self._busy.get(day, ()):
+            if busy_end <= start:
+                continue
+            if start + duration <= busy_start:
+                break
+            start = self._round_up(busy_end)
+        if start + duration <= hi:
+            return start
+        self._no_fit[key] = duration
+        return None
+
+    def _window_of(self, minute: int) -> Optional[str]:
+        for name, (lo, hi) in self.windows.items():
+            if lo <= minute < hi:
+                return name
+        return None
+
+    def _book(self, task: LLMTask, day: int, start: int, duration: int, title: str) -> Event:
+        buffer = self._round_up(duration * self.buffer_ratio) if self.buffer_ratio > 0 else 0
+        insort(self._busy.setdefault(day, []), (start, start + duration + buffer))
+        begin = self.origin + timedelta(days=day, minutes=start)
+        return Event(
+            title=title,
+            description=task.description,
+            duration=duration,
+            priority=task.priority,
+            category=task.category,
+            suggested_time=self._window_of(start),
+            start_date=begin.isoformat(),
+            end_date=(begin + timedelta(minutes=duration)).isoformat(),
+        )
+
+    def slot_of(self, event: Event) -> Optional[Tuple[int, int, int]]:
+        """已排好的任务对应的 (第几天, 开始分钟, 结束分钟)；未安排或在今天之前时返回 None"""
+        if not event.start_date or not event.end_date:
+            return None
+        begin = datetime.fromisoformat(event.start_date)
+        end = datetime.fromisoformat(event.end_date)
+        day = (begin.date() - self.origin.date()).days
+        if day < 0:
+            return None
+        start = begin.hour * 60 + begin.minute
+        return day, start, start + int((end - begin).total_seconds() // 60)
+
+    def reserve(self, event: Event) -> None:
+        """把已有任务占用的时间段（含缓冲）标记为已占用，重新排程时保持不动"""
+        slot = self.slot_of(event)
+        if slot is not None:
+            day, start, end = slot
+            buffer = self._round_up((end - start) * self.buffer_ratio) if self.buffer_ratio > 0 else 0
+            insort(self._busy.setdefault(day, []), (start, end + buffer))
+
+    def replace(self, task: LLMTask, event: Event) -> List[Event]:
+        """放置修改过的任务：原开始时间仍放得下时保留，否则重新排程"""
+        slot = self.slot_of(event)
+        duration = max(self.slot_minutes, self._round_up(task.duration))
+        if slot is not None and slot[0] == task.day and task.suggested_time in (None, event.suggested_time):
+            day, start, _ = slot
+            window = self._window_of(start)
+            if window is not None and self._find_slot(day, start, self.windows[window][1], duration) == start:
+                return [self._book(task, day, start, duration, task.title)]
+        return self.place(task)
+
+    def _place_block(self, task: LLMTask, first_day: int, duration: int, title: str) -> Event:
+        order = self._window_order(task)
+        for day in range(first_day, first_day + self.max_days):
+            for name in order:
+                lo, hi = self.windows[name]
+                start = self._find_slot(day, lo, hi, duration)
+                if start is not None:
+                    return self._book(task, day, start, duration, title)
+        # 排程范围内没有空位：保留任务但不给出时间
+        return Event(
+            title=title,
+            description=task.description,
+            duration=duration,
+            priority=task.priority,
+            category=task.category,
+            suggested_time=task.suggested_time,
+        )
+
+    def place(self, task: LLMTask) -> List[Event]:
+        """按到达顺序放置一个任务（流式输出时使用）"""
+        duration = max(self.slot_minutes, self._round_up(task.duration))
+        first_day = max(0, task.day)
+        if duration <= self.max_block:
+            return [self._place_block(task, first_day, duration, task.title)]
+
+        parts = math.ceil(duration / self.max_block)
+        block = self._round_up(duration / parts)
+        events = []
+        for index in range(parts):
+            length = min(block, duration - block * index)
+            events.append(self._place_block(task, first_day, length, f"{task.title} ({index + 1}/{parts})"))
+        return events
+
+    def assign(self, tasks: Iterable[LLMTask]) -> List[Event]:
+        """先排重要、耗时长的任务，结果按开始时间排序（无法安排的放在最后）"""
+        ordered = sorted(
+            enumerate(tasks),
+            key=lambda item: (max(0, item[1].day), PRIORITY_RANK.get(item[1].priority, 1), -item[1].duration, item[0]),
+        )
+        events = [event for _, task in ordered for event in self.place(task)]
+        return sorted(events, key=lambda event: (event.start_date is None, event.start_date or ""))
@@ -0,0 +1,57 @@
+"""Startup warm-up: load providers, build pooled clients and compile templates before the first request"""
+import logging
+import time
+
+from core.config import settings
+from core.scenes import compile_template
+from models.request import Parameters
+from models.schedule import LLMPatch, LLMResponse
+from providers.registry import registry
+from services.schedule_service import (
+    REPLAN_SYSTEM_PROMPT,
+    REPLAN_TEMPLATE,
+    SCHEDULE_SYSTEM_PROMPT,
+    SCHEDULE_TEMPLATE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def warmup() -> float:
+    """Do the work the first requests would otherwise pay for; returns the seconds it took
+
+    Chat chains are built for every scene with the default sampling
+    parameters, and the schedule chains with the settings they run with.
+    A backend that cannot be set up (e.g. a missing API key) is logged and
+    skipped, so it fails on use as it would without warm-up.
+    """
+    started = time.perf_counter()
+    settings.scenes.precompile()
+    compile_template(SCHEDULE_TEMPLATE, SCHEDULE_SYSTEM_PROMPT)
+    compile_template(REPLAN_TEMPLATE, REPLAN_SYSTEM_PROMPT)
+
+    system_prompts = [None, *settings.prompts.values()]
+    temperature = Parameters.model_fields["temperature"].default
+    max_tokens = Parameters.model_fields["max_tokens"].default
+    schedule_chains = [
+        dict(template=SCHEDULE_TEMPLATE, response_schema=LLMResponse, temperature=0,
+             max_tokens=settings.schedule_max_tokens, system_prompt=SCHEDULE_SYSTEM_PROMPT),
+        dict(template=REPLAN_TEMPLATE, response_schema=LLMPatch, temperature=0,
+             max_tokens=settings.schedule_replan_max_tokens, system_prompt=REPLAN_SYSTEM_PROMPT),
+    ]
+
+    for model in settings.models | {settings.schedule_model}:
+        try:
+            registry.warmup(
+                model,
+                system_prompts=system_prompts if model in settings.models else (),
+                temperature=temperature,
+                max_tokens=max_tokens,
+                structured=schedule_chains if model == settings.schedule_model else (),
+            )
+        except Exception as e:
+            logger.warning(f"Warm-up of model '{model}' failed: {e}")
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Warm-up finished in {elapsed:.2f}s")
+    return elapsed
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from middleware.admission import PriorityLimiter, TokenBucket
+
+
+def test_token_bucket_starts_full_and_refills_per_second():
+    bucket = TokenBucket(per_minute=60)
+    start = bucket.updated
+    assert bucket.wait_time(60, start) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, start) == pytest.approx(1.0)
+    assert bucket.wait_time(1, start + 0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, start + 1.0) == 0.0
+
+
+def test_token_bucket_never_holds_more_than_a_minute():
+    bucket = TokenBucket(per_minute=60)
+    bucket.wait_time(1, bucket.updated + 3600)
+    assert bucket.tokens == 60
+
+
+def test_token_bucket_request_larger_than_the_bucket_waits_for_a_full_bucket():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(1000, bucket.updated) == 0.0
+    bucket.take(1000)
+    assert bucket.tokens == 0
+    assert bucket.wait_time(1000, bucket.updated) == pytest.approx(60.0)
+
+
+@pytest.mark.asyncio
+async def test_priority_limiter_admits_up_to_the_limit():
+    limiter = PriorityLimiter(limit=2, queue_size=10)
+    assert await limiter.acquire(1, timeout=1) is None
+    assert await limiter.acquire(1, timeout=1) is None
+    assert limiter.active == 2
+    assert await limiter.acquire(1, timeout=0.01) == "queue_timeout"
+    assert limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_priority_limiter_serves_lowest_priority_value_first():
+    limiter = PriorityLimiter(limit=1, queue_size=10)
+    await limiter.acquire(0, timeout=1)
+    order = []
+
+    async def waiter(priority, name):
+        assert await limiter.acquire(priority, timeout=1) is None
+        order.append(name)
+        limiter.release()
+
+    tasks = [asyncio.create_task(waiter(priority, name)) for priority, name in [(2, "batch"), (0, "admin"), (1, "user")]]
+    await asyncio.sleep(0)
+    assert limiter.queued == 3
+    limiter.release()
+    await asyncio.gather(*tasks)
+    assert order == ["admin", "user", "batch"]
+    assert limiter.active == 0
+
+
+@pytest.mark.asyncio
+async def test_priority_limiter_rejects_when_the_queue_is_full():
+    limiter = PriorityLimiter(limit=1, queue_size=1)
+    await limiter.acquire(0, timeout=1)
+    queued = asyncio.create_task(limiter.acquire(0, timeout=1))
+    await asyncio.sleep(0)
+    assert await limiter.acquire(0, timeout=1) == "queue_full"
+    limiter.release()
+    assert await queued is None
+    limiter.release()
+    assert limiter.active == 0
+
+
+@pytest.mark.asyncio
+async def test_priority_limiter_cancelled_waiter_gives_up_its_place():
+    limiter = PriorityLimiter(limit=1, queue_size=10)
+    await limiter.acquire(0, timeout=1)
+    cancelled = asyncio.create_task(limiter.acquire(0, timeout=1))
+    queued = asyncio.create_task(limiter.acquire(1, timeout=1))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    limiter.release()
+    assert await queued is None
+    assert limiter.active == 1
+    limiter.release()
+    assert limiter.active == 0
+
+
+@pytest.mark.asyncio
+async def test_priority_limiter_without_a_limit_admits_everything():
+    limiter = PriorityLimiter(limit=0, queue_size=0)
+    for _ in range(100):
+        assert await limiter.acquire(0, timeout=0) is None
+    assert limiter.active == 0
@@ -0,0 +1,121 @@
+import hashlib
+import hmac
+import socket
+
+import httpx
+import pytest
+
+from core.config import settings
+from core.exceptions import CallbackURLException
+from core.jobs import check_callback_url, pinned_request, sign_payload
+
+
+@pytest.fixture
+def resolve(monkeypatch):
+    """Make every host name resolve to the given addresses"""
+    def patch(*addresses):
+        def getaddrinfo(host, port, *args, **kwargs):
+            if not addresses:
+                raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+            return [
+                (socket.AF_INET6 if ":" in a else socket.AF_INET, socket.SOCK_STREAM, 6, "", (a, port))
+                for a in addresses
+            ]
+        monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    return patch
+
+
+@pytest.fixture(autouse=True)
+def no_allowed_hosts(monkeypatch):
+    monkeypatch.setattr(settings, "job_webhook_allowed_hosts", [])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("url", ["ftp://example.com/hook", "file:///etc/passwd", "https:///hook", "hook"])
+async def test_rejects_non_http_urls(url):
+    with pytest.raises(CallbackURLException):
+        await check_callback_url(url)
+
+
+@pytest.mark.asyncio
+async def test_rejects_invalid_port():
+    with pytest.raises(CallbackURLException, match="invalid port"):
+        await check_callback_url("https://example.com:99999/hook")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("address", [
+    "127.0.0.1", "10.0.0.5", "172.16.3.4", "192.168.1.1", "169.254.169.254", "0.0.0.0",
+    "::1", "fe80::1%eth0", "fc00::1", "::ffff:127.0.0.1", "224.0.0.1",
+])
+async def test_rejects_non_public_addresses(resolve, address):
+    resolve(address)
+    with pytest.raises(CallbackURLException, match="non-public"):
+        await check_callback_url("https://hooks.example.com/done")
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_any_address_is_internal(resolve):
+    resolve("93.184.216.34", "10.0.0.1")
+    with pytest.raises(CallbackURLException):
+        await check_callback_url("https://hooks.example.com/done")
+
+
+@pytest.mark.asyncio
+async def test_rejects_unresolvable_host(resolve):
+    resolve()
+    with pytest.raises(CallbackURLException, match="cannot be resolved"):
+        await check_callback_url("https://hooks.example.com/done")
+
+
+@pytest.mark.asyncio
+async def test_public_host_returns_the_checked_address(resolve):
+    resolve("93.184.216.34", "2606:2800:220:1::1")
+    assert await check_callback_url("https://hooks.example.com/done") == "93.184.216.34"
+
+
+@pytest.mark.asyncio
+async def test_ip_literal_is_checked_without_dns():
+    with pytest.raises(CallbackURLException):
+        await check_callback_url("http://127.0.0.1:8000/hook")
+    assert await check_callback_url("http://93.184.216.34/hook") == "93.184.216.34"
+
+
+@pytest.mark.asyncio
+async def test_allowed_host_name_is_resolved_as_usual(monkeypatch, resolve):
+    resolve("10.0.0.5")
+    monkeypatch.setattr(settings, "job_webhook_allowed_hosts", ["Internal.Example.com"])
+    assert await check_callback_url("http://internal.example.com/hook") is None
+
+
+@pytest.mark.asyncio
+async def test_allowed_network_admits_its_addresses(monkeypatch, resolve):
+    resolve("10.0.0.5")
+    monkeypatch.setattr(settings, "job_webhook_allowed_hosts", ["10.0.0.0/24"])
+    assert await check_callback_url("http://hooks.internal/hook") == "10.0.0.5"
+    resolve("10.0.1.5")
+    with pytest.raises(CallbackURLException):
+        await check_callback_url("http://hooks.internal/hook")
+
+
+def test_pinned_request_connects_to_the_address_but_keeps_the_host():
+    client = httpx.AsyncClient()
+    request = pinned_request(client, "https://hooks.example.com:8443/done?x=1", "93.184.216.34", b"{}", {})
+    assert request.url == "https://93.184.216.34:8443/done?x=1"
+    assert request.headers["host"] == "hooks.example.com:8443"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+
+    unpinned = pinned_request(client, "https://hooks.example.com/done", None, b"{}", {})
+    assert unpinned.url == "https://hooks.example.com/done"
+    assert "sni_hostname" not in unpinned.extensions
+
+
+def test_pinned_request_brackets_ipv6_addresses():
+    request = pinned_request(httpx.AsyncClient(), "https://hooks.example.com/done", "2606:2800:220:1::1", b"{}", {})
+    assert request.url.host == "2606:2800:220:1::1"
+    assert str(request.url).startswith("https://[2606:2800:220:1::1]/")
+
+
+def test_sign_payload():
+    expected = hmac.new(b"secret", b'{"ok":true}', hashlib.sha256).hexdigest()
+    assert sign_payload(b'{"ok":true}', "secret") == f"sha256={expected}"
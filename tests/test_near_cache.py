@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from core.near_cache import NearDuplicateCache, features, normalize, prefix_length
+
+SCOPE = "deepseek-chat|study|0.7"
+PROMPT = "帮我制定一个本周的英语学习计划，每天学习2小时，重点是听力和口语"
+
+
+@pytest.fixture
+def cache():
+    return NearDuplicateCache(max_entries=100, max_bytes=1 << 20, ttl=60)
+
+
+def test_normalize_drops_case_spacing_and_punctuation():
+    assert normalize("Plan  my WEEK, please!") == "planmyweekplease"
+    assert normalize("学习，２小时。") == "学习2小时"
+
+
+def test_prefix_length_guarantees_overlap():
+    assert prefix_length(10, 1.0) == 1
+    assert prefix_length(10, 0.9) == 2
+    assert prefix_length(10, 0.5) == 6
+    assert features("abcd") == sorted(features("abcd"))
+    assert len(features("ab")) == 1
+
+
+def test_exact_and_reformatted_prompts_hit(cache):
+    cache.set(SCOPE, PROMPT, "plan", 0.9)
+    assert cache.get(SCOPE, PROMPT, 0.9) == "plan"
+    assert cache.get(SCOPE, "帮我制定一个本周的英语学习计划 每天学习2小时 重点是听力和口语。", 0.9) == "plan"
+    assert cache.stats["exact_hits"] == 2
+
+
+def test_similar_prompt_hits(cache):
+    cache.set(SCOPE, PROMPT, "plan", 0.8)
+    assert cache.get(SCOPE, PROMPT + "吧", 0.8) == "plan"
+    assert cache.stats["hits"] == 1
+
+
+def test_different_prompt_misses(cache):
+    cache.set(SCOPE, PROMPT, "plan", 0.8)
+    assert cache.get(SCOPE, "帮我写一封给房东的邮件，说明下个月要搬家", 0.8) is None
+    assert cache.stats["misses"] == 1
+
+
+def test_numbers_must_match(cache):
+    cache.set(SCOPE, PROMPT, "plan", 0.5)
+    assert cache.get(SCOPE, PROMPT.replace("2小时", "3小时"), 0.5) is None
+    assert cache.get(SCOPE, PROMPT.replace("2小时", "两小时"), 0.5) is None
+
+
+def test_scopes_are_separate(cache):
+    cache.set(SCOPE, PROMPT, "plan", 0.8)
+    assert cache.get("deepseek-chat|work|0.7", PROMPT, 0.8) is None
+
+
+def test_most_similar_entry_wins(cache):
+    cache.set(SCOPE, PROMPT + "以及阅读", "further", 0.6)
+    cache.set(SCOPE, PROMPT + "和阅读", "closer", 0.6)
+    assert cache.get(SCOPE, PROMPT + "和阅读吧", 0.6) == "closer"
+
+
+def test_evicted_entries_leave_the_index():
+    cache = NearDuplicateCache(max_entries=2, max_bytes=1 << 20, ttl=60)
+    for i in range(5):
+        cache.set(SCOPE, f"{PROMPT} 第{'一二三四五'[i]}版", str(i), 0.8)
+    assert cache.info()["entries"] == 2
+    indexed = set().union(*cache._index.values())
+    assert indexed == set(cache._features) and len(indexed) == 2
+
+
+def test_byte_budget_is_enforced():
+    cache = NearDuplicateCache(max_entries=100, max_bytes=2000, ttl=60)
+    for i in range(20):
+        cache.set(SCOPE, f"prompt number {'abcdefghijklmnopqrst'[i] * 3}", "x" * 200, 0.8)
+    assert cache.info()["bytes"] <= 2000
+    cache.set(SCOPE, PROMPT, "x" * 5000, 0.8)
+    assert cache.get(SCOPE, PROMPT, 0.8) is None
+
+
+def test_entries_expire():
+    cache = NearDuplicateCache(max_entries=10, max_bytes=1 << 20, ttl=0.05)
+    cache.set(SCOPE, PROMPT, "plan", 0.8)
+    time.sleep(0.06)
+    assert cache.get(SCOPE, PROMPT, 0.8) is None
+
+
+def test_clear(cache):
+    cache.set(SCOPE, PROMPT, "plan", 0.8)
+    cache.clear()
+    assert cache.get(SCOPE, PROMPT, 0.8) is None
+    assert cache.info()["index_keys"] == 0
@@ -0,0 +1,98 @@
+import httpx
+import pytest
+
+from core.config import settings
+from core.exceptions import CircuitOpenException
+from providers.registry import Backend, ProviderRegistry
+from providers.resilience import CircuitBreaker
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(settings, "retry_base_delay", 0.001)
+    registry = ProviderRegistry()
+    registry._backends = {"m": [Backend(name="a", provider="stub", model="m"), Backend(name="b", provider="stub", model="m")]}
+    for backend in registry.backends("m"):
+        backend.provider = object()
+    return registry
+
+
+def stream(*steps):
+    """Provider operation yielding the given items, raising any exception among them"""
+    calls = []
+
+    def operation(provider):
+        async def generate():
+            calls.append(provider)
+            for step in steps[len(calls) - 1]:
+                if isinstance(step, Exception):
+                    raise step
+                yield step
+        return generate()
+    return operation, calls
+
+
+async def collect(registry, operation):
+    return [(item, backend.name) async for item, backend in registry.astream("m", operation)]
+
+
+@pytest.mark.asyncio
+async def test_astream_retries_transient_failures_before_the_first_item(registry):
+    operation, calls = stream([httpx.ConnectError("refused")], [1, 2])
+    items = await collect(registry, operation)
+    assert [item for item, _ in items] == [1, 2]
+    assert len(calls) == 2
+    failed, served = sorted(registry.backends("m"), key=lambda b: b.errors, reverse=True)
+    assert failed.errors == 1 and failed.breaker.failures == 1
+    assert {name for _, name in items} == {served.name}
+
+
+@pytest.mark.asyncio
+async def test_astream_does_not_retry_after_the_first_item(registry):
+    operation, calls = stream([1, httpx.ReadError("reset")], [1, 2])
+    with pytest.raises(httpx.ReadError):
+        await collect(registry, operation)
+    assert len(calls) == 1
+    assert sum(b.errors for b in registry.backends("m")) == 1
+
+
+@pytest.mark.asyncio
+async def test_astream_does_not_retry_request_errors(registry):
+    operation, calls = stream([KeyError("bad request")], [1])
+    with pytest.raises(KeyError):
+        await collect(registry, operation)
+    assert len(calls) == 1
+    assert all(b.breaker.failures == 0 for b in registry.backends("m"))
+
+
+@pytest.mark.asyncio
+async def test_astream_records_success(registry):
+    operation, _ = stream([])
+    assert await collect(registry, operation) == []
+    assert sum(b.requests for b in registry.backends("m")) == 1
+    assert sum(b.errors for b in registry.backends("m")) == 0
+
+
+@pytest.mark.asyncio
+async def test_astream_closed_early_releases_the_half_open_probe(registry):
+    for backend in registry.backends("m"):
+        backend.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        backend.breaker.record(False)
+    operation, _ = stream([1, 2])
+    items = registry.astream("m", operation)
+    _, backend = await items.__anext__()
+    assert backend.breaker.state == CircuitBreaker.HALF_OPEN
+    await items.aclose()
+    assert backend.breaker.state == CircuitBreaker.HALF_OPEN
+    assert backend.breaker.available()
+
+
+@pytest.mark.asyncio
+async def test_astream_fails_fast_when_every_circuit_is_open(registry):
+    for backend in registry.backends("m"):
+        backend.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        backend.breaker.record(False)
+    operation, calls = stream([1])
+    with pytest.raises(CircuitOpenException):
+        await collect(registry, operation)
+    assert calls == []
@@ -0,0 +1,119 @@
+import time
+
+import httpx
+import pytest
+
+from core.exceptions import ProviderException
+from providers.registry import Backend
+from providers.resilience import FATAL, INVALID_OUTPUT, TRANSIENT, CircuitBreaker, Deadline, classify_error
+
+
+def open_breaker(reset_timeout=0.05):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record(False)
+    breaker.record(False)
+    return breaker
+
+
+def half_open_breaker():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.available()
+    breaker.acquire()
+    return breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(True)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.available()
+    assert breaker.info() == {"state": "open", "consecutive_failures": 3, "times_opened": 1}
+
+
+def test_only_one_probe_per_reset_timeout():
+    breaker = half_open_breaker()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.available()
+
+
+def test_probe_success_closes():
+    breaker = half_open_breaker()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_probe_failure_reopens():
+    breaker = half_open_breaker()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+    assert not breaker.available()
+
+
+def test_release_frees_the_probe_without_a_verdict():
+    breaker = half_open_breaker()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.failures == 2
+    assert breaker.available()
+
+
+def test_release_leaves_closed_and_open_circuits_alone():
+    closed = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    closed.record(False)
+    closed.release()
+    assert closed.info() == {"state": "closed", "consecutive_failures": 1, "times_opened": 0}
+
+    opened = open_breaker(reset_timeout=60)
+    opened.release()
+    assert opened.state == CircuitBreaker.OPEN
+    assert not opened.available()
+
+
+def test_backend_failures_not_caused_by_the_upstream_leave_the_circuit_alone():
+    backend = Backend(name="b", provider="stub", model="m")
+    backend.breaker = half_open_breaker()
+    backend.record(None, ok=False, healthy=True)
+    assert backend.breaker.state == CircuitBreaker.HALF_OPEN
+    assert backend.breaker.failures == 2
+    assert backend.errors == 1
+
+    backend.breaker.acquire()
+    backend.record(None, ok=False, healthy=False)
+    assert backend.breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.parametrize("error, kind", [
+    (httpx.ConnectError("refused"), TRANSIENT),
+    (httpx.ReadTimeout("slow"), TRANSIENT),
+    (ValueError("not json"), INVALID_OUTPUT),
+    (KeyError("x"), FATAL),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+def test_classify_error_looks_through_the_provider_wrapper():
+    try:
+        try:
+            raise httpx.ConnectError("refused")
+        except httpx.ConnectError as e:
+            raise ProviderException("deepseek", "Connection error") from e
+    except ProviderException as wrapped:
+        assert classify_error(wrapped) == TRANSIENT
+
+
+def test_deadline():
+    assert not Deadline(60).expired
+    assert 59 < Deadline(60).remaining() <= 60
+    assert Deadline(0).expired
+    assert Deadline(0).remaining() == 0.0
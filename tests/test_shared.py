@@ -0,0 +1,120 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from core import shared
+from core.shared import SharedState
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(shared.time, "time", clock.time)
+    return clock
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "shared.db")
+
+
+@pytest.fixture
+def state(path):
+    state = SharedState(path)
+    yield state
+    state.close()
+
+
+def test_take_tokens_charges_every_bucket(state, clock):
+    assert state.take_tokens([("user:a:requests", 2, 1), ("role:user:requests", 10, 1)]) == 0
+    assert state.take_tokens([("user:a:requests", 2, 1), ("role:user:requests", 10, 1)]) == 0
+    # The user bucket is empty: one more request fits in 30 s at 2 per minute
+    assert state.take_tokens([("user:a:requests", 2, 1), ("role:user:requests", 10, 1)]) == pytest.approx(30.0)
+
+
+def test_take_tokens_charges_nothing_when_any_bucket_is_short(state, clock):
+    assert state.take_tokens([("user:a:tokens", 100, 100)]) == 0
+    assert state.take_tokens([("role:user:tokens", 1000, 10), ("user:a:tokens", 100, 10)]) > 0
+    # The role bucket was not charged by the refused request
+    assert state.take_tokens([("role:user:tokens", 1000, 1000)]) == 0
+
+
+def test_take_tokens_refills_over_time(state, clock):
+    assert state.take_tokens([("k", 60, 60)]) == 0
+    assert state.take_tokens([("k", 60, 10)]) == pytest.approx(10.0)
+    clock.now += 10
+    assert state.take_tokens([("k", 60, 10)]) == 0
+    clock.now += 3600
+    assert state.take_tokens([("k", 60, 60)]) == 0
+
+
+def test_take_tokens_caps_oversized_charges_at_the_budget(state, clock):
+    assert state.take_tokens([("k", 60, 500)]) == 0
+    assert state.take_tokens([("k", 60, 500)]) == pytest.approx(60.0)
+
+
+def test_buckets_are_shared_between_workers(path, clock):
+    first, second = SharedState(path), SharedState(path)
+    try:
+        assert first.take_tokens([("user:a:requests", 1, 1)]) == 0
+        assert second.take_tokens([("user:a:requests", 1, 1)]) == pytest.approx(60.0)
+    finally:
+        first.close()
+        second.close()
+
+
+def test_locked_state_fails_within_the_busy_timeout(path, monkeypatch):
+    monkeypatch.setattr(shared.settings, "shared_state_busy_timeout", 0.05)
+    state = SharedState(path)
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            state.take_tokens([("k", 60, 1)])
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    assert state.take_tokens([("k", 60, 1)]) == 0
+    state.close()
+
+
+def test_leases_have_one_owner_until_released_or_expired(path, clock):
+    first, second = SharedState(path), SharedState(path)
+    try:
+        assert first.acquire_lease("call", ttl=30)
+        assert first.acquire_lease("call", ttl=30)
+        assert not second.acquire_lease("call", ttl=30)
+        assert second.lease_held("call")
+
+        second.release_lease("call")
+        assert first.lease_held("call")
+        first.release_lease("call")
+        assert second.acquire_lease("call", ttl=30)
+
+        clock.now += 31
+        assert not first.lease_held("call")
+        assert first.acquire_lease("call", ttl=30)
+    finally:
+        first.close()
+        second.close()
+
+
+def test_published_results_expire(state, clock):
+    state.publish_result("call", '{"ok": true}', ttl=5)
+    assert state.get_result("call") == '{"ok": true}'
+    clock.now += 6
+    assert state.get_result("call") is None
+
+
+@pytest.mark.asyncio
+async def test_run_returns_results_from_the_worker_thread(state):
+    assert await asyncio.gather(*(state.run(state.take_tokens, [("k", 600, 1)]) for _ in range(5))) == [0] * 5
@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from models.schedule import LLMTask
+from services.slot_planner import SlotPlanner, _parse_windows
+
+WINDOWS = _parse_windows({"morning": ["08:00", "12:00"], "afternoon": ["14:00", "18:00"], "evening": ["19:00", "22:00"]})
+NOW = datetime(2026, 1, 5, 7, 0)
+
+
+def task(title, duration, priority="medium", category="work", suggested_time=None, day=0):
+    return LLMTask(
+        title=title,
+        description="",
+        duration=duration,
+        priority=priority,
+        category=category,
+        suggested_time=suggested_time,
+        day=day,
+    )
+
+
+def planner(now=NOW, buffer_ratio=0.0):
+    return SlotPlanner(now, WINDOWS, buffer_ratio=buffer_ratio, slot_minutes=5, max_days=3)
+
+
+def spans(events):
+    return [(event.start_date, event.end_date) for event in events]
+
+
+def test_parse_windows():
+    assert WINDOWS == {"morning": (480, 720), "afternoon": (840, 1080), "evening": (1140, 1320)}
+
+
+def test_tasks_never_overlap_and_respect_the_buffer():
+    events = planner(buffer_ratio=0.25).assign([task(f"t{i}", 60) for i in range(10)])
+    assert all(event.start_date for event in events)
+    booked = sorted((datetime.fromisoformat(e.start_date), datetime.fromisoformat(e.end_date)) for e in events)
+    for (_, end), (next_start, _) in zip(booked, booked[1:]):
+        assert (next_start - end).total_seconds() >= 15 * 60
+
+
+def test_suggested_time_and_energy_curve():
+    p = planner()
+    focus, = p.place(task("focus", 60, category="study"))
+    light, = p.place(task("light", 60, category="entertainment"))
+    suggested, = p.place(task("suggested", 60, category="study", suggested_time="afternoon"))
+    assert focus.start_date == "2026-01-05T08:00:00"
+    assert light.start_date == "2026-01-05T19:00:00"
+    assert suggested.start_date == "2026-01-05T14:00:00"
+    assert suggested.suggested_time == "afternoon"
+
+
+def test_today_starts_after_the_current_time():
+    event, = planner(now=datetime(2026, 1, 5, 9, 7)).place(task("late", 30))
+    assert event.start_date == "2026-01-05T09:10:00"
+
+
+def test_full_day_rolls_over_to_the_next_day():
+    p = planner(now=datetime(2026, 1, 5, 21, 30))
+    event, = p.place(task("tomorrow", 60))
+    assert event.start_date == "2026-01-06T08:00:00"
+
+
+def test_task_longer_than_any_window_is_split():
+    events = planner().place(task("long", 360, category="study"))
+    assert [event.title for event in events] == ["long (1/2)", "long (2/2)"]
+    assert [event.duration for event in events] == [180, 180]
+    assert spans(events) == [
+        ("2026-01-05T08:00:00", "2026-01-05T11:00:00"),
+        ("2026-01-05T14:00:00", "2026-01-05T17:00:00"),
+    ]
+
+
+def test_assign_places_high_priority_first_and_sorts_by_start():
+    events = planner().assign([
+        task("low", 60, priority="low", suggested_time="morning"),
+        task("high", 60, priority="high", suggested_time="morning"),
+    ])
+    assert [event.title for event in events] == ["high", "low"]
+    assert spans(events) == [
+        ("2026-01-05T08:00:00", "2026-01-05T09:00:00"),
+        ("2026-01-05T09:00:00", "2026-01-05T10:00:00"),
+    ]
+
+
+def test_assign_is_deterministic():
+    tasks = [task(f"t{i}", 25 + 10 * i, priority=("high", "medium", "low")[i % 3]) for i in range(12)]
+    assert spans(planner().assign(tasks)) == spans(planner().assign(tasks))
+
+
+def test_task_that_does_not_fit_in_the_horizon_stays_unscheduled():
+    p = planner()
+    for _ in range(3):
+        for window in ("morning", "afternoon", "evening"):
+            p.place(task("filler", 240 if window != "evening" else 180, suggested_time=window))
+    event, = p.place(task("extra", 30))
+    assert event.start_date is None and event.end_date is None
+    assert event.duration == 30
+
+
+def test_reserved_events_keep_their_slot():
+    p = planner()
+    existing, = planner().place(task("existing", 60, category="study"))
+    p.reserve(existing)
+    moved, = p.place(task("new", 60, category="study"))
+    assert moved.start_date == "2026-01-05T09:00:00"
+
+
+def test_replace_keeps_the_start_when_it_still_fits():
+    p = planner()
+    original, = p.place(task("meeting", 60, category="study"))
+    kept, = planner().replace(task("meeting", 90, category="study"), original)
+    assert kept.start_date == original.start_date
+    assert kept.duration == 90
@@ -0,0 +1,53 @@
+import json
+
+from utils.streaming import JSONArrayItemParser, format_ndjson, format_sse
+
+DOCUMENT = json.dumps({
+    "events": [
+        {"title": "Read", "description": "Chapter {3} and \"notes\"", "tags": ["a", "b"]},
+        {"title": "Run", "description": "Park\\", "meta": {"nested": {"x": 1}}},
+    ]
+}, ensure_ascii=False)
+
+
+def items(chunks):
+    parser = JSONArrayItemParser()
+    return [item for chunk in chunks for item in parser.feed(chunk)]
+
+
+def test_whole_document_yields_each_item():
+    assert [json.loads(item) for item in items([DOCUMENT])] == json.loads(DOCUMENT)["events"]
+
+
+def test_items_are_the_same_for_any_chunking():
+    expected = items([DOCUMENT])
+    for size in (1, 2, 3, 7, 64):
+        chunks = [DOCUMENT[i:i + size] for i in range(0, len(DOCUMENT), size)]
+        assert items(chunks) == expected
+
+
+def test_item_is_yielded_as_soon_as_it_closes():
+    parser = JSONArrayItemParser()
+    assert list(parser.feed('{"events": [{"title": "a"}')) == ['{"title": "a"}']
+    assert list(parser.feed(', {"title": "b"')) == []
+    assert list(parser.feed('}]}')) == ['{"title": "b"}']
+
+
+def test_braces_inside_strings_are_ignored():
+    document = '{"events": [{"title": "}]{", "description": "\\"}"}]}'
+    assert [json.loads(item) for item in items([document])] == [{"title": "}]{", "description": "\"}"}]
+
+
+def test_objects_outside_top_level_arrays_are_not_items():
+    document = '{"meta": {"a": 1}, "events": [{"x": [{"y": 1}]}], "other": [1, 2]}'
+    assert items([document]) == ['{"x": [{"y": 1}]}']
+
+
+def test_truncated_item_is_not_yielded():
+    assert items(['{"events": [{"title": "a"}, {"title": "b"']) == ['{"title": "a"}']
+
+
+def test_frame_formatting():
+    assert format_sse({"a": 1}) == 'data: {"a":1}\n\n'
+    assert format_sse("[DONE]", event="done") == "event: done\ndata: [DONE]\n\n"
+    assert format_ndjson({"a": 1}) == '{"a":1}\n'
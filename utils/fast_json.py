@@ -0,0 +1,47 @@
+"""JSON encoding and decoding for streamed frames, hand-built responses and request sniffing
+
+Uses orjson when it is installed and the standard library otherwise; both
+produce the same compact UTF-8 output. Pydantic models are not handled
+here: pydantic-core already serializes them to JSON natively.
+"""
+import json
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: roughly 5-10x faster on SSE / NDJSON frames
+    orjson = None
+
+
+def dumps_bytes(payload: Any) -> bytes:
+    """Encode JSON-compatible data as compact UTF-8 bytes (non-ASCII kept as is)"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(payload: Any) -> str:
+    """Encode JSON-compatible data as a compact string"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode("utf-8")
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode JSON; raises ValueError on invalid input"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encoder_name() -> str:
+    return "orjson" if orjson is not None else "json"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with ``dumps_bytes``"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
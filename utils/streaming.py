@@ -0,0 +1,62 @@
+"""Streaming response helpers"""
+from typing import Any, Iterator, Optional
+
+from utils.fast_json import dumps
+
+
+def format_sse(payload: Any, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events frame"""
+    data = payload if isinstance(payload, str) else dumps(payload)
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n"
+
+
+def format_ndjson(payload: Any) -> str:
+    """Format one newline-delimited JSON record"""
+    return dumps(payload) + "\n"
+
+
+class JSONArrayItemParser:
+    """Incrementally extract complete objects from a streamed JSON document.
+
+    Feed text chunks as they arrive; every object that sits directly inside an
+    array of the top-level object (e.g. each item of ``{"events": [...]}``) is
+    returned as a raw JSON string as soon as its closing brace is seen.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._item_start = None
+        self._position = 0
+
+    def feed(self, text: str) -> Iterator[str]:
+        for char in text:
+            self._buffer.append(char)
+            self._position += 1
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._stack == ["{", "["]:
+                    self._item_start = self._position - 1
+                self._stack.append(char)
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                if char == "}" and self._stack == ["{", "["] and self._item_start is not None:
+                    yield "".join(self._buffer[self._item_start:self._position])
+                    self._item_start = None
+                    # Nothing before the next item is needed any more
+                    self._buffer = []
+                    self._position = 0
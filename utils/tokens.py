@@ -0,0 +1,61 @@
+"""Local token estimation, used before a request reaches the upstream"""
+import math
+import re
+from functools import lru_cache
+from typing import Optional
+
+from core.config import settings
+
+# DeepSeek's rule of thumb: ~0.6 tokens per CJK character, ~0.3 per other character
+_WIDE_CHARS = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+WIDE_CHAR_TOKENS = 0.6
+NARROW_CHAR_TOKENS = 0.3
+
+# Role markers and separators added around every chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if settings.token_estimator != "tiktoken":
+        return None
+    try:
+        import tiktoken
+    except ImportError:  # optional: only used when TOKEN_ESTIMATOR=tiktoken
+        return None
+    try:
+        return tiktoken.get_encoding(settings.tiktoken_encoding)
+    except Exception:
+        # The BPE file may not be downloadable (e.g. offline); use the heuristic
+        return None
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimate the number of tokens in text"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    wide = len(_WIDE_CHARS.findall(text))
+    return math.ceil(wide * WIDE_CHAR_TOKENS + (len(text) - wide) * NARROW_CHAR_TOKENS)
+
+
+def estimate_chat_tokens(prompt: str, system_prompt: Optional[str] = None) -> int:
+    """Estimate the prompt tokens of a system + user message pair"""
+    tokens = estimate_tokens(prompt) + MESSAGE_OVERHEAD_TOKENS
+    if system_prompt:
+        tokens += estimate_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+    return tokens
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Drop the start of text until it fits in max_tokens, keeping the most recent part"""
+    if max_tokens <= 0:
+        return ""
+    tokens = estimate_tokens(text)
+    while tokens > max_tokens and text:
+        keep = max(0, int(len(text) * max_tokens / tokens * 0.95))
+        text = text[len(text) - keep:] if keep else ""
+        tokens = estimate_tokens(text)
+    return text